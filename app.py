@@ -4,13 +4,28 @@ import json
 import logging
 import os
 import re
+import signal
 import subprocess as sp
+import threading
 
+from flask import Blueprint
 from flask import Flask
 
+from helpers.auth_controller import AuthTokenController
 from helpers.auth_provider import auth_provider
+from helpers.auth_provider import token_auth_provider
 from s3repo.model import S3AsyncModel
+from s3repo.admission import UploadAdmission
+from s3repo.controller import PromoteController
+from s3repo.controller import PruneController
 from s3repo.controller import S3Controller
+from s3repo.controller import SearchController
+from s3repo.repoindex import RepoIndex
+from s3repo.service import HealthController
+from s3repo.service import PopularityController
+from s3repo.service import StaleReposController
+from s3repo.service import SyncBatchController
+from s3repo.service import SyncStatusController
 from s3repo.view import S3View
 
 
@@ -81,6 +96,8 @@ def update_cfg_by_env(cfg):
     env_model_settings['access_key_id'] = os.getenv('S3_ACCESS_KEY')
     env_model_settings['secret_access_key'] = os.getenv('S3_SECRET_KEY')
     env_model_settings['public_read'] = get_bool_env('S3_PUBLIC_READ', False)
+    env_model_settings['download_mode'] = os.getenv('RWS_DOWNLOAD_MODE')
+    env_model_settings['public_url'] = os.getenv('S3_PUBLIC_URL')
     env_model_settings['force_sync'] = get_bool_env('RWS_FORCE_SYNC', False)
 
     # GPG_SIGN_KEY_ARMORED stores GPG secret key for signing the repositories
@@ -93,8 +110,11 @@ def update_cfg_by_env(cfg):
                                 'gpg_modules_sign_key', env_model_settings)
 
     env_common_settings = {}
+    env_common_settings['sync_only_stale'] = get_bool_env('RWS_SYNC_ONLY_STALE', False)
     env_common_settings['credentials'] = \
         json.loads(os.environ.get('RWS_CREDENTIALS'))
+    # RWS_TOKEN_SECRET stores the secret to sign the upload tokens.
+    env_common_settings['token_secret'] = os.getenv('RWS_TOKEN_SECRET')
 
     # Check if credentials are set for at least one user.
     if len(env_common_settings['credentials']) < 1:
@@ -114,6 +134,146 @@ def update_cfg_by_env(cfg):
     if cfg.get('anchors') is None:
         cfg['anchors'] = {}
 
+    # The secrets of the tenants are set by the environment variables with
+    # the name of the tenant as a suffix (for example, "S3_ACCESS_KEY_EE"
+    # for the "ee" tenant).
+    for name, tenant in (cfg.get('tenants') or {}).items():
+        suffix = '_' + name.upper().replace('-', '_')
+        env_tenant_settings = {}
+        env_tenant_settings['bucket_name'] = os.getenv('S3_BUCKET' + suffix)
+        env_tenant_settings['base_path'] = os.getenv('S3_BASE_PATH' + suffix)
+        env_tenant_settings['public_url'] = os.getenv('S3_PUBLIC_URL' + suffix)
+        env_tenant_settings['access_key_id'] = os.getenv('S3_ACCESS_KEY' + suffix)
+        env_tenant_settings['secret_access_key'] = os.getenv('S3_SECRET_KEY' + suffix)
+        add_gpg_armored_key_to_list('GPG_SIGN_KEY_ARMORED' + suffix, 'gpg_sign_key',
+                                    env_tenant_settings)
+        add_gpg_armored_key_to_list('GPG_MODULES_SIGN_KEY_ARMORED' + suffix,
+                                    'gpg_modules_sign_key', env_tenant_settings)
+
+        if tenant.get('model') is None:
+            tenant['model'] = {}
+        for item in env_tenant_settings.items():
+            if item[1]:
+                tenant['model'][item[0]] = item[1]
+
+
+def get_tenant_settings(cfg, name, sync_budget_size):
+    """Returns the settings of the model of the tenant: the "model" section
+    of the config updated by the "model" section of the tenant. The files
+    of the tenant (the cache, the history, the "local" storage) are placed
+    separately from the ones of the default repositories. The replication
+    and the location of the repositories in the bucket ("base_path",
+    "public_url") aren't inherited.
+    """
+    tenant_model = cfg['tenants'][name].get('model') or {}
+    settings = {key: value for key, value in cfg['model'].items()
+                if key not in ['replication', 'base_path', 'public_url']}
+
+    storage_settings = dict(settings.get('storage') or {})
+    if storage_settings.get('path'):
+        storage_settings['path'] = storage_settings['path'].rstrip('/') + '.' + name
+    storage_settings.update(tenant_model.get('storage') or {})
+
+    cache_settings = settings.get('metadata_cache')
+    if cache_settings and cache_settings.get('path'):
+        settings['metadata_cache'] = dict(
+            cache_settings, path=cache_settings['path'].rstrip('/') + '.' + name)
+
+    popularity_settings = settings.get('popularity')
+    if popularity_settings and popularity_settings.get('snapshot_path'):
+        settings['popularity'] = dict(
+            popularity_settings,
+            snapshot_path=popularity_settings['snapshot_path'] + '.' + name)
+
+    # The share of the sync workers isn't inherited, the default share
+    # leaves the workers for other tenants.
+    sync_settings = {key: value for key, value in (settings.get('sync') or {}).items()
+                     if key != 'max_workers'}
+    if sync_settings.get('history_path'):
+        sync_settings['history_path'] = sync_settings['history_path'] + '.' + name
+    sync_settings.update(tenant_model.get('sync') or {})
+    if not sync_settings.get('max_workers'):
+        sync_settings['max_workers'] = max(1, sync_budget_size * 3 // 4)
+
+    settings.update(tenant_model)
+    settings['sync'] = sync_settings
+    if storage_settings:
+        settings['storage'] = storage_settings
+
+    # The tenant must not serve the objects of the default repositories.
+    backend = storage_settings.get('backend') or 's3'
+    if backend == 's3' and \
+            settings.get('endpoint_url') == cfg['model'].get('endpoint_url') and \
+            settings.get('bucket_name') == cfg['model'].get('bucket_name') and \
+            ('base_path' not in tenant_model or
+             (settings.get('base_path') or '').strip('/') ==
+             (cfg['model'].get('base_path') or '').strip('/')):
+        raise RuntimeError('The tenant {0} must have its own "bucket_name" '
+                           'or "base_path".'.format(name))
+
+    return settings
+
+
+def reload_cfg(s3_models):
+    """Reload the supported repositories and anchors from the config.
+    s3_models - dictionary (tenant name to model), None is the name of the
+    default repositories.
+    """
+    try:
+        cfg = load_cfg()
+        repo_indexes = {}
+        for name in s3_models:
+            tenant = (cfg.get('tenants') or {})[name] if name else {}
+            tenant_model = tenant.get('model') or {}
+            repo_indexes[name] = RepoIndex(
+                tenant_model.get('supported_repos') or cfg['model']['supported_repos'],
+                tenant.get('anchors') or cfg.get('anchors') or {})
+    except (RuntimeError, ValueError, KeyError, TypeError) as err:
+        logging.warning("Can't reload the config: " + str(err))
+        return
+
+    for name, s3_model in s3_models.items():
+        s3_model.set_repo_index(repo_indexes[name])
+    logging.info('The config has been reloaded.')
+
+
+def watch_cfg(s3_models, reload_event, interval):
+    """Reload the config on request (SIGHUP) or when the config file is
+    changed. The file is checked every "interval" seconds (0 - disabled).
+    """
+    cfg_path = os.getenv('RWS_CFG')
+    cfg_mtime = os.path.getmtime(cfg_path)
+    while True:
+        reload_event.wait(interval or None)
+        reload_requested = reload_event.is_set()
+        reload_event.clear()
+
+        try:
+            mtime = os.path.getmtime(cfg_path)
+        except OSError as err:
+            logging.warning("Can't check the config: " + str(err))
+            continue
+
+        if reload_requested or mtime != cfg_mtime:
+            cfg_mtime = mtime
+            reload_cfg(s3_models)
+
+
+def start_cfg_watcher(s3_models, interval):
+    """Start the thread reloading the config."""
+    reload_event = threading.Event()
+
+    # The signal handler can be set only from the main thread.
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_event.set())
+    else:
+        logging.warning('The config can not be reloaded by SIGHUP.')
+
+    watcher_thread = threading.Thread(target=watch_cfg,
+                                      args=(s3_models, reload_event, interval))
+    watcher_thread.daemon = True
+    watcher_thread.start()
+
 
 def logging_cfg():
     """Configure logging."""
@@ -121,6 +281,65 @@ def logging_cfg():
                         level=logging.INFO)
 
 
+def set_handlers(router, s3_model, upload_admission):
+    """Set the handlers of the repositories of the model.
+    router - the application or the blueprint of the tenant.
+    """
+    # Set the liveness and readiness probes.
+    health_controller = HealthController.as_view('health_controller', s3_model)
+    router.add_url_rule('/api/v1/health/<any(live, ready):probe>',
+        view_func=health_controller, methods=['GET'])
+
+    # Set the controller to get the state of the synchronization.
+    sync_status_controller = SyncStatusController.as_view('sync_status_controller',
+                                                          s3_model)
+    router.add_url_rule('/api/v1/sync/status', view_func=sync_status_controller,
+        methods=['GET'])
+
+    # Set the controller to get the state of the batch of the repositories
+    # enqueued by the patterns.
+    sync_batch_controller = SyncBatchController.as_view('sync_batch_controller', s3_model)
+    router.add_url_rule('/api/v1/sync/batch/<batch_id>', view_func=sync_batch_controller,
+        methods=['GET'])
+
+    # Set the controller to get the repositories with out-of-date
+    # metainformation.
+    stale_repos_controller = StaleReposController.as_view('stale_repos_controller',
+                                                          s3_model)
+    router.add_url_rule('/api/v1/sync/stale', view_func=stale_repos_controller,
+        methods=['GET'])
+
+    # Set the controller to get the most requested files and directories.
+    popularity_controller = PopularityController.as_view('popularity_controller', s3_model)
+    router.add_url_rule('/api/v1/popularity', view_func=popularity_controller,
+        methods=['GET'])
+
+    # Set the controller to search the packages.
+    search_controller = SearchController.as_view('search_controller', s3_model)
+    router.add_url_rule('/api/v1/search', view_func=search_controller,
+        methods=['GET'])
+
+    # Set the controller to prune the repositories.
+    prune_controller = PruneController.as_view('prune_controller', s3_model)
+    router.add_url_rule('/api/v1/prune', view_func=prune_controller,
+        methods=['POST'])
+
+    # Set the controller to promote the packages.
+    promote_controller = PromoteController.as_view('promote_controller', s3_model)
+    router.add_url_rule('/api/v1/promote', view_func=promote_controller,
+        methods=['POST'])
+
+    # Set the controller to work with S3.
+    s3_controller = S3Controller.as_view('s3_controller', s3_model, upload_admission)
+    router.add_url_rule('/<path:subpath>', view_func=s3_controller,
+        methods=['PUT', 'POST', 'DELETE'])
+
+    # Set the view to work with S3.
+    s3_view = S3View.as_view('s3_view', s3_model)
+    router.add_url_rule('/', view_func=s3_view, methods=['GET'])
+    router.add_url_rule('/<path:subpath>', view_func=s3_view, methods=['GET'])
+
+
 def server_prepare():
     """Prepare server for run."""
     # Get configuration.
@@ -131,27 +350,65 @@ def server_prepare():
     # Configure the auth module.
     logging.info('Configure auth module...')
     auth_provider.set_credentials(cfg['common']['credentials'])
-
-    # Configure S3 backend.
-    s3_model = S3AsyncModel(cfg['model'])
-    if cfg['common'].get('sync_on_start'):
-        logging.info('Synchronizing metainformation of repositories...')
-        s3_model.sync_all_repos()
+    auth_cfg = cfg['common'].get('auth') or {}
+    auth_provider.set_cache_settings(int(auth_cfg.get('cache_size', 1024)),
+                                     int(auth_cfg.get('cache_ttl', 300)))
+    token_auth_provider.set_settings(cfg['common'].get('token_secret'),
+                                     int(auth_cfg.get('token_ttl', 600)))
+
+    # Configure S3 backend. The models of the tenants share the S3 clients
+    # (see "get_s3_client") and the budget of the sync workers.
+    tenants = cfg.get('tenants') or {}
+    sync_budget = None
+    sync_budget_size = int(cfg['common'].get('sync_max_workers') or 20)
+    if tenants:
+        sync_budget = threading.BoundedSemaphore(sync_budget_size)
+        if not (cfg['model'].get('sync') or {}).get('max_workers'):
+            cfg['model'].setdefault('sync', {})['max_workers'] = \
+                max(1, sync_budget_size * 3 // 4)
+    s3_models = {None: S3AsyncModel(cfg['model'], cfg['anchors'], sync_budget)}
+    root_repo_kinds = set(cfg['model']['supported_repos']['repo_kind'])
+    for name, tenant in tenants.items():
+        url_prefix = (tenant.get('url_prefix') or name).strip('/')
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', name) or \
+                url_prefix in root_repo_kinds or url_prefix == 'api':
+            raise RuntimeError('Invalid tenant: {0} ({1}).'.format(name, url_prefix))
+        s3_models[name] = S3AsyncModel(get_tenant_settings(cfg, name, sync_budget_size),
+                                       tenant.get('anchors') or cfg['anchors'],
+                                       sync_budget)
+
+    start_cfg_watcher(s3_models, int(cfg['common'].get('cfg_reload_interval', 0)))
+    for s3_model in s3_models.values():
+        if cfg['common'].get('sync_on_start'):
+            # The synchronization can take a long time, so it is performed in
+            # the background and the progress is reported by the readiness
+            # probe.
+            logging.info('Synchronizing metainformation of repositories...')
+            s3_model.start_sync_all_repos(int(cfg['common'].get('sync_workers', 20)),
+                                          bool(cfg['common'].get('sync_only_stale')))
+        if cfg['common'].get('stale_sweep_interval'):
+            s3_model.start_stale_sweeps(int(cfg['common']['stale_sweep_interval']))
 
     # Needed to cache static files on client for one hour.
     app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600
 
     logging.info('Set handlers...')
 
-    # Set the controller to work with S3.
-    s3_controller = S3Controller.as_view('s3_controller', s3_model, cfg['anchors'])
-    app.add_url_rule('/<path:subpath>', view_func=s3_controller,
-        methods=['PUT', 'POST', 'DELETE'])
-
-    # Set the view to work with S3.
-    s3_view = S3View.as_view('s3_view', s3_model)
-    app.add_url_rule('/', view_func=s3_view, methods=['GET'])
-    app.add_url_rule('/<path:subpath>', view_func=s3_view, methods=['GET'])
+    # Set the controller to issue the upload tokens.
+    auth_token_controller = AuthTokenController.as_view('auth_token_controller')
+    app.add_url_rule('/api/v1/token', view_func=auth_token_controller,
+        methods=['POST'])
+
+    # The admission control of the uploads is common for all the tenants.
+    upload_admission = UploadAdmission(cfg['common'].get('upload_limits') or {})
+    # The repositories of the tenants are mounted under the URL prefixes
+    # (for example, "/ee/release/3/el/9" and "/ee/api/v1/search").
+    for name, tenant in tenants.items():
+        tenant_blueprint = Blueprint(name, __name__)
+        set_handlers(tenant_blueprint, s3_models[name], upload_admission)
+        app.register_blueprint(tenant_blueprint,
+                               url_prefix='/' + (tenant.get('url_prefix') or name).strip('/'))
+    set_handlers(app, s3_models[None], upload_admission)
 
 # It is a good practice to configure logging
 # before creating the application object.
@@ -0,0 +1,19 @@
+"""Controllers for working with authentication."""
+
+from flask import jsonify
+from flask.views import MethodView
+
+from helpers.auth_provider import auth_provider
+from helpers.auth_provider import token_auth_provider
+
+
+class AuthTokenController(MethodView):
+    """Controller to trade the "Basic" credentials for a short-lived
+    bearer token.
+    """
+
+    @auth_provider.login_required
+    def post(self):
+        """Generate a token for the authenticated user."""
+        token = token_auth_provider.generate_token(auth_provider.current_user())
+        return jsonify({'token': token, 'expires_in': token_auth_provider.ttl})
@@ -2,7 +2,20 @@
 in the application to authenticate users.
 """
 
+import base64
+from collections import OrderedDict
+import hashlib
+import hmac
+import json
+import math
+import os
+import time
+from threading import Lock
+
+from flask import request
 from flask_httpauth import HTTPBasicAuth
+from flask_httpauth import HTTPTokenAuth
+from flask_httpauth import MultiAuth
 from werkzeug.security import check_password_hash
 
 
@@ -13,10 +26,43 @@ class HTTPAuthProvider(HTTPBasicAuth):
         self.verify_password(self._verify_password)
         self.credentials = {}
 
+        # "check_password_hash" is deliberately slow, so the successful
+        # verifications are cached. cache - ordered dictionary
+        # (digest of the credentials to expiration time). All actions with
+        # "cache" must be done under the "cache_lock".
+        self.cache_lock = Lock()
+        self.cache = OrderedDict()
+        self.cache_size = 1024
+        self.cache_ttl = 300
+        # The key for the digest of the credentials is generated on start,
+        # so the passwords can't be restored from the cache.
+        self.cache_key = os.urandom(32)
+
+    def _credentials_digest(self, username, password):
+        """Returns the keyed digest of the credentials."""
+        return hmac.new(self.cache_key,
+                        b'\0'.join([username.encode('utf-8'), password.encode('utf-8')]),
+                        hashlib.sha256).digest()
+
     def _verify_password(self, username, password):
         """Verify credentials."""
-        if username in self.credentials and \
-                check_password_hash(self.credentials.get(username), password):
+        if username not in self.credentials:
+            return False
+
+        digest = self._credentials_digest(username, password)
+        now = time.monotonic()
+        with self.cache_lock:
+            expiration = self.cache.get(digest)
+            if expiration is not None and expiration > now:
+                return username
+
+        if check_password_hash(self.credentials.get(username), password):
+            if self.cache_size > 0:
+                with self.cache_lock:
+                    self.cache[digest] = now + self.cache_ttl
+                    self.cache.move_to_end(digest)
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
             return username
 
         return False
@@ -24,6 +70,99 @@ class HTTPAuthProvider(HTTPBasicAuth):
     def set_credentials(self, credential_dict):
         """Set the credential dictionary."""
         self.credentials = credential_dict
+        with self.cache_lock:
+            self.cache.clear()
+
+    def set_cache_settings(self, cache_size, cache_ttl):
+        """Set the maximum number of cached verifications and their
+        lifetime in seconds.
+        """
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        with self.cache_lock:
+            self.cache.clear()
+
+
+class TokenAuthProvider(HTTPTokenAuth):
+    """Provider of the short-lived signed bearer tokens (Singleton).
+
+    Token format: base64url(payload).base64url(HMAC-SHA256(payload)), where
+    the payload is a JSON object with the user name and the expiration time.
+    """
+    def __init__(self, basic_auth_provider):
+        HTTPTokenAuth.__init__(self, scheme='Bearer')
+        self.verify_token(self._verify_token)
+        self.basic_auth_provider = basic_auth_provider
+        # The secret is generated on start if it isn't set explicitly.
+        # In this case the tokens are valid only for this process.
+        self.secret = os.urandom(32)
+        self.ttl = 600
+
+    @staticmethod
+    def _encode(data):
+        """Encode bytes to base64url without padding."""
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+    @staticmethod
+    def _decode(data):
+        """Decode base64url without padding to bytes."""
+        return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+    def _sign(self, payload):
+        """Returns the signature of the payload."""
+        return hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+    def generate_token(self, username):
+        """Generate a signed token for the user."""
+        payload = TokenAuthProvider._encode(json.dumps({
+            'user': username,
+            'exp': int(time.time()) + self.ttl
+        }).encode('utf-8'))
+        return '.'.join([payload, TokenAuthProvider._encode(self._sign(payload))])
+
+    def _verify_token(self, token):
+        """Verify the token."""
+        if not token:
+            # Werkzeug >= 2.3 parses the "Bearer" header itself and keeps
+            # the token in the "token" attribute, which Flask-HTTPAuth < 4.8
+            # doesn't read.
+            token = getattr(request.authorization, 'token', None)
+        if not isinstance(token, str):
+            return False
+        try:
+            payload, signature = token.split('.')
+            if not hmac.compare_digest(self._sign(payload),
+                                       TokenAuthProvider._decode(signature)):
+                return False
+            claims = json.loads(TokenAuthProvider._decode(payload))
+        except (ValueError, UnicodeError):
+            return False
+        if not isinstance(claims, dict):
+            return False
+
+        # The token without a finite numeric expiration time is malformed
+        # ("bool" is a subclass of "int").
+        expiration = claims.get('exp')
+        if not isinstance(expiration, (int, float)) or isinstance(expiration, bool) or \
+                not math.isfinite(expiration) or expiration < time.time():
+            return False
+
+        # The user can be removed after the token has been issued.
+        username = claims.get('user')
+        if not isinstance(username, str) or \
+                username not in self.basic_auth_provider.credentials:
+            return False
+
+        return username
+
+    def set_settings(self, secret, ttl):
+        """Set the secret to sign the tokens and lifetime of the tokens."""
+        if secret:
+            self.secret = secret.encode('utf-8')
+        self.ttl = ttl
 
 
 auth_provider = HTTPAuthProvider()
+token_auth_provider = TokenAuthProvider(auth_provider)
+# Both "Basic" credentials and "Bearer" tokens are accepted.
+multi_auth_provider = MultiAuth(auth_provider, token_auth_provider)
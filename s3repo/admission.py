@@ -0,0 +1,79 @@
+"""Admission control of the uploads."""
+
+from contextlib import contextmanager
+from threading import Lock
+
+
+class UploadRejectedError(Exception):
+    """UploadRejectedError - exception that is raised when the upload
+    can't be admitted right now.
+    """
+
+    def __init__(self, message, status):
+        Exception.__init__(self, message)
+        # HTTP status of the response.
+        self.status = status
+
+
+class UploadAdmission:
+    """UploadAdmission - limits the number of concurrent uploads, the total
+    size of the uploads in progress and the depth of the sync queue.
+
+    The limits are checked before the request body is read, so the rejected
+    upload doesn't occupy the server. Since the number of the server threads
+    is limited, the limit of concurrent uploads reserves the rest of them for
+    the read requests. All actions with "uploads" and "upload_bytes" must be
+    done under the "lock".
+    """
+
+    def __init__(self, limits):
+        """limits - dictionary with the limits (0 or absence - no limit):
+            - max_uploads - maximum number of concurrent uploads
+            - max_upload_bytes - maximum total size of the uploads in
+                progress in bytes
+            - max_sync_queue - maximum number of repositories waiting for
+                the synchronization
+            - retry_after - value of the "Retry-After" header in seconds
+                (default: 30)
+        """
+        self.max_uploads = int(limits.get('max_uploads') or 0)
+        self.max_upload_bytes = int(limits.get('max_upload_bytes') or 0)
+        self.max_sync_queue = int(limits.get('max_sync_queue') or 0)
+        self.retry_after = int(limits.get('retry_after') or 30)
+
+        self.lock = Lock()
+        self.uploads = 0
+        self.upload_bytes = 0
+
+    @contextmanager
+    def admit(self, size, sync_queue_size):
+        """Context manager that holds the capacity for the upload of "size"
+        bytes while it is in progress. Raises UploadRejectedError if the
+        upload can't be admitted.
+        """
+        if self.max_upload_bytes:
+            if size is None:
+                raise UploadRejectedError('The "Content-Length" header is required.', 411)
+            if size > self.max_upload_bytes:
+                raise UploadRejectedError('The upload is too large.', 413)
+        size = size or 0
+
+        if self.max_sync_queue and sync_queue_size >= self.max_sync_queue:
+            raise UploadRejectedError('Too many repositories are waiting for ' +
+                                      'the synchronization.', 429)
+
+        with self.lock:
+            if self.max_uploads and self.uploads >= self.max_uploads:
+                raise UploadRejectedError('Too many concurrent uploads.', 503)
+            if self.max_upload_bytes and \
+                    self.upload_bytes + size > self.max_upload_bytes:
+                raise UploadRejectedError('Too many bytes are being uploaded.', 503)
+            self.uploads += 1
+            self.upload_bytes += size
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.uploads -= 1
+                self.upload_bytes -= size
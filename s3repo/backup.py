@@ -0,0 +1,307 @@
+"""Incremental backup of the repositories to a local directory.
+
+The objects are listed once, only the new and changed ones (by the ETag
+and size recorded in the manifest of the previous run) are downloaded.
+The content of the objects is kept in the content-addressed store
+("objects/<sha256[:2]>/<sha256>"), so the same content is stored once.
+Each run writes a snapshot ("snapshots/<time>.json": the objects and the
+keys deleted since the previous run), the last snapshot is also written to
+"manifest.json". Any snapshot can be restored.
+
+The storage is configured the same way as the service: the "model" section
+of the configuration file ("RWS_CFG" or "--cfg") and the "S3_*" environment
+variables.
+
+Usage:
+    python -m s3repo.backup backup [--prefix live/] [--workers 16] /path/to/backup
+    python -m s3repo.backup restore [--snapshot 20240101T000000] [--delete] \\
+        /path/to/backup
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+import tempfile
+import time
+
+from s3repo.storage import create_storage
+from s3repo.storage import StorageNoSuchKeyError
+
+
+# Environment variables overriding the settings of the storage (the same
+# as the service uses).
+ENV_SETTINGS = {
+    'S3_REGION': 'region',
+    'S3_URL': 'endpoint_url',
+    'S3_BUCKET': 'bucket_name',
+    'S3_BASE_PATH': 'base_path',
+    'S3_ACCESS_KEY': 'access_key_id',
+    'S3_SECRET_KEY': 'secret_access_key',
+}
+
+
+class Backup:
+    """Backup - backup directory with the content-addressed store of
+    the objects and the snapshots of the storage.
+    """
+
+    def __init__(self, storage, path, workers=16):
+        """storage(Storage) - backed up storage.
+        path(string) - backup directory.
+        workers(int) - number of the parallel downloads/uploads.
+        """
+        self.storage = storage
+        self.path = path
+        self.workers = workers
+        self.objects_path = os.path.join(path, 'objects')
+        self.snapshots_path = os.path.join(path, 'snapshots')
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        for directory in [self.objects_path, self.snapshots_path]:
+            os.makedirs(directory, exist_ok=True)
+
+    def _get_object_path(self, sha256):
+        """Returns the path to the content in the store."""
+        return os.path.join(self.objects_path, sha256[:2], sha256)
+
+    def load_snapshot(self, name=None):
+        """Returns the snapshot with the given name or the last one (the
+        manifest). The empty snapshot is returned if there is no backup yet.
+        """
+        path = self.manifest_path
+        if name:
+            path = os.path.join(self.snapshots_path, name + '.json')
+        elif not os.path.isfile(path):
+            return {'objects': {}, 'deleted': []}
+
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+
+    def _write_json(self, path, data):
+        """Atomically write the JSON file."""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as json_file:
+            json.dump(data, json_file)
+        os.replace(tmp_path, path)
+
+    def _download(self, key):
+        """Download the object to the store. Returns the description of
+        the object (dictionary with the "etag", "size" and "sha256") or None
+        if the object has been deleted in the meantime.
+        """
+        try:
+            response = self.storage.get_object(key)
+        except StorageNoSuchKeyError:
+            return None
+
+        sha256 = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.objects_path, delete=False) as tmp_file:
+            try:
+                while True:
+                    chunk = response['Body'].read(1024 * 1024)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+            finally:
+                response['Body'].close()
+
+        object_path = self._get_object_path(sha256.hexdigest())
+        if os.path.isfile(object_path):
+            # The same content is already in the store.
+            os.unlink(tmp_file.name)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(tmp_file.name, object_path)
+
+        return {'etag': response['ETag'], 'size': size, 'sha256': sha256.hexdigest()}
+
+    def _download_key(self, key):
+        """Download the object, the errors are logged. Returns the tuple
+        (key, description of the object or None, success).
+        """
+        try:
+            return key, self._download(key), True
+        except Exception as err:
+            logging.warning("Can't back up {0}: {1}".format(key, err))
+            return key, None, False
+
+    def backup(self, prefix=''):
+        """Back up the objects with the "prefix". Returns the name of the
+        snapshot and the number of the failed downloads.
+        """
+        previous_objects = self.load_snapshot()['objects']
+
+        # The storage is listed once, the objects that have the same ETag and
+        # size as in the previous run (and are present in the store) are
+        # not downloaded.
+        objects = {}
+        changed_keys = []
+        for page in self.storage.iter_objects(prefix):
+            for file_meta in page.get('Contents') or []:
+                key = file_meta['Key']
+                previous = previous_objects.get(key)
+                if previous and previous['etag'] == file_meta['ETag'].strip('"') and \
+                        previous['size'] == file_meta['Size'] and \
+                        os.path.isfile(self._get_object_path(previous['sha256'])):
+                    objects[key] = previous
+                else:
+                    changed_keys.append(key)
+
+        downloaded = 0
+        failed = 0
+        with ThreadPool(processes=self.workers) as pool:
+            for key, description, success in pool.imap_unordered(self._download_key,
+                                                                 changed_keys):
+                if description is not None:
+                    objects[key] = description
+                    downloaded += 1
+                elif not success:
+                    failed += 1
+                    # The failed object is kept in the backup as it was
+                    # in the previous run.
+                    if key in previous_objects:
+                        objects[key] = previous_objects[key]
+
+        deleted = sorted(key for key in previous_objects if key not in objects)
+        name = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        snapshot = {'name': name, 'created': time.time(), 'source': self.storage.uri,
+                    'prefix': prefix, 'objects': objects, 'deleted': deleted}
+        self._write_json(os.path.join(self.snapshots_path, name + '.json'), snapshot)
+        self._write_json(self.manifest_path, snapshot)
+        logging.info('Backup %s: %d objects, %d downloaded, %d deleted, %d failed.',
+                     name, len(objects), downloaded, len(deleted), failed)
+
+        return name, failed
+
+    def _is_restored(self, key, description, current):
+        """Check whether the object in the storage has the content of the
+        object from the snapshot. current - tuple (ETag, size) of the object
+        in the storage or None if there is no such object.
+        """
+        if current is None:
+            return False
+        etag, size = current
+        if etag == description['etag']:
+            return True
+        if size != description['size']:
+            return False
+
+        # The ETag depends on the way the object has been uploaded (for
+        # example, in parts), so the SHA-256 digest saved by "put_object"
+        # is compared.
+        try:
+            metadata = self.storage.head_object(key)['Metadata']
+        except StorageNoSuchKeyError:
+            return False
+
+        return metadata.get('sha256') == description['sha256']
+
+    def _upload_key(self, key, description, current):
+        """Upload the object from the store if the storage doesn't have
+        the same content, the errors are logged. Returns True if the object
+        has been uploaded, None if it is up-to-date and False on failure.
+        """
+        try:
+            if self._is_restored(key, description, current):
+                return None
+            with open(self._get_object_path(description['sha256']), 'rb') as file:
+                self.storage.put_object(key, file, self.storage.compute_digests(file))
+        except Exception as err:
+            logging.warning("Can't restore {0}: {1}".format(key, err))
+            return False
+
+        return True
+
+    def restore(self, name=None, delete=False):
+        """Restore the snapshot (the last one if "name" isn't set). The
+        objects which have the same ETag or the same size and SHA-256
+        digest in the storage as in the snapshot are not uploaded.
+        "delete" - delete the objects (with the prefix of the snapshot)
+        absent in the snapshot. Returns the number of the failed uploads.
+        """
+        snapshot = self.load_snapshot(name)
+        objects = snapshot['objects']
+
+        current_objects = {}
+        for page in self.storage.iter_objects(snapshot.get('prefix', '')):
+            for file_meta in page.get('Contents') or []:
+                current_objects[file_meta['Key']] = (file_meta['ETag'].strip('"'),
+                                                     file_meta['Size'])
+
+        with ThreadPool(processes=self.workers) as pool:
+            results = pool.starmap(self._upload_key,
+                                   [(key, objects[key], current_objects.get(key))
+                                    for key in sorted(objects)])
+        uploaded = results.count(True)
+        failed = results.count(False)
+
+        deleted = []
+        if delete:
+            deleted = sorted(key for key in current_objects if key not in objects)
+            self.storage.delete_objects(deleted)
+
+        logging.info('Restore %s: %d uploaded, %d up-to-date, %d deleted, %d failed.',
+                     snapshot.get('name'), uploaded, results.count(None),
+                     len(deleted), failed)
+
+        return failed
+
+
+def load_settings(cfg_path):
+    """Returns the settings of the storage: the "model" section of
+    the configuration file updated by the environment variables.
+    """
+    settings = {}
+    if cfg_path:
+        with open(cfg_path) as cfg_file:
+            settings = json.load(cfg_file).get('model') or {}
+    for env, setting in ENV_SETTINGS.items():
+        if os.getenv(env) is not None:
+            settings[setting] = os.getenv(env)
+
+    return settings
+
+
+def main():
+    """Parse the arguments and back up or restore the storage."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['backup', 'restore'])
+    parser.add_argument('path', help='backup directory')
+    parser.add_argument('--cfg', default=os.getenv('RWS_CFG'),
+                        help='configuration file of the service (default: $RWS_CFG)')
+    parser.add_argument('--prefix', default=None,
+                        help='back up only the objects with the prefix '
+                        '(default: "base_path")')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='number of the parallel downloads/uploads')
+    parser.add_argument('--snapshot', default=None,
+                        help='snapshot to restore (default: the last one)')
+    parser.add_argument('--delete', action='store_true', default=False,
+                        help='delete the objects absent in the restored snapshot')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s (%(levelname)s) %(message)s',
+                        level=logging.INFO)
+
+    settings = load_settings(args.cfg)
+    backup = Backup(create_storage(settings), args.path, args.workers)
+    if args.command == 'backup':
+        prefix = args.prefix
+        if prefix is None:
+            prefix = (settings.get('base_path') or '').strip('/')
+            prefix = prefix + '/' if prefix else ''
+        _, failed = backup.backup(prefix)
+    else:
+        failed = backup.restore(args.snapshot, args.delete)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
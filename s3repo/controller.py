@@ -1,6 +1,5 @@
 """Controllers for working with S3."""
 
-import copy
 import logging
 import os
 import re
@@ -9,7 +8,9 @@ from flask import jsonify
 from flask import request
 from flask.views import MethodView
 
-from helpers.auth_provider import auth_provider
+from helpers.auth_provider import multi_auth_provider
+from s3repo.admission import UploadAdmission
+from s3repo.admission import UploadRejectedError
 from s3repo.model import ALLOWED_EXTENSIONS
 from s3repo.model import S3ModelRequestError
 from s3repo.package import Package
@@ -19,9 +20,9 @@ from s3repo.repoinfo import RepoAnnotation
 class S3Controller(MethodView):
     """Controller for working with S3 according to the REST model."""
 
-    def __init__(self, model, anchors):
+    def __init__(self, model, admission=None):
         self.model = model
-        self.anchors = anchors
+        self.admission = admission or UploadAdmission({})
 
     @staticmethod
     def check_filename(filename):
@@ -41,40 +42,31 @@ class S3Controller(MethodView):
 
     def _generate_repo_annotations(self, path):
         """Generates a list of repository annotations according to the path."""
-        repo_annotations = []
-        repo_anchors = {}
-
-        # Find the anchors in the URI.
-        path_list = path.split('/')
-        for i in range(0, len(path_list)):
-            if path_list[i] in self.anchors:
-                repo_anchors[i] = self.anchors[path_list[i]]
-
-        # If no anchors are found, we use the passed URI to form the RepoAnnotation.
-        if len(repo_anchors) == 0:
-            repo_annotations.append(RepoAnnotation(path, self.model.get_supported_repos()))
-            return repo_annotations
-
-        # Generate a list of URIs according to the present anchors.
-        generated_path_lists = [path_list.copy()]
-        for anchor_position, anchor_value_list in repo_anchors.items():
-            tmp_generated_path_lists =[]
-            for anchor_value in anchor_value_list:
-                for generated_path_list in generated_path_lists:
-                    tmp_generated_path_list = copy.deepcopy(generated_path_list)
-                    tmp_generated_path_list[anchor_position] = anchor_value
-                    tmp_generated_path_lists.append(tmp_generated_path_list)
-            generated_path_lists = tmp_generated_path_lists
-
-        # Generate the RepoAnnotations list according to the generated URI list.
-        for generated_path_list in generated_path_lists:
-            generated_path = os.path.normpath('/'.join(generated_path_list))
-            repo_annotations.append(RepoAnnotation(generated_path, self.model.get_supported_repos()))
-
-        return repo_annotations
-
-    @auth_provider.login_required
+        # The index can be replaced by the config reload at any moment,
+        # so the same index is used for the whole request.
+        repo_index = self.model.repo_index
+
+        return [RepoAnnotation(generated_path, repo_index)
+                for generated_path in repo_index.expand_anchors(path)]
+
+    @multi_auth_provider.login_required
     def put(self, subpath):
+        """Checks if the upload can be admitted and uploads the package.
+        The request body isn't read if the upload is rejected.
+        """
+        try:
+            with self.admission.admit(request.content_length,
+                                      self.model.get_sync_queue_size()):
+                return self._put(subpath)
+        except UploadRejectedError as err:
+            logging.warning('Upload is rejected: ' + str(err))
+            response = S3Controller.response_message(str(err), err.status)
+            # The uploads rejected by the size (411, 413) can't be retried.
+            if err.status in [429, 503]:
+                response.headers['Retry-After'] = str(self.admission.retry_after)
+            return response
+
+    def _put(self, subpath):
         """Generates a Package object from the request and tries
         to upload it to S3 using S3Model.
         """
@@ -95,6 +87,13 @@ class S3Controller(MethodView):
 
             package.add_file(file.filename, file)
 
+            # The client can send the digests of the file in the
+            # "<filename>.md5" and "<filename>.sha256" forms.
+            for digest_type in ['md5', 'sha256']:
+                digest = request.form.get(file.filename + '.' + digest_type)
+                if digest:
+                    package.checksums.setdefault(file.filename, {})[digest_type] = digest
+
         try:
             package.repo_annotations = self._generate_repo_annotations(subpath)
         except RuntimeError as err:
@@ -114,11 +113,24 @@ class S3Controller(MethodView):
 
         msg = "Files uploaded: " + ', '.join(file for file in package.files)
         logging.info(msg)
-        return S3Controller.response_message('OK', 201)
+        response = jsonify({
+            'message': 'OK',
+            'files': {filename: {'md5': digests['md5'], 'sha256': digests['sha256']}
+                      for filename, digests in package.digests.items()}
+        })
+        response.status_code = 201
+        return response
 
-    @auth_provider.login_required
+    @multi_auth_provider.login_required
     def post(self, subpath):
-        """Update metainformation of the repositories."""
+        """Update metainformation of the repositories. The components of
+        the path can be glob patterns (for example, "release/*/el/9"),
+        in this case all the matching repositories are updated (see
+        "_post_patterns").
+        """
+        if any(char in subpath for char in '*?['):
+            return self._post_patterns(subpath)
+
         try:
             repo_annotations = self._generate_repo_annotations(subpath)
         except RuntimeError as err:
@@ -137,7 +149,192 @@ class S3Controller(MethodView):
         logging.info(msg)
         return S3Controller.response_message('OK', 200)
 
+    def _post_patterns(self, subpath):
+        """Enqueue all the repositories matching the patterns in one batch.
+        The response contains the resolved repositories and the batch ID
+        to get the state of the batch (see "SyncBatchController").
+        """
+        path = os.path.normpath(subpath.strip('/'))
+        try:
+            batch = self.model.resync_patterns(self.model.repo_index.expand_anchors(path))
+        except (RuntimeError, S3ModelRequestError) as err:
+            msg = "Can't update repositories: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 400)
+        except Exception as err:
+            msg = "Can't update repositories: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 500)
+
+        logging.info('Repositories (%s) set to queue for update: %d, batch %s',
+                     subpath, len(batch['repos']), batch['id'])
+        response = jsonify({'message': 'OK', 'batch': batch['id'],
+                            'repos': batch['repos']})
+        response.status_code = 202
+        return response
+
+    @multi_auth_provider.login_required
     def delete(self, subpath):
-        """Delete the file or Package according to the "subpath" path."""
-        return S3Controller.response_message('Delete has not yet been implemented.',
-            501)
+        """Delete the file or Package according to the "subpath" path.
+        If the path describes a repository (see "RepoAnnotation"), the files
+        listed in the "files" form are deleted from the repositories.
+        Otherwise, the path is a path to the package file.
+        """
+        path = os.path.normpath(subpath.strip('/'))
+        package = None
+        if len(path.split('/')) == 4 or request.form.getlist('files'):
+            package = Package()
+            package.product = request.form.get('product', '')
+            for filename in request.form.getlist('files'):
+                if not S3Controller.check_filename(filename):
+                    msg = 'Invalid filename: ' + filename
+                    logging.warning(msg)
+                    return S3Controller.response_message(msg, 400)
+                package.add_file(filename, None)
+            if not package.files:
+                return S3Controller.response_message('No files to delete.', 400)
+
+            try:
+                package.repo_annotations = self._generate_repo_annotations(path)
+            except RuntimeError as err:
+                logging.warning(str(err))
+                return S3Controller.response_message(str(err), 400)
+
+        try:
+            if package:
+                deleted_files = self.model.delete_package(package)
+            else:
+                self.model.delete_file(path)
+                deleted_files = [path]
+        except S3ModelRequestError as err:
+            msg = "Can't delete the package: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 400)
+        except Exception as err:
+            msg = "Can't delete the package: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 500)
+
+        logging.info('Files deleted: ' + ', '.join(deleted_files))
+        return S3Controller.response_message('OK', 200)
+
+
+class PruneController(MethodView):
+    """Controller to delete the old builds of the packages according
+    to the retention policy.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    @multi_auth_provider.login_required
+    def post(self):
+        """Prune the repositories. The "repo_kind" form limits the pruned
+        repositories, the "dry_run" form allows to only get the files that
+        would be deleted.
+        """
+        repo_kind = request.form.get('repo_kind') or None
+        dry_run = request.form.get('dry_run', '').casefold() not in ['', 'false', '0']
+        try:
+            result = self.model.prune_repos(repo_kind, dry_run)
+        except Exception as err:
+            msg = "Can't prune the repositories: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 500)
+
+        if not dry_run:
+            logging.info('Repositories pruned: ' + ', '.join(result))
+        return jsonify({'message': 'OK', 'dry_run': dry_run, 'deleted': result})
+
+
+class PromoteController(MethodView):
+    """Controller to promote packages from one repo kind to another
+    (for example, from "live" to "release") without re-uploading.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    @multi_auth_provider.login_required
+    def post(self):
+        """Promote the packages. Forms:
+        * "source" - path to the source repository
+          (repo_kind/tarantool_series/dist/dist_ver).
+        * "target_kind" - kind of the target repository.
+        * "packages" - glob patterns of the package file names.
+        * "dry_run" - only return the planned copies.
+        """
+        source = os.path.normpath(request.form.get('source', '').strip('/'))
+        target_kind = request.form.get('target_kind', '')
+        patterns = request.form.getlist('packages')
+        dry_run = request.form.get('dry_run', '').casefold() not in ['', 'false', '0']
+        if not patterns:
+            return S3Controller.response_message('No packages to promote.', 400)
+
+        try:
+            repo_annotation = RepoAnnotation(source, self.model.repo_index)
+        except RuntimeError as err:
+            logging.warning(str(err))
+            return S3Controller.response_message(str(err), 400)
+
+        try:
+            copies = self.model.promote_packages(repo_annotation, target_kind,
+                                                 patterns, dry_run)
+        except S3ModelRequestError as err:
+            msg = "Can't promote the packages: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 400)
+        except Exception as err:
+            msg = "Can't promote the packages: " + str(err)
+            logging.warning(msg)
+            return S3Controller.response_message(msg, 500)
+
+        if not dry_run:
+            logging.info('Packages promoted from %s to %s: %d files',
+                         source, target_kind, len(copies))
+        return jsonify({'message': 'OK', 'dry_run': dry_run,
+                        'copies': [{'source': source_key, 'target': target_key}
+                                   for source_key, target_key in copies]})
+
+
+class SearchController(MethodView):
+    """Controller to search the packages in all repositories."""
+
+    # Arguments of the request used to filter the packages
+    # (argument to PackageEntry field).
+    FILTERS = {
+        'repo_kind': 'repo_kind',
+        'series': 'tarantool_series',
+        'dist': 'dist',
+        'dist_version': 'dist_version',
+        'arch': 'arch',
+    }
+
+    def __init__(self, model):
+        self.model = model
+
+    def get(self):
+        """Search the packages. Arguments:
+        * "name" - prefix of the package name.
+        * "min_version" - minimum version of the package (inclusive).
+        * "max_version" - maximum version of the package (exclusive).
+        * "repo_kind", "series", "dist", "dist_version", "arch" - filters.
+        * "limit" - maximum number of the returned files (default: 1000).
+        """
+        filters = {}
+        for arg, field in SearchController.FILTERS.items():
+            if request.args.get(arg):
+                filters[field] = request.args[arg]
+        limit = request.args.get('limit', 1000, type=int)
+
+        try:
+            entries = self.model.search_packages(request.args.get('name', ''),
+                                                 request.args.get('min_version'),
+                                                 request.args.get('max_version'),
+                                                 filters, limit)
+        except S3ModelRequestError as err:
+            return S3Controller.response_message(str(err), 400)
+        except RuntimeError as err:
+            return S3Controller.response_message(str(err), 503)
+
+        return jsonify({'packages': [entry._asdict() for entry in entries]})
@@ -0,0 +1,133 @@
+"""Update of the metainformation of the deb-based repository limited to
+the given codenames (distribution versions).
+
+"mkrepo" rebuilds and re-signs the indexes of all the codenames of the
+repository. This tool runs the same "mkrepo" code, but the storage shows it
+only the "pool/<codename>/" and "dists/<codename>/" files, so the indexes of
+other codenames are left untouched. All the codenames are updated if none
+is given.
+
+"mkrepo" only adds and updates the index units of the files found in
+the pool, so the units of the deleted files are dropped from the indexes
+here before they are written.
+
+Usage (the arguments are the same as for "mkrepo"):
+    python -m s3repo.debscope [--codename jammy --codename focal ...] \\
+        [mkrepo arguments] s3://bucket/prefix
+"""
+
+import argparse
+import os
+
+# The modules of "mkrepo".
+import debrepo
+import storage
+
+
+class CodenameScopedStorage:
+    """CodenameScopedStorage - wrapper of the "mkrepo" storage listing only
+    the files of the given codenames in the "pool" and "dists" directories.
+    """
+
+    def __init__(self, wrapped_storage, codenames):
+        self.wrapped_storage = wrapped_storage
+        self.codenames = sorted(codenames)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped_storage, name)
+
+    def files(self, subdir=None):
+        """Returns the files of the codenames if "subdir" is "pool" or "dists"
+        and all the files of the "subdir" otherwise.
+        """
+        if subdir is None or subdir.strip('/') not in ('pool', 'dists'):
+            yield from self.wrapped_storage.files(subdir)
+            return
+
+        for codename in self.codenames:
+            codename_dir = '/'.join([subdir.strip('/'), codename]) + '/'
+            for file_path in self.wrapped_storage.files(codename_dir):
+                # The prefix can match the neighbouring codenames
+                # (for example, "jammy" and "jammy-backports").
+                if file_path.lstrip('/').startswith(codename_dir):
+                    yield file_path
+
+
+def drop_missing_units(repo_info):
+    """Remove the units of the read indexes whose files are absent in
+    the pool. Returns the list of the removed files.
+    """
+    pool_files = {file_path.lstrip('/') for file_path in repo_info.storage.files('pool')}
+
+    removed = []
+    for index_list in [repo_info.package_index_list, repo_info.source_index_list]:
+        for index in index_list.values():
+            for unit in list(index.units):
+                filename = unit.fields.get('Filename', '').lstrip('/')
+                if filename and filename not in pool_files:
+                    index.units.remove(unit)
+                    removed.append(filename)
+
+    return removed
+
+
+def update_repo(repo_storage, sign, temp_dir, force=False):
+    """Update the metainformation of the repository the same way as
+    "debrepo.update_repo" does, but without the units of the deleted files.
+    """
+    repo_info = debrepo.RepoInfo(repo_storage)
+
+    debrepo.read_release_and_indices(repo_info)
+    for filename in drop_missing_units(repo_info):
+        print("Removing: '%s'" % filename)
+    debrepo.process_index_units(repo_info, temp_dir, 'packages', force)
+    debrepo.process_index_units(repo_info, temp_dir, 'sources')
+    debrepo.update_index_files(repo_info, 'packages')
+    debrepo.update_index_files(repo_info, 'sources')
+    debrepo.update_release_files(repo_info, sign)
+
+
+def main():
+    """Parse the arguments and update the repositories."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codename', action='append', default=[],
+                        help='codename to update (can be repeated, all if not set)')
+    parser.add_argument('--temp-dir', default='.mkrepo',
+                        help='directory used to store temporary artifacts')
+    parser.add_argument('--s3-access-key-id', help='access key for connecting to S3')
+    parser.add_argument('--s3-secret-access-key', help='secret key for connecting to S3')
+    parser.add_argument('--s3-endpoint', help='region endpoint for connecting to S3')
+    parser.add_argument('--s3-region', help='S3 region name')
+    parser.add_argument('--s3-public-read', action='store_true', default=False,
+                        help='set read-only permission on files uploaded to S3 '
+                        'to an anonymous users')
+    parser.add_argument('--sign', action='store_true', default=False,
+                        help='sign package metadata')
+    parser.add_argument('--force', action='store_true', default=False,
+                        help='skip malformed packages')
+    parser.add_argument('path', nargs='+',
+                        help='list of paths: s3://bucket/prefix or /path/on/local/fs')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.temp_dir):
+        os.mkdir(args.temp_dir)
+
+    for path in args.path:
+        # The same way as "mkrepo" does.
+        if path.startswith('s3://'):
+            bucket, _, prefix = path[len('s3://'):].partition('/')
+            repo_storage = storage.S3Storage(args.s3_endpoint, bucket, prefix or '.',
+                                             args.s3_access_key_id,
+                                             args.s3_secret_access_key,
+                                             args.s3_region, args.s3_public_read)
+        else:
+            repo_storage = storage.FilesystemStorage(path)
+
+        print('Updating deb repository: %s (%s)' % (path, ', '.join(args.codename) or 'all'))
+        if args.codename:
+            repo_storage = CodenameScopedStorage(repo_storage, args.codename)
+        update_repo(repo_storage, args.sign, args.temp_dir, args.force)
+
+
+if __name__ == '__main__':
+    main()
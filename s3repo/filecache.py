@@ -0,0 +1,141 @@
+"""Local disk cache for the files from S3."""
+
+from collections import namedtuple
+from collections import OrderedDict
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+from threading import Lock
+
+
+# "CacheEntry" is tuple with information about the cached file.
+# Fields format:
+# +------+----------+------+---------+
+# | ETag | Filename | Size | Checked |
+# +------+----------+------+---------+
+# "Checked" is the time of the last check that the file is up-to-date.
+CacheEntry = namedtuple('CacheEntry', ['ETag', 'Filename', 'Size', 'Checked'])
+
+
+class CachedFile(io.BufferedReader):
+    """CachedFile - opened file of the local disk cache. The dedicated type
+    marks the cache hits for the view (see "S3View._get_file").
+    """
+
+
+class FileCache:
+    """FileCache - size-bounded LRU cache of files on the local disk.
+
+    Each entry is stored as a separate file named according to the S3 key
+    and the ETag of the object, so the new version of the object never
+    overwrites the file that can be sent to a client at the moment. All
+    actions with "entries" must be done under the "lock".
+    """
+
+    def __init__(self, path, max_size, ttl):
+        """path(string) - directory to store the cached files.
+        max_size(int) - maximum total size of the cached files in bytes.
+        ttl(int) - time in seconds during which the cached file is
+        considered up-to-date without checking it on S3.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # The cache is not persistent, so remove the files that were left
+        # by the previous run.
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def _filename(self, key, etag):
+        """Returns the path to the file of the entry."""
+        name = hashlib.sha256('\0'.join([key, etag]).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, name)
+
+    def _remove(self, key):
+        """Remove the entry. Must be called under the "lock"."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        self.size -= entry.Size
+        # The file can be sent to a client at the moment, but it is
+        # safe to unlink the opened file.
+        try:
+            os.unlink(entry.Filename)
+        except OSError as err:
+            logging.warning("Can't remove the cached file: " + str(err))
+
+    def is_fresh(self, key):
+        """Checks if the cached file doesn't need to be checked on S3."""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and time.time() - entry.Checked < self.ttl
+
+    def get_etag(self, key):
+        """Returns the ETag of the cached object or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry.ETag if entry else None
+
+    def touch(self, key):
+        """Mark the cached file as checked on S3 right now."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries[key] = entry._replace(Checked=time.time())
+
+    def open(self, key):
+        """Open the cached file for reading. Returns None if there is
+        no such entry.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            # The file is opened under the lock, so it can't be removed
+            # by another thread before it is opened.
+            return CachedFile(io.FileIO(entry.Filename, 'rb'))
+
+    def put(self, key, etag, body):
+        """Save the "body" (file-like object) of the object to the cache."""
+        filename = self._filename(key, etag)
+        with tempfile.NamedTemporaryFile(prefix='.rws_', dir=self.path,
+                                         delete=False) as tmp_file:
+            shutil.copyfileobj(body, tmp_file)
+            size = tmp_file.tell()
+        if size > self.max_size:
+            os.unlink(tmp_file.name)
+            return
+        os.replace(tmp_file.name, filename)
+
+        with self.lock:
+            old_entry = self.entries.get(key)
+            if old_entry is not None and old_entry.Filename == filename:
+                # Another thread has already cached the same version.
+                self.size -= old_entry.Size
+                del self.entries[key]
+            else:
+                self._remove(key)
+            self.entries[key] = CacheEntry(etag, filename, size, time.time())
+            self.size += size
+
+            # Evict the least recently used entries.
+            while self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, prefix):
+        """Remove all entries with keys starting with the "prefix"."""
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self._remove(key)
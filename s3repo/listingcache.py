@@ -0,0 +1,58 @@
+"""In-memory cache of the directory listings."""
+
+from collections import OrderedDict
+import time
+from threading import Lock
+
+
+class ListingCache:
+    """ListingCache - size-bounded LRU cache of the directory listings.
+
+    The listing is considered up-to-date for "ttl" seconds or until the
+    directory or any directory containing it or contained in it is
+    invalidated. All actions with "entries" must be done under the "lock".
+    """
+
+    def __init__(self, max_entries, ttl):
+        """max_entries(int) - maximum number of the cached listings.
+        ttl(int) - time in seconds during which the cached listing is
+        considered up-to-date.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.lock = Lock()
+        # entries - ordered dictionary (path to tuple (time of the listing,
+        # listing)), the least recently used entry is the first.
+        self.entries = OrderedDict()
+
+    def get(self, path):
+        """Returns the cached listing of the directory or None."""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.entries[path]
+                return None
+            self.entries.move_to_end(path)
+
+            return entry[1]
+
+    def put(self, path, listing):
+        """Cache the listing of the directory."""
+        with self.lock:
+            self.entries[path] = (time.monotonic(), listing)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, prefix):
+        """Remove the listings of the directories inside the "prefix" and of
+        the directories containing it (the subdirectories could appear or
+        disappear).
+        """
+        with self.lock:
+            for path in list(self.entries):
+                if path.startswith(prefix) or prefix.startswith(path):
+                    del self.entries[path]
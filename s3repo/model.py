@@ -1,23 +1,52 @@
 """Model for working with the repositories on S3."""
 
 from collections import namedtuple
+from collections import OrderedDict
+import fnmatch
 import logging
 from multiprocessing.pool import ThreadPool
 import os
 import re
+import shutil
 import subprocess as sp
+import sys
 import tempfile
 import time
+import uuid
+from threading import BoundedSemaphore
+from threading import Event
 from threading import Lock
 from threading import Thread
 
-import boto3
-
+from s3repo.filecache import FileCache
+from s3repo.listingcache import ListingCache
+from s3repo.package import parse_package_filename
+from s3repo.popularity import POPULARITY_KINDS
+from s3repo.popularity import PopularityTracker
+from s3repo.repoindex import RepoIndex
+from s3repo.replication import Replicator
 from s3repo.repoinfo import RepoInfo
+from s3repo.searchindex import PackageSearchIndex
+from s3repo.storage import create_storage
+from s3repo.storage import StorageIntegrityError
+from s3repo.storage import StorageNoSuchKeyError
+from s3repo.synchistory import SyncHistory
+from s3repo.syncqueue import SyncQueue
 
 
 ALLOWED_EXTENSIONS = {'.rpm', '.deb', '.dsc', '.xz', '.gz'}
 
+# Modes of downloading files:
+# * "proxy" - the file is read from S3 and sent to the client by RWS.
+# * "public" - the client is redirected to the public URL of the object
+#   (the objects must be uploaded with the "public_read" option).
+# * "presigned" - the client is redirected to a short-lived presigned URL.
+DOWNLOAD_MODES = {'proxy', 'public', 'presigned'}
+
+# Number of the last batches of the pattern-based synchronization
+# (see "S3AsyncModel.resync_patterns") whose state can be requested.
+SYNC_BATCHES_SIZE = 100
+
 
 class S3ModelRequestError(Exception):
     """S3ModelRequestError - exception that is raised when trying to
@@ -40,7 +69,7 @@ class S3AsyncModel:
     will be used to update metainformation.
     """
 
-    def __init__(self, s3_settings):
+    def __init__(self, s3_settings, anchors=None, sync_budget=None):
         """When the "S3AsyncModel" object is created, a resource
         representing the S3 segment is created and the synchronization
         thread is started. A sync thread is required to update
@@ -57,25 +86,192 @@ class S3AsyncModel:
             - secret_access_key - S3 secret key
             - public_read - set public access to files uploaded to S3
                 (True/False)
+            - download_mode - how files are downloaded: "proxy" (default),
+                "public" or "presigned" (see DOWNLOAD_MODES)
+            - public_url - base URL of the bucket used in the "public"
+                download mode (default: endpoint_url/bucket_name)
+            - presigned_url_expiration - lifetime of the presigned URLs
+                in seconds (default: 300)
+            - storage - settings of the storage backend:
+                - backend - "s3" (default) or "local" (see "STORAGE_BACKENDS")
+                - path - root directory of the "local" storage
+                - max_pool_connections - size of the S3 connection pool
+                    (default: 50)
+                - connect_timeout - S3 connection timeout in seconds
+                    (default: 10)
+                - read_timeout - S3 read timeout in seconds (default: 60)
+                - max_attempts - maximum number of attempts of an S3
+                    request with the adaptive retries (default: 5)
+            - metadata_cache - settings of the local disk cache for the
+                repository metainformation files (disabled if not set):
+                - path - directory to store the cached files
+                - max_size - maximum size of the cache in bytes
+                - ttl - time in seconds during which the cached file is
+                    not revalidated on S3
             - supported_repos - dictionary describing the supported
                 repositories, tarantool version, distributions...
+            - listing_cache - settings of the in-memory cache of the
+                directory listings (disabled if not set):
+                - max_entries - maximum number of the cached listings
+                    (default: 1000)
+                - ttl - time in seconds during which the cached listing is
+                    used (default: 60)
+            - popularity - tracking of the most requested paths used to
+                prewarm the caches (disabled if not set), see
+                "PopularityTracker" for the settings and:
+                - prewarm - number of the most requested files and
+                    directories to prewarm (default: "top_k")
+            - search_index - keep the in-memory search index of the
+                packages (True/False), see "search_packages"
+            - sync - settings of the synchronization workers:
+                - max_workers - maximum number of the repositories synced
+                    at the same time by all workers of the model
+                    (default: 20)
+                - class_limits - dictionary (priority class - "upload",
+                    "post" or "bulk" - to maximum number of the repositories
+                    of the class synced at the same time), default: 3/4 of
+                    "max_workers" for "bulk"
+                - aging_interval - time in seconds after which a waiting
+                    repository gets the priority of the next higher class
+                    (default: 300)
+                - startup_attempts - number of the failed attempts after
+                    which the synchronization of all repositories doesn't
+                    wait for the repository any more (default: 3)
+                - scratch_dir - directory for temporary files of "mkrepo"
+                    (default: current directory)
+                - min_free_space - minimum free space in the scratch
+                    directory in bytes to start the synchronization
+                - nice - niceness of "mkrepo"
+                - ionice_class - IO scheduling class of "mkrepo"
+                - memory_limit - limit of the "mkrepo" address space in bytes
+                - history_size - number of the synchronization jobs kept in
+                    the history of each repository (default: 20)
+                - history_path - file to persist the history of the
+                    synchronization jobs
+            - replication - replication of the repositories to the mirrors:
+                - mirrors - list of the settings of the mirror storages. The
+                    settings are merged with these ones, so it is enough to
+                    set the "bucket_name" for a bucket of the same S3 server.
+                - workers - number of the parallel copies (default: 8)
+                - checkpoint_path - file to persist the ETags of the
+                    replicated objects
+                - reconcile_interval - interval in seconds of the
+                    reconciliation of the mirrors (disabled if not set)
+            - retention - dictionary (repo kind to retention policy). The
+                policy is a dictionary with the following settings:
+                - keep_last - number of the newest builds of each package
+                    to keep
+        anchors - dictionary (anchor to list of paths), see "RepoIndex".
+        sync_budget - semaphore limiting the number of the repositories
+        synced at the same time by the models of all tenants together (not
+        limited if None), "sync.max_workers" is the share of this model.
         """
         self.s3_settings = s3_settings
-        self.s3_resource = boto3.resource(
-            service_name='s3',
-            region_name=self.s3_settings['region'],
-            endpoint_url=self.s3_settings['endpoint_url'],
-            aws_access_key_id=self.s3_settings['access_key_id'],
-            aws_secret_access_key=self.s3_settings['secret_access_key']
-        )
-        self.bucket = self.s3_resource.Bucket(self.s3_settings['bucket_name'])
-        self.s3_client = self.bucket.meta.client
-
-        # unsync_repos - set of repositories for which metainformation
-        # needs to be updated. All actions with "unsync_repos" must
-        # be done under the "sync_lock".
+        # repo_index - description of the supported repositories. It can be
+        # replaced at any moment (see "set_repo_index"), so it must be read
+        # once per operation.
+        self.repo_index = RepoIndex(self.s3_settings['supported_repos'], anchors or {})
+        # storage - the storage of the repositories (see "s3repo.storage").
+        self.storage = create_storage(self.s3_settings)
+
+        download_mode = self.s3_settings.get('download_mode') or 'proxy'
+        if download_mode not in DOWNLOAD_MODES:
+            raise RuntimeError('Unknown download mode: {0}.'.format(download_mode))
+        if download_mode == 'public' and not self.s3_settings.get('public_read'):
+            logging.warning('The "public" download mode is used, but the ' +
+                            '"public_read" option is disabled.')
+        self.s3_settings['download_mode'] = download_mode
+
+        # The repository metainformation files are requested by all the
+        # clients, so they are served from the local disk cache.
+        self.file_cache = None
+        cache_settings = self.s3_settings.get('metadata_cache')
+        if cache_settings:
+            self.file_cache = FileCache(cache_settings.get('path') or '.rws_cache',
+                                        int(cache_settings.get('max_size') or 256 * 1024**2),
+                                        int(cache_settings.get('ttl') or 10))
+
+        # The directory listings are cached in memory.
+        self.listing_cache = None
+        listing_cache_settings = self.s3_settings.get('listing_cache')
+        if listing_cache_settings:
+            self.listing_cache = ListingCache(
+                int(listing_cache_settings.get('max_entries') or 1000),
+                int(listing_cache_settings.get('ttl') or 60))
+
+        # The most requested files and directories are fetched to the caches
+        # at the start and after the synchronization (see "prewarm").
+        self.popularity = None
+        popularity_settings = self.s3_settings.get('popularity')
+        if popularity_settings:
+            self.popularity = PopularityTracker(popularity_settings)
+            self.prewarm_limit = int(popularity_settings.get('prewarm') or
+                                     self.popularity.top_k)
+            # Prefixes of the repositories to prewarm (see "_prewarm_worker").
+            # All actions with "prewarm_prefixes" must be done under
+            # the "prewarm_lock".
+            self.prewarm_prefixes = set()
+            self.prewarm_lock = Lock()
+            self.prewarm_wakeup = Event()
+
+        # The changes are replicated to the mirrors in the background.
+        self.replicator = None
+        replication_settings = self.s3_settings.get('replication') or {}
+        if replication_settings.get('mirrors'):
+            mirrors = [create_storage(dict(self.s3_settings, **mirror_settings))
+                       for mirror_settings in replication_settings['mirrors']]
+            base_path = (self.s3_settings.get('base_path') or '').strip('/')
+            self.replicator = Replicator(self.storage, mirrors, replication_settings,
+                                         base_path + '/' if base_path else '')
+
+        # The search index is built in the background and then updated
+        # together with the package files.
+        self.search_index = None
+        if self.s3_settings.get('search_index'):
+            self.search_index = PackageSearchIndex(self.s3_settings.get('base_path'))
+            search_index_thread = Thread(target=self.build_search_index)
+            search_index_thread.daemon = True
+            search_index_thread.start()
+
         self.sync_lock = Lock()
-        self.unsync_repos = set()
+        # Progress of the synchronization of all repositories
+        # (see "sync_all_repos"). sync_all_pending - dictionary (repository
+        # path to RepoInfo) of repositories which haven't been synced yet,
+        # sync_all_failures - dictionary (repository path to number of
+        # the failed attempts). Must be changed under the "sync_lock".
+        self.sync_all_pending = {}
+        self.sync_all_failures = {}
+        self.sync_all_status = {'state': 'idle', 'total': 0, 'synced': 0, 'failed': 0}
+        # Batches of the repositories enqueued by the patterns (see
+        # "resync_patterns"). sync_batches - ordered dictionary (batch ID to
+        # batch description), only the last SYNC_BATCHES_SIZE batches are
+        # kept. Must be changed under the "sync_lock".
+        self.sync_batches = OrderedDict()
+
+        # Resources available to the synchronization. The semaphore limits
+        # the number of "mkrepo" processes for all the workers together
+        # (the permanent one and the ones of "sync_all_repos"), the budget -
+        # for the models of all tenants (see "_acquire_sync_slot").
+        sync_settings = self.s3_settings.get('sync') or {}
+        max_workers = int(sync_settings.get('max_workers') or 20)
+        self.sync_semaphore = BoundedSemaphore(max_workers)
+        self.sync_budget = sync_budget
+        # Queue of the repositories for which metainformation needs to be
+        # updated. The repositories dirtied by the uploads are synced before
+        # the ones requested explicitly and the ones of the bulk
+        # synchronization, the bulk one can't occupy all the workers.
+        class_limits = {'bulk': max(1, max_workers * 3 // 4)}
+        class_limits.update(sync_settings.get('class_limits') or {})
+        self.sync_queue = SyncQueue(class_limits,
+                                    int(sync_settings.get('aging_interval') or 300))
+        self.scratch_dir = sync_settings.get('scratch_dir') or '.'
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self.min_free_space = int(sync_settings.get('min_free_space') or 0)
+        self.sync_cmd_prefix = S3AsyncModel._get_sync_cmd_prefix(sync_settings)
+        # History of the synchronization jobs.
+        self.sync_all_attempts = int(sync_settings.get('startup_attempts') or 3)
+        self.sync_history = SyncHistory(int(sync_settings.get('history_size') or 20),
+                                        sync_settings.get('history_path'))
 
         # A sync thread is required to update metainformation
         # in updated repositories.
@@ -83,6 +279,14 @@ class S3AsyncModel:
         self.sync_thread.daemon = True
         self.sync_thread.start()
 
+        if self.popularity:
+            # The caches are prewarmed by the separate thread, so the sync
+            # workers don't wait for the fetching of the files.
+            self._schedule_prewarm('')
+            self.prewarm_thread = Thread(target=self._prewarm_worker)
+            self.prewarm_thread.daemon = True
+            self.prewarm_thread.start()
+
     @staticmethod
     def _format_paths(dist_path, dist_version, dist_base, filename, product):
         """Formats the file path and repository path according
@@ -230,6 +434,14 @@ class S3AsyncModel:
 
         return items
 
+    @staticmethod
+    def _is_metadata_file(key):
+        """Checks if the file is a part of the repository metainformation
+        ("repodata" of the rpm-based and "dists" of the deb-based repositories).
+        """
+        key_list = key.split('/')
+        return 'repodata' in key_list[:-1] or 'dists' in key_list[:-1]
+
     def _get_gpg_key_by_series(self, tarantool_series):
         """Returns the GPG key ID according to "tarantool_series" of the repository."""
         gpg_sign_key = ''
@@ -240,11 +452,12 @@ class S3AsyncModel:
 
         return gpg_sign_key
 
-    def _get_deb_repo_info(self, base_path, gpg_key):
+    def _get_deb_repo_info(self, base_path, gpg_key, codenames=None):
         """Returns the RepoInfo list for a deb-based repository
         for updating metainformation with the 'mkrepo' tool.
         base_path(string) - path to the distribution.
         gpg_key(string) - gpg sign key ID.
+        codenames(list) - codenames to update (all if None).
         """
 
         # Actually, S3 doesn't use the term directory/path, it simply maps the
@@ -259,18 +472,15 @@ class S3AsyncModel:
         # level content by a specific prefix.
 
         path = base_path + '/'
-        list_objs = self.bucket.meta.client.list_objects_v2(
-            Bucket=self.bucket.name,
-            Delimiter='/',
-            Prefix=path
-        )
+        list_objs = self.storage.list_objects(path, delimiter='/')
         if list_objs.get('CommonPrefixes') is None:
             return []
 
         # In the case of a deb-base distribution, the meta information about
-        # packages in all versions of the distribution is updated together.
-        # So we just return the information related with distribution.
-        return [RepoInfo(path, gpg_key)]
+        # packages in all versions of the distribution is stored together.
+        # So we just return the information related with distribution
+        # (and the versions to update).
+        return [RepoInfo(path, gpg_key, codenames)]
 
     def _get_rpm_repo_info(self, base_path, gpg_key, dist_versions):
         """Returns the list of the paths to the rpm-based reposies
@@ -288,11 +498,7 @@ class S3AsyncModel:
         for ver in dist_versions:
             # Path to all repositories of the distribution version.
             common_path = '/'.join([base_path, ver]) + '/'
-            list_objs = self.bucket.meta.client.list_objects_v2(
-                Bucket=self.bucket.name,
-                Delimiter='/',
-                Prefix=common_path
-            )
+            list_objs = self.storage.list_objects(common_path, delimiter='/')
             dist_repos_list = list_objs.get('CommonPrefixes')
             if dist_repos_list is None:
                 continue
@@ -347,6 +553,147 @@ class S3AsyncModel:
 
         return repos_list
 
+    def _list_last_modified(self, prefix, key_regex=None):
+        """Returns the dictionary (the first component of the rest of the key
+        to the newest "LastModified" value) of the objects with the "prefix"
+        (and the rest of the key matching "key_regex" if set).
+        """
+        result = {}
+        for objects in self.storage.iter_objects(prefix):
+            for file_meta in objects.get('Contents') or []:
+                rest_of_key = file_meta['Key'][len(prefix):]
+                if key_regex and not re.fullmatch(key_regex, rest_of_key):
+                    continue
+                group = rest_of_key.split('/')[0]
+                if group not in result or result[group] < file_meta['LastModified']:
+                    result[group] = file_meta['LastModified']
+
+        return result
+
+    def _get_stale_repo(self, repo):
+        """Checks if the metainformation of the repository is out of date,
+        i.e. the newest object of the repository content ("Packages/" of the
+        rpm-based or "pool/<codename>/" of the deb-based repository) is newer
+        than the metainformation ("repodata/repomd.xml" or
+        "dists/<codename>/Release"). Returns the RepoInfo to synchronize
+        (limited to the stale codenames of the deb-based repository) or None.
+        """
+        # The base of the repository isn't known, so the rpm layout
+        # is checked first.
+        content_modified = self._list_last_modified(repo.path + 'Packages/')
+        if content_modified:
+            metadata_modified = self._list_last_modified(repo.path + 'repodata/',
+                                                         r'repomd\.xml')
+            if not metadata_modified or \
+                    max(content_modified.values()) > max(metadata_modified.values()):
+                return repo
+            return None
+
+        # In the case of a deb-based repository, the metainformation of
+        # each codename is updated separately.
+        content_modified = self._list_last_modified(repo.path + 'pool/')
+        metadata_modified = self._list_last_modified(repo.path + 'dists/', r'[^/]+/Release')
+        stale_codenames = [codename for codename, modified in content_modified.items()
+                           if codename not in metadata_modified or
+                           modified > metadata_modified[codename]]
+        if not stale_codenames:
+            return None
+
+        return RepoInfo(repo.path, repo.sign_key, stale_codenames)
+
+    def get_stale_repos(self, threads_num=20):
+        """Returns the list of repositories with out-of-date metainformation
+        (see "_get_stale_repo").
+        """
+        repos = self._get_repository_list()
+
+        # See the comment about the thread pool in "_get_repository_list".
+        with ThreadPool(processes=threads_num) as pool:
+            stale_repos = pool.map(self._get_stale_repo, repos)
+
+        return [repo for repo in stale_repos if repo is not None]
+
+    def enqueue_stale_repos(self):
+        """Add the repositories with out-of-date metainformation to the
+        unsync list. Returns the list of the added repositories.
+        """
+        stale_repos = self.get_stale_repos()
+        self._enqueue_repos(stale_repos, 'sweep')
+
+        return stale_repos
+
+    def _sweep_stale_repos(self, interval):
+        """Periodically add the repositories with out-of-date
+        metainformation to the unsync list.
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                stale_repos = self.enqueue_stale_repos()
+            except Exception as err:
+                logging.warning('Consistency sweep failed: ' + str(err))
+                continue
+            logging.info('Consistency sweep: %d repositories are out of date.',
+                         len(stale_repos))
+
+    def start_stale_sweeps(self, interval):
+        """Start the thread that checks the consistency of all repositories
+        every "interval" seconds.
+        """
+        sweep_thread = Thread(target=self._sweep_stale_repos, args=(interval,))
+        sweep_thread.daemon = True
+        sweep_thread.start()
+
+    def _list_repo_packages(self, repo):
+        """Returns the list of the keys of the package files of the repository
+        ("Packages/" of the rpm-based or "pool/" of the deb-based repository).
+        """
+        keys = []
+        for content_dir in ['Packages/', 'pool/']:
+            for objects in self.storage.iter_objects(repo.path + content_dir):
+                keys.extend(file_meta['Key'] for file_meta in objects.get('Contents') or [])
+
+        return keys
+
+    def _index_repo(self, repo):
+        """Replace the package files of the repository in the search index."""
+        self.search_index.replace_repo(repo.path, self._list_repo_packages(repo))
+
+    def build_search_index(self, threads_num=20):
+        """Fill in the search index by the package files of all repositories."""
+        try:
+            repos = self._get_repository_list()
+            # See the comment about the thread pool in "_get_repository_list".
+            with ThreadPool(processes=threads_num) as pool:
+                pool.map(self._index_repo, repos)
+        except Exception as err:
+            logging.warning("Can't build the search index: " + str(err))
+            self.search_index.state = 'failed'
+            return
+
+        self.search_index.state = 'ready'
+        logging.info('Search index has been built: %d files.',
+                     self.search_index.get_stats()['files'])
+
+    def _update_search_index(self, added_keys=(), removed_keys=()):
+        """Add and remove the package files in the search index (if enabled)."""
+        if self.search_index:
+            self.search_index.remove(removed_keys)
+            self.search_index.add(added_keys)
+
+    def search_packages(self, name_prefix='', min_version=None, max_version=None,
+                        filters=None, limit=None):
+        """Search the package files in the search index, see
+        "PackageSearchIndex.search". Returns the list of the PackageEntry.
+        """
+        if not self.search_index:
+            raise S3ModelRequestError('The search index is disabled.')
+        if self.search_index.state != 'ready':
+            raise RuntimeError('The search index is not ready: ' + self.search_index.state)
+
+        return self.search_index.search(name_prefix, min_version, max_version,
+                                        filters, limit)
+
     def _get_abs_path(self, path):
         """Get absolute (base_path + path) normalized path."""
 
@@ -363,20 +710,21 @@ class S3AsyncModel:
 
         abs_path = self._get_abs_path(path)
 
-        # Parameters for list_objects_v2():
-        # * "Bucket" is a bucket name.
-        # * "Delimiter" is a character you use to group keys.
-        # * "Prefix" limits the response to keys that begin with
-        # the specified prefix i.e. it allows to get files and
-        # subdiectories located only in directory specified by
-        # 'abs_path'.
-        #
-        # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.list_objects_v2
-        # for more detaied description.
-        list_parameters = {'Bucket': self.bucket.name,
-                           'Delimiter': '/',
-                           'Prefix': abs_path}
-        objects = self.s3_client.list_objects_v2(**list_parameters)
+        # The type is taken from the caches if possible, so the cached
+        # metainformation files and listings are served without listing
+        # the bucket.
+        if self.file_cache and self.file_cache.get_etag(abs_path) is not None:
+            return 'file'
+        if self.listing_cache and abs_path:
+            parent_items = self.listing_cache.get(os.path.dirname(abs_path)) or []
+            for item in parent_items:
+                if item.Name == os.path.basename(abs_path):
+                    return item.Type
+
+        # The "/" delimiter groups the keys, so only files and
+        # subdiectories located in the directory specified by
+        # 'abs_path' are listed (see "Storage").
+        objects = self.storage.list_objects(abs_path, delimiter='/')
         if not objects.get('CommonPrefixes'):
             if objects.get('KeyCount'):
                 # If we haven't "CommonPrefixes" then it isn't
@@ -390,7 +738,12 @@ class S3AsyncModel:
 
     def get_supported_repos(self):
         """Get description of the currently supported repos."""
-        return self.s3_settings['supported_repos']
+        return self.repo_index.supported_repos
+
+    def set_repo_index(self, repo_index):
+        """Replace the description of the supported repositories."""
+        self.repo_index = repo_index
+        self.s3_settings['supported_repos'] = repo_index.supported_repos
 
     def update_repo(self, repo_annotation):
         """Update all repositories according to the "repository annotation"."""
@@ -401,13 +754,14 @@ class S3AsyncModel:
                                  repo_annotation.tarantool_series,
                                  repo_annotation.dist)
 
-        dist_base = self.get_supported_repos()['distrs'][repo_annotation.dist]['base']
+        dist_base = self.repo_index.get_dist_base(repo_annotation.dist)
         gpg_key = self._get_gpg_key_by_series(repo_annotation.tarantool_series)
 
         if dist_base == 'rpm':
             repo_list = self._get_rpm_repo_info(dist_path, gpg_key, [repo_annotation.dist_version])
         elif dist_base == 'deb':
-            repo_list = self._get_deb_repo_info(dist_path, gpg_key)
+            repo_list = self._get_deb_repo_info(dist_path, gpg_key,
+                                                [repo_annotation.dist_version])
         else:
             raise RuntimeError('Unknown repository base: {0}.'.format(dist_base))
 
@@ -415,26 +769,162 @@ class S3AsyncModel:
             raise RuntimeError("Repository {0} doesn't exists".format(str(repo_annotation)))
 
         # Add the repositories to the unsync list.
+        self._enqueue_repos(repo_list, 'post')
+
+    def _get_dist_repo_info(self, kind, series, dist, dist_versions):
+        """Returns the RepoInfo list of the repositories of the given versions
+        of the distribution.
+        """
+        dist_path = os.path.join(self.s3_settings.get('base_path', ''), kind, series, dist)
+        gpg_key = self._get_gpg_key_by_series(series)
+        dist_base = self.repo_index.get_dist_base(dist)
+        if dist_base == 'rpm':
+            return self._get_rpm_repo_info(dist_path, gpg_key, dist_versions)
+        if dist_base == 'deb':
+            return self._get_deb_repo_info(dist_path, gpg_key, dist_versions)
+
+        raise RuntimeError('Unknown repository base: {0}.'.format(dist_base))
+
+    def resync_patterns(self, patterns):
+        """Update all repositories matching the patterns (see
+        "RepoIndex.match_pattern"). The repositories are enqueued in one batch.
+        Returns the batch description: dictionary with the batch "id",
+        the "patterns", the "created" time and the list of the "repos".
+        """
+        # dists - dictionary ((repo_kind, tarantool_series, dist) to list of
+        # the distribution versions).
+        repo_index = self.repo_index
+        dists = {}
+        for pattern in patterns:
+            for kind, series, dist, dist_version in repo_index.match_pattern(pattern):
+                dist_versions = dists.setdefault((kind, series, dist), [])
+                if dist_version not in dist_versions:
+                    dist_versions.append(dist_version)
+        if not dists:
+            raise S3ModelRequestError('No supported repositories match the patterns: ' +
+                                      ', '.join(patterns))
+
+        # See the comment about the thread pool in "_get_repository_list".
+        with ThreadPool(processes=min(20, len(dists))) as pool:
+            results = pool.starmap(self._get_dist_repo_info,
+                                   [dist + (dist_versions,)
+                                    for dist, dist_versions in dists.items()])
+        repo_list = [repo for repos in results for repo in repos]
+        if not repo_list:
+            raise S3ModelRequestError('No repositories match the patterns: ' +
+                                      ', '.join(patterns))
+
+        batch = {'id': uuid.uuid4().hex, 'patterns': list(patterns),
+                 'created': time.time(),
+                 'repos': sorted(repo.path for repo in repo_list)}
         self.sync_lock.acquire()
-        self.unsync_repos.update(repo_list)
+        self.sync_batches[batch['id']] = batch
+        while len(self.sync_batches) > SYNC_BATCHES_SIZE:
+            self.sync_batches.popitem(last=False)
         self.sync_lock.release()
 
-    def sync_all_repos(self):
-        """Update the metainformation of all known repositories."""
+        self._enqueue_repos(repo_list, 'post')
+
+        return batch
+
+    def get_sync_batch(self, batch_id):
+        """Returns the description of the batch (see "resync_patterns") with
+        the states of the repositories (see "SyncHistory.get_job_states") or
+        None if the batch is unknown.
+        """
+        self.sync_lock.acquire()
+        batch = self.sync_batches.get(batch_id)
+        self.sync_lock.release()
+        if batch is None:
+            return None
+
+        states = self.sync_history.get_job_states(batch['repos'], batch['created'])
+        done = sum(1 for state in states.values() if state == 'done')
+        return dict(batch, repos=states, total=len(states), done=done,
+                    state='done' if done == len(states) else 'running')
+
+    def _enqueue_repos(self, repos, trigger):
+        """Add the repositories to the unsync list.
+        trigger(string) - reason of the synchronization for the history.
+        """
+        repos = list(repos)
+        # The job is registered in the history before the repository is
+        # added to the queue, so the worker always finds it there.
+        for repo in repos:
+            self.sync_history.enqueued(repo.path, trigger)
+
+        # The priority class is determined by the trigger
+        # (see "SyncQueue").
+        for repo in repos:
+            self.sync_queue.put(repo, trigger)
+            # The package files of the repository have been changed.
+            if self.listing_cache:
+                self.listing_cache.invalidate(repo.path)
+
+    def get_sync_queue_size(self):
+        """Returns the number of repositories waiting for the synchronization."""
+        return len(self.sync_queue)
+
+    def get_sync_status(self, repo_prefix='', limit=None):
+        """Returns the queued and running synchronization jobs and the
+        recent history (see "SyncHistory.get_status") and the state of the
+        priority classes of the queue (see "SyncQueue.get_stats").
+        """
+        status = self.sync_history.get_status(repo_prefix, limit)
+        status['classes'] = self.sync_queue.get_stats()
+
+        return status
+
+    def sync_all_repos(self, threads_num=20, only_stale=False, trigger='startup'):
+        """Update the metainformation of all known repositories.
+        threads_num(int) - number of additional workers.
+        only_stale(bool) - update only the repositories with out-of-date
+        metainformation (see "_get_stale_repo").
+        trigger(string) - reason of the synchronization for the history.
+        """
+        self.sync_lock.acquire()
+        self.sync_all_status = {'state': 'running', 'total': 0, 'synced': 0, 'failed': 0}
+        self.sync_all_failures = {}
+        self.sync_lock.release()
+
+        try:
+            self._sync_all_repos(threads_num, only_stale, trigger)
+        except Exception as err:
+            # The state must not stay "running", otherwise the service is
+            # never reported as ready.
+            logging.error('Synchronization of all repositories failed: ' + str(err))
+            self.sync_lock.acquire()
+            self.sync_all_status['state'] = 'failed'
+            self.sync_all_status['error'] = str(err)
+            self.sync_lock.release()
+
+    def _sync_all_repos(self, threads_num, only_stale, trigger):
+        """Enqueue all known repositories and run the additional workers
+        (see "sync_all_repos").
+        """
         # Get the information about location of all the
         # repositories from the bucket.
-        repos_to_update = self._get_repository_list()
+        if only_stale:
+            repos_to_update = self.get_stale_repos(threads_num)
+        else:
+            repos_to_update = self._get_repository_list()
 
         # Add the repositories to the unsync list.
+        for repo in repos_to_update:
+            self.sync_history.enqueued(repo.path, trigger)
         self.sync_lock.acquire()
         for repo in repos_to_update:
-            self.unsync_repos.add(repo)
+            self.sync_queue.put(repo, trigger)
+            self.sync_all_pending[repo.path] = repo
+        self.sync_all_status['total'] = len(self.sync_all_pending)
+        if not self.sync_all_pending:
+            self.sync_all_status['state'] = 'done'
         self.sync_lock.release()
+        logging.info('Repositories to synchronize: %d', len(repos_to_update))
 
         # Add additional workers to update metainformation (approximate
         # number of repositories to be synced ~ 600).
         # 20 - the number up on the spot. Perhaps it will be corrected later.
-        threads_num = 20
         with ThreadPool(processes=threads_num) as pool:
             result_list = []
             for _ in range(0, threads_num):
@@ -443,79 +933,280 @@ class S3AsyncModel:
                 # Wait for all additional workers to complete.
                 res.wait()
 
+    def start_sync_all_repos(self, threads_num=20, only_stale=False):
+        """Update the metainformation of all known repositories in the
+        background. The progress can be got by "get_sync_all_status".
+        """
+        # The state is set before the thread starts, so the service isn't
+        # reported as ready until the synchronization is completed.
+        self.sync_lock.acquire()
+        self.sync_all_status = {'state': 'running', 'total': 0, 'synced': 0, 'failed': 0}
+        self.sync_lock.release()
+
+        sync_all_thread = Thread(target=self.sync_all_repos,
+                                 args=(threads_num, only_stale))
+        sync_all_thread.daemon = True
+        sync_all_thread.start()
+
+    def get_sync_all_status(self):
+        """Returns the progress of the synchronization of all repositories:
+        dictionary with the "state" ("idle", "running", "done" or "failed" if
+        the repositories can't be listed, the "error" is added then), "total"
+        number of the repositories, number of "synced" ones and "failed" ones
+        (failed "startup_attempts" times, they are still retried by the
+        permanent worker).
+        """
+        self.sync_lock.acquire()
+        status = dict(self.sync_all_status)
+        self.sync_lock.release()
+
+        return status
+
+    @staticmethod
+    def _get_sync_cmd_prefix(sync_settings):
+        """Returns the command prefix to run "mkrepo" with the limited
+        resources according to the sync settings.
+        """
+        cmd_prefix = []
+        wrappers = [
+            ('memory_limit', lambda value: ['prlimit', '--as={0}'.format(int(value))]),
+            ('ionice_class', lambda value: ['ionice', '-c', str(int(value))]),
+            ('nice', lambda value: ['nice', '-n', str(int(value))]),
+        ]
+        for setting, wrapper in wrappers:
+            value = sync_settings.get(setting)
+            if value is None:
+                continue
+            cmd = wrapper(value)
+            if shutil.which(cmd[0]) is None:
+                logging.warning('The "{0}" setting is ignored: "{1}" is not found.'.format(
+                    setting, cmd[0]))
+                continue
+            cmd_prefix.extend(cmd)
+
+        return cmd_prefix
+
+    def _has_scratch_space(self):
+        """Checks if there is enough free space in the scratch directory
+        to start the synchronization.
+        """
+        if not self.min_free_space:
+            return True
+
+        return shutil.disk_usage(self.scratch_dir).free >= self.min_free_space
+
+    def _is_deb_repo(self, repo_path):
+        """Checks if the repository ("base_path/kind/series/dist/") is
+        a deb-based one.
+        """
+        base_path = (self.s3_settings.get('base_path') or '').strip('/')
+        path_list = repo_path.strip('/').split('/')
+        if base_path:
+            path_list = path_list[len(base_path.split('/')):]
+        if len(path_list) != 3:
+            return False
+        try:
+            return self.repo_index.get_dist_base(path_list[2]) == 'deb'
+        except RuntimeError:
+            return False
+
+    def _sync_repo(self, sync_repo):
+        """Update a metainformation of the repository with the "mkrepo"
+        tool. Returns the exit code of "mkrepo". If the codenames of the
+        deb-based repository are set, only their metainformation is updated.
+        """
+        # Set the "Origin", "Label" and "Description" values
+        # that can be used for the deb repository.
+        env = dict(
+            os.environ,
+            MKREPO_DEB_ORIGIN='Tarantool',
+            MKREPO_DEB_LABEL='tarantool.org',
+            MKREPO_DEB_DESCRIPTION='Tarantool DBMS and Tarantool modules')
+
+        if sync_repo.codenames is None and not self._is_deb_repo(sync_repo.path):
+            mkrepo_cmd = ['mkrepo']
+        else:
+            # The deb-based repository is updated by the same "mkrepo" code,
+            # but the units of the deleted files are dropped from the indexes
+            # and only the indexes of the given codenames (if any) are updated
+            # (see "s3repo.debscope").
+            mkrepo_cmd = [sys.executable, '-m', 's3repo.debscope']
+            for codename in sorted(sync_repo.codenames or []):
+                mkrepo_cmd.extend(['--codename', codename])
+            root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            env['PYTHONPATH'] = os.pathsep.join(
+                [root_dir] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+
+        with tempfile.TemporaryDirectory(prefix='.rws_', dir=self.scratch_dir) as tmpdirname:
+            mkrepo_cmd = self.sync_cmd_prefix + mkrepo_cmd + [
+                '--temp-dir',
+                tmpdirname,
+            ]
+
+            if self.s3_settings.get('force_sync'):
+                mkrepo_cmd.append('--force')
+
+            # Include the package metainformation signature
+            # if we have a gpg key.
+            if sync_repo.sign_key:
+                mkrepo_cmd.append('--sign')
+                env = dict(env,
+                           GPG_SIGN_KEY=sync_repo.sign_key)
+
+            # Set the storage and the path to the repository.
+            mkrepo_cmd.extend(self.storage.get_mkrepo_args(sync_repo.path))
+
+            with sp.Popen(mkrepo_cmd, env=env) as mkrepo_ps:
+                return mkrepo_ps.wait()
+
+    def _acquire_sync_slot(self):
+        """Wait for a free slot to run "mkrepo". The share of the model is
+        taken first, so a tenant can't occupy the whole budget.
+        """
+        self.sync_semaphore.acquire()
+        if self.sync_budget is not None:
+            self.sync_budget.acquire()
+
+    def _release_sync_slot(self):
+        """Release the slot taken by "_acquire_sync_slot"."""
+        if self.sync_budget is not None:
+            self.sync_budget.release()
+        self.sync_semaphore.release()
+
     def sync(self, permanent):
-        """Update a metainformation of repositoties from the "unsync_repo" set.
+        """Update a metainformation of repositoties from the "sync_queue".
         permanent(bool) - describes whether the function should process data
         permanent or whether it can "return" if all current work has been
         completed.
         """
         logging.info('Start sync thread.')
         while True:
-            if self.unsync_repos:
-                self.sync_lock.acquire()
-                sync_repo = self.unsync_repos.pop()
-                self.sync_lock.release()
+            # The failing repositories are retried endlessly, so
+            # the temporary "worker" stops when the synchronization of all
+            # repositories is over and leaves them to the permanent one.
+            if not permanent and self.get_sync_all_status()['state'] != 'running':
+                logging.info('Stop sync thread.')
+                break
 
-                with tempfile.TemporaryDirectory(prefix='.rws_', dir='.') as tmpdirname:
-                    mkrepo_cmd = [
-                        'mkrepo',
-                        '--temp-dir',
-                        tmpdirname,
-                        '--s3-access-key-id',
-                        str(self.s3_settings['access_key_id']),
-                        '--s3-secret-access-key',
-                        str(self.s3_settings['secret_access_key']),
-                        '--s3-endpoint',
-                        str(self.s3_settings['endpoint_url']),
-                        '--s3-region',
-                        str(self.s3_settings['region']),
-                    ]
-
-                    if self.s3_settings.get('force_sync'):
-                        mkrepo_cmd.append('--force')
-                    if self.s3_settings.get('public_read'):
-                        mkrepo_cmd.append('--s3-public-read')
-
-                    # Set the "Origin", "Label" and "Description" values
-                    # that can be used for the deb repository.
-                    env = dict(
-                        os.environ,
-                        MKREPO_DEB_ORIGIN='Tarantool',
-                        MKREPO_DEB_LABEL='tarantool.org',
-                        MKREPO_DEB_DESCRIPTION='Tarantool DBMS and Tarantool modules')
-                    # Include the package metainformation signature
-                    # if we have a gpg key.
-                    if sync_repo.sign_key:
-                        mkrepo_cmd.append('--sign')
-                        env = dict(env,
-                                   GPG_SIGN_KEY=sync_repo.sign_key)
-
-                    # Set the path to the repository.
-                    mkrepo_cmd.append('s3://{0}/{1}'.format(
-                        self.s3_settings['bucket_name'],
-                        sync_repo.path))
-
-                    with sp.Popen(mkrepo_cmd, env=env) as mkrepo_ps:
-                        result = mkrepo_ps.wait()
-                        if result != 0:
-                            self.sync_lock.acquire()
-                            self.unsync_repos.add(sync_repo)
-                            self.sync_lock.release()
-                            logging.warning('Synchronization failed: ' + sync_repo.path)
-                        else:
-                            logging.info('Metainformation has been synced: ' + sync_repo.path)
-            elif permanent:
-                # The "unsync_repos" set is empty.
-                # Let's just wait a while.
-                time.sleep(5)
-            else:
+            # The number of the running "mkrepo" processes is limited
+            # for all the workers together.
+            self._acquire_sync_slot()
+
+            # The queue chooses the job by the priority class and the limits
+            # of the classes, so it can return nothing while some
+            # repositories are still waiting.
+            sync_job = self.sync_queue.take()
+            if sync_job is None:
+                self._release_sync_slot()
+                if permanent or len(self.sync_queue):
+                    # Let's wait until a repository is added or
+                    # a running job is finished.
+                    self.sync_queue.wait(5)
+                    continue
                 # This is a temporary "worker" and all current
                 # work has been completed.
                 logging.info('Stop sync thread.')
                 break
 
+            sync_repo = sync_job.repo
+            if not self._has_scratch_space():
+                self.sync_queue.done(sync_job)
+                self.sync_queue.put(sync_repo, 'retry', sync_job.sync_class)
+                self._release_sync_slot()
+                logging.warning('Not enough free space in the scratch directory, ' +
+                                'synchronization is postponed: ' + sync_repo.path)
+                time.sleep(5)
+                continue
+
+            self.sync_history.started(sync_repo.path)
+            try:
+                result = self._sync_repo(sync_repo)
+            except Exception as err:
+                # The worker must survive any error (for example, "mkrepo"
+                # can't be started), the job is retried as a failed one.
+                logging.error("Can't synchronize {0}: {1}".format(sync_repo.path, err))
+                result = -1
+            finally:
+                self.sync_queue.done(sync_job)
+                self._release_sync_slot()
+            self.sync_history.finished(sync_repo.path, result)
+            if result != 0:
+                # The failed job keeps its priority class.
+                self.sync_history.enqueued(sync_repo.path, 'retry')
+                self.sync_queue.put(sync_repo, 'retry', sync_job.sync_class)
+                logging.warning('Synchronization failed: ' + sync_repo.path)
+                self._report_sync_all(sync_repo, False)
+                continue
+
+            logging.info('Metainformation has been synced: ' + sync_repo.path)
+            if self.file_cache:
+                self.file_cache.invalidate(sync_repo.path)
+            if self.listing_cache:
+                self.listing_cache.invalidate(sync_repo.path)
+            if self.replicator:
+                self.replicator.add_repo_metadata(sync_repo.path)
+            if self.search_index:
+                # The repository content could be changed by other
+                # tools, so it is reindexed after each synchronization.
+                try:
+                    self._index_repo(sync_repo)
+                except Exception as err:
+                    logging.warning("Can't reindex the repository: " + str(err))
+            if self.popularity:
+                # The cached files and listings of the repository have been
+                # invalidated, the hot ones are fetched again.
+                self._schedule_prewarm(sync_repo.path)
+
+            self._report_sync_all(sync_repo, True)
+
+    def _report_sync_all(self, sync_repo, success):
+        """Report the result of the synchronization of the repository to
+        the progress of the synchronization of all repositories. The failed
+        repository is completed after "sync_all_attempts" attempts.
+        """
+        self.sync_lock.acquire()
+        # A job limited to other codenames of the deb-based
+        # repository doesn't complete the pending one.
+        pending_repo = self.sync_all_pending.get(sync_repo.path)
+        if pending_repo is None or not sync_repo.covers(pending_repo):
+            self.sync_lock.release()
+            return
+
+        if success:
+            self.sync_all_status['synced'] += 1
+        else:
+            failures = self.sync_all_failures.get(sync_repo.path, 0) + 1
+            self.sync_all_failures[sync_repo.path] = failures
+            if failures < self.sync_all_attempts:
+                self.sync_lock.release()
+                return
+            self.sync_all_status['failed'] += 1
+            logging.error('Synchronization of all repositories gave up on: ' +
+                          sync_repo.path)
+
+        del self.sync_all_pending[sync_repo.path]
+        logging.info('Synchronization of all repositories: %d/%d (%d failed)',
+                     self.sync_all_status['synced'] + self.sync_all_status['failed'],
+                     self.sync_all_status['total'], self.sync_all_status['failed'])
+        if not self.sync_all_pending:
+            self.sync_all_status['state'] = 'done'
+        self.sync_lock.release()
+
     def put_package(self, package):
-        """Load the package to S3."""
+        """Load the package to S3. The digests of the files are stored in
+        the "package.digests".
+        """
+        # Compute the digests and check them against the digests sent by
+        # the client before anything is uploaded.
+        for filename, file in package.files.items():
+            digests = self.storage.compute_digests(file)
+            for digest_type, expected in package.checksums.get(filename, {}).items():
+                if expected.lower() != digests[digest_type]:
+                    raise S3ModelRequestError(
+                        'The {0} checksum of the "{1}" file does not match.'.format(
+                            digest_type.upper(), filename))
+            package.digests[filename] = digests
+
         # Files already uploaded to S3.
         # Information from this dict is used to copy a file from
         # one repository to another if the file is already uploaded to S3.
@@ -533,18 +1224,17 @@ class S3AsyncModel:
                 dist_path_list.insert(0, self.s3_settings['base_path'])
 
             dist_path = '/'.join(dist_path_list)
-            dist_base = self.get_supported_repos()['distrs'][repo_annotation.dist]['base']
-
-            # Set the arguments of the uploaded files according to the settings.
-            extra_args = {}
-            if self.s3_settings.get('public_read'):
-                extra_args['ACL'] = 'public-read'
+            dist_base = self.repo_index.get_dist_base(repo_annotation.dist)
 
             gpg_sign_key = self._get_gpg_key_by_series(repo_annotation.tarantool_series)
+            # Only the metainformation of the distribution version is
+            # updated in the deb-based repository.
+            codenames = [repo_annotation.dist_version] if dist_base == 'deb' else None
 
             # List of repositories where the new package has been uploaded,
             # but the metainformation hasn't been updated yet.
             unsync_repos_local = set()
+            uploaded_keys = []
             for filename, file in package.files.items():
                 path_list = S3AsyncModel._format_paths(dist_path, repo_annotation.dist_version,
                                                        dist_base, filename, package.product)
@@ -553,38 +1243,284 @@ class S3AsyncModel:
                     # If a file needs to be uploaded to several repositories:
                     # it is uploaded to one of them, and then copied to others.
                     if filename in origin_files:
-                        # In the documentation
-                        # (https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Bucket.copy)
-                        # `Bucket.copy` uses `ExtraArgs` which only allow `ALLOWED_DOWNLOAD_ARGS`
-                        # (don't include `ACL`). But in fact `ALLOWED_COPY_ARGS` is used for copying
-                        # (https://github.com/boto/s3transfer/blob/279f82c6f9d01b19abf69d8fa08441c2064fba7f/s3transfer/manager.py#L381).
-                        # So, we can use `ACL` in `ExtraArgs`.
-                        self.bucket.copy(origin_files[filename], path, ExtraArgs=extra_args)
+                        # The metadata is set explicitly, because the
+                        # multipart copy doesn't copy it.
+                        self.storage.copy_object(
+                            origin_files[filename], path,
+                            metadata={'md5': package.digests[filename]['md5'],
+                                      'sha256': package.digests[filename]['sha256']})
                     else:
-                        obj = self.bucket.Object(path)
-                        obj.upload_fileobj(file, ExtraArgs=extra_args)
-                        origin_files[filename] = {
-                            'Bucket': self.bucket.name,
-                            'Key': path
-                        }
+                        file.seek(0)
+                        try:
+                            self.storage.put_object(path, file, package.digests[filename])
+                        except StorageIntegrityError as err:
+                            raise S3ModelRequestError(str(err))
+                        origin_files[filename] = path
+                    uploaded_keys.append(path)
 
                     # Several files can be uploaded to the same repo.
                     # Let's add the repo to the local "unsync_repos" set
                     # and merge it with the global one after the end of
                     # the iteration.
-                    unsync_repos_local.add(RepoInfo(repo_path, gpg_sign_key))
+                    unsync_repos_local.add(RepoInfo(repo_path, gpg_sign_key, codenames))
+
+            self._update_search_index(added_keys=uploaded_keys)
+            # The package files are replicated before the metainformation
+            # referring to them is synchronized.
+            if self.replicator:
+                self.replicator.add_objects(uploaded_keys)
+            self._enqueue_repos(unsync_repos_local, 'upload')
+
+    def _plan_promotion(self, repo_annotation, target_kind, patterns):
+        """Returns the list of copies (tuples (source key, target repo path,
+        target key)) to promote the packages matching the "patterns" from the
+        repository described by "repo_annotation" to the "target_kind" one.
+        """
+        base_path = self.s3_settings.get('base_path', '')
+        dist_path_list = [
+            repo_annotation.repo_kind,
+            repo_annotation.tarantool_series,
+            repo_annotation.dist
+        ]
+        if base_path:
+            dist_path_list.insert(0, base_path)
+        source_dist_path = '/'.join(dist_path_list)
+        dist_path_list[-3] = target_kind
+        target_dist_path = '/'.join(dist_path_list)
+        dist_base = self.repo_index.get_dist_base(repo_annotation.dist)
+
+        # Example of the package file in the rpm-based repository:
+        # .../live/1.10/fedora/31/x86_64/Packages/filename
+        # Example of the package file in the deb-based repository:
+        # .../live/1.10/ubuntu/pool/disco/main/s/small/filename
+        if dist_base == 'rpm':
+            prefix = '/'.join([source_dist_path, repo_annotation.dist_version]) + '/'
+            key_regex = r'[^/]+/Packages/[^/]+'
+        else:
+            prefix = '/'.join([source_dist_path, 'pool', repo_annotation.dist_version]) + '/'
+            key_regex = r'main/[^/]+/[^/]+/[^/]+'
+
+        # source_files - dictionary (filename to tuple (key, product)).
+        # The "noarch" packages are placed in several repositories, but they
+        # will be placed in all of them by "_format_paths" anyway.
+        source_files = {}
+        for objects in self.storage.iter_objects(prefix):
+            for file_meta in objects.get('Contents') or []:
+                key = file_meta['Key']
+                if not re.fullmatch(key_regex, key[len(prefix):]):
+                    continue
+                key_list = key.split('/')
+                filename = key_list[-1]
+                if filename in source_files or \
+                        not any(fnmatch.fnmatchcase(filename, pattern) for pattern in patterns):
+                    continue
+                product = key_list[-2] if dist_base == 'deb' else ''
+                source_files[filename] = (key, product)
+
+        plan = []
+        for filename, (key, product) in sorted(source_files.items()):
+            path_list = S3AsyncModel._format_paths(target_dist_path,
+                                                   repo_annotation.dist_version,
+                                                   dist_base, filename, product)
+            for repo_path, path in path_list:
+                plan.append((key, repo_path, path))
+
+        return plan
+
+    def promote_packages(self, repo_annotation, target_kind, patterns, dry_run=False):
+        """Copy the packages matching the "patterns" (glob) from the repository
+        described by "repo_annotation" to the repository of the "target_kind"
+        kind using server-side copies. The target repositories are added to
+        the unsync list. Returns the list of tuples (source key, target key).
+        """
+        if target_kind not in self.repo_index.repo_kinds:
+            raise S3ModelRequestError('Repo kind "' + target_kind + '" is not supported.')
+        if target_kind == repo_annotation.repo_kind:
+            raise S3ModelRequestError('The source and target repositories are the same.')
+
+        plan = self._plan_promotion(repo_annotation, target_kind, patterns)
+        if not plan:
+            raise S3ModelRequestError('No packages match the patterns.')
+        if dry_run:
+            return [(source_key, target_key) for source_key, _, target_key in plan]
+
+        # The copies are performed by S3, so the workers are waiting for
+        # the responses most of the time.
+        # See the comment about the thread pool in "_get_repository_list".
+        with ThreadPool(processes=20) as pool:
+            pool.starmap(self.storage.copy_object,
+                         [(source_key, target_key) for source_key, _, target_key in plan])
+        self._update_search_index(added_keys=[target_key for _, _, target_key in plan])
+        if self.replicator:
+            self.replicator.add_objects([target_key for _, _, target_key in plan])
 
-            self.sync_lock.acquire()
-            self.unsync_repos.update(unsync_repos_local)
-            self.sync_lock.release()
+        gpg_sign_key = self._get_gpg_key_by_series(repo_annotation.tarantool_series)
+        codenames = None
+        if self.repo_index.get_dist_base(repo_annotation.dist) == 'deb':
+            codenames = [repo_annotation.dist_version]
+        self._enqueue_repos({RepoInfo(repo_path, gpg_sign_key, codenames)
+                             for _, repo_path, _ in plan}, 'promote')
+
+        return [(source_key, target_key) for source_key, _, target_key in plan]
 
     def get_package(self, package):
         """Download a package from S3."""
         NotImplementedError("get_package hasn't been implemented yet.")
 
+    def _get_repo_info_by_key(self, key):
+        """Returns the RepoInfo of the repository containing the package
+        file with the "key".
+        """
+        base_path = (self.s3_settings.get('base_path') or '').strip('/')
+        path_list = key.split('/')
+        if base_path:
+            base_path_list = base_path.split('/')
+            if path_list[:len(base_path_list)] != base_path_list:
+                raise S3ModelRequestError('The file is outside the repositories.')
+            path_list = path_list[len(base_path_list):]
+
+        err_msg = 'The "{0}" file is not a package file.'.format(key)
+        if len(path_list) < 5:
+            raise S3ModelRequestError(err_msg)
+        try:
+            dist_base = self.repo_index.get_dist_base(path_list[2])
+        except RuntimeError:
+            raise S3ModelRequestError(err_msg)
+
+        # Example of the package file in the rpm-based repository:
+        # .../live/1.10/fedora/31/x86_64/Packages/filename
+        # Example of the package file in the deb-based repository:
+        # .../live/1.10/ubuntu/pool/disco/main/s/small/filename
+        codenames = None
+        if dist_base == 'rpm' and len(path_list) == 7 and path_list[5] == 'Packages':
+            repo_path_list = path_list[:5]
+        elif dist_base == 'deb' and path_list[3] == 'pool':
+            repo_path_list = path_list[:3]
+            codenames = [path_list[4]]
+        else:
+            raise S3ModelRequestError(err_msg)
+
+        if base_path:
+            repo_path_list.insert(0, base_path)
+
+        return RepoInfo('/'.join(repo_path_list),
+                        self._get_gpg_key_by_series(path_list[1]), codenames)
+
+    def _replicate_deletions(self, repo_keys):
+        """Delete the package files from the mirrors (if any) after the
+        synchronization of their repositories.
+        repo_keys - dictionary (repository path to list of deleted keys).
+        """
+        if self.replicator:
+            for repo_path, keys in repo_keys.items():
+                self.replicator.delete_objects(repo_path, keys)
+
     def delete_package(self, package):
-        """Delete a package from S3."""
-        NotImplementedError("delete_package hasn't been implemented yet.")
+        """Delete a package from S3. Only names of the files are used."""
+        keys = []
+        # repo_keys - dictionary (repository path to list of deleted keys).
+        repo_keys = {}
+        unsync_repos_local = set()
+        for repo_annotation in package.repo_annotations:
+            dist_path_list = [
+                repo_annotation.repo_kind,
+                repo_annotation.tarantool_series,
+                repo_annotation.dist
+            ]
+            if self.s3_settings.get('base_path', ''):
+                dist_path_list.insert(0, self.s3_settings['base_path'])
+
+            dist_path = '/'.join(dist_path_list)
+            dist_base = self.repo_index.get_dist_base(repo_annotation.dist)
+            gpg_sign_key = self._get_gpg_key_by_series(repo_annotation.tarantool_series)
+            codenames = [repo_annotation.dist_version] if dist_base == 'deb' else None
+
+            for filename in package.files:
+                path_list = S3AsyncModel._format_paths(dist_path, repo_annotation.dist_version,
+                                                       dist_base, filename, package.product)
+                for repo_path, path in path_list:
+                    repo = RepoInfo(repo_path, gpg_sign_key, codenames)
+                    keys.append(path)
+                    repo_keys.setdefault(repo.path, []).append(path)
+                    unsync_repos_local.add(repo)
+
+        self.storage.delete_objects(keys)
+        self._update_search_index(removed_keys=keys)
+        self._replicate_deletions(repo_keys)
+        self._enqueue_repos(unsync_repos_local, 'delete')
+
+        return keys
+
+    def _get_prune_keys(self, repo, keep_last):
+        """Returns the list of the package files of the repository that
+        should be deleted according to the retention policy.
+        """
+        # builds - dictionary ((directory, package name) to dictionary
+        # (build to list of objects)).
+        builds = {}
+        for content_dir in ['Packages/', 'pool/']:
+            prefix = repo.path + content_dir
+            for objects in self.storage.iter_objects(prefix):
+                for file_meta in objects.get('Contents') or []:
+                    directory, _, filename = file_meta['Key'].rpartition('/')
+                    parsed_filename = parse_package_filename(filename)
+                    if parsed_filename is None:
+                        continue
+                    name, build = parsed_filename
+                    builds.setdefault((directory, name), {}).setdefault(
+                        build, []).append(file_meta)
+
+        keys = []
+        for package_builds in builds.values():
+            # The builds are ordered by their newest file.
+            ordered_builds = sorted(
+                package_builds.values(),
+                key=lambda files: max(file_meta['LastModified'] for file_meta in files),
+                reverse=True)
+            for files in ordered_builds[keep_last:]:
+                keys.extend(file_meta['Key'] for file_meta in files)
+
+        return keys
+
+    def prune_repos(self, repo_kind=None, dry_run=False):
+        """Delete the old builds of the packages according to the retention
+        policy of the repo kind ("retention" setting). Each affected
+        repository is added to the unsync list once.
+        repo_kind(string) - prune only the repositories of this kind.
+        dry_run(bool) - only return the files that would be deleted.
+        Returns the dictionary (repository path to list of deleted files).
+        """
+        retention = self.s3_settings.get('retention') or {}
+        base_path = (self.s3_settings.get('base_path') or '').strip('/')
+        kind_position = len(base_path.split('/')) if base_path else 0
+
+        repos = []
+        for repo in self._get_repository_list():
+            kind = repo.path.split('/')[kind_position]
+            if repo_kind and kind != repo_kind:
+                continue
+            if retention.get(kind, {}).get('keep_last'):
+                repos.append((repo, int(retention[kind]['keep_last'])))
+
+        # See the comment about the thread pool in "_get_repository_list".
+        with ThreadPool(processes=20) as pool:
+            prune_keys = pool.starmap(self._get_prune_keys, repos)
+
+        result = {}
+        for (repo, _), keys in zip(repos, prune_keys):
+            if keys:
+                result[repo.path] = keys
+        if dry_run or not result:
+            return result
+
+        self.storage.delete_objects(key for keys in result.values() for key in keys)
+        self._update_search_index(
+            removed_keys=[key for keys in result.values() for key in keys])
+        self._replicate_deletions(result)
+
+        self._enqueue_repos([repo for repo, _ in repos if repo.path in result], 'prune')
+
+        return result
 
     def get_directory(self, path):
         """Get lists and metadata of directories and files within
@@ -592,61 +1528,151 @@ class S3AsyncModel:
         """
 
         abs_path = self._get_abs_path(path)
+        if self.popularity:
+            self.popularity.record('directory', abs_path)
 
-        # Parameters for list_objects_v2():
-        # * "Bucket" is a bucket name.
-        # * "Delimiter" is a character you use to group keys.
-        # * "MaxKeys" sets the maximum number of keys returned in
-        # the response. By default the action returns up to 1,000
-        # key names. The response might contain fewer keys but will
-        # never contain more.
-        # * "Prefix" limits the response to keys that begin with
-        # the specified prefix i.e. it allows to get files and
-        # subdiectories located only in directory specified by
-        # 'abs_path'.
-        #
-        # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.list_objects_v2
-        # for more detaied description.
-        list_parameters = {'Bucket': self.bucket.name,
-                           'Delimiter': '/',
-                           'MaxKeys': 1,
-                           'Prefix': abs_path}
+        return self._get_listing(abs_path)
+
+    def _get_listing(self, abs_path):
+        """Returns the list of the items of the directory (through the cache
+        of the listings if it is enabled).
+        """
+        if self.listing_cache:
+            items = self.listing_cache.get(abs_path)
+            if items is not None:
+                return items
+
+        # The "/" delimiter groups the keys, so only files and
+        # subdiectories located in the directory specified by
+        # 'abs_path' are listed (see "Storage").
 
         # Check the existence of the directory.
         # https://stackoverflow.com/a/68910145
-        objects = self.s3_client.list_objects_v2(**list_parameters)
+        objects = self.storage.list_objects(abs_path, delimiter='/', max_keys=1)
         if not 'CommonPrefixes' in objects:
             raise RuntimeError('No such directory.')
 
-        # Get all objects from the directory.
-        list_parameters['MaxKeys'] = 1000
         # To get the "content" of the directory, we must add "/" at the end of the path.
         if abs_path != '':
             abs_path = abs_path + '/'
-        list_parameters['Prefix'] = abs_path
-
-        paginator = self.s3_client.get_paginator('list_objects_v2')
 
         items = []
-        for objects in paginator.paginate(**list_parameters):
+        for objects in self.storage.iter_objects(abs_path, delimiter='/'):
             items.extend(S3AsyncModel._objects_to_items(objects))
 
+        if self.listing_cache:
+            self.listing_cache.put(abs_path.rstrip('/'), items)
         return items
 
+    def prewarm(self, prefix=''):
+        """Fetch the most requested metainformation files and directory
+        listings (see "PopularityTracker") inside the "prefix" to the caches
+        before the clients ask for them. The listings of the directories
+        containing the "prefix" are fetched too.
+        """
+        warmed = 0
+        if self.file_cache:
+            for key, _ in self.popularity.get_top('file', self.prewarm_limit):
+                if not key.startswith(prefix) or not S3AsyncModel._is_metadata_file(key):
+                    continue
+                try:
+                    self._get_cached_file(key).close()
+                    warmed += 1
+                except Exception as err:
+                    logging.debug("Can't prewarm {0}: {1}".format(key, err))
+
+        if self.listing_cache:
+            for path, _ in self.popularity.get_top('directory', self.prewarm_limit):
+                if not path.startswith(prefix) and not prefix.startswith(path):
+                    continue
+                try:
+                    self._get_listing(path)
+                    warmed += 1
+                except Exception as err:
+                    logging.debug("Can't prewarm {0}: {1}".format(path, err))
+
+        logging.info('Prewarmed %d files and directories: %s', warmed, prefix or '/')
+
+    def _schedule_prewarm(self, prefix):
+        """Add the prefix to the prewarming queue (see "_prewarm_worker")."""
+        with self.prewarm_lock:
+            self.prewarm_prefixes.add(prefix)
+        self.prewarm_wakeup.set()
+
+    def _prewarm_worker(self):
+        """Prewarm the caches for the scheduled prefixes. The prefixes
+        scheduled while the caches are being prewarmed are merged.
+        """
+        while True:
+            self.prewarm_wakeup.wait()
+            self.prewarm_wakeup.clear()
+            with self.prewarm_lock:
+                prefixes = self.prewarm_prefixes
+                self.prewarm_prefixes = set()
+
+            for prefix in sorted(prefixes):
+                try:
+                    self.prewarm(prefix)
+                except Exception as err:
+                    logging.error("Can't prewarm the caches {0}: {1}".format(
+                        prefix or '/', err))
+
+    def get_popular(self, kind='file', limit=None):
+        """Returns the most requested paths of the kind (see
+        "PopularityTracker.get_top").
+        """
+        if self.popularity is None:
+            raise S3ModelRequestError('The popularity tracking is disabled.')
+        if kind not in POPULARITY_KINDS:
+            raise S3ModelRequestError('Unknown kind: ' + kind)
+
+        return self.popularity.get_top(kind, limit)
+
+    def _get_cached_file(self, key):
+        """Get a file through the local disk cache. Returns an opened
+        local file or a "StreamingBody" object if the file can't be cached.
+        """
+        if self.file_cache.is_fresh(key):
+            cached_file = self.file_cache.open(key)
+            if cached_file:
+                return cached_file
+
+        # Revalidate the cached file. The storage returns None if the
+        # object hasn't been changed.
+        response = self.storage.get_object(key, if_none_match=self.file_cache.get_etag(key))
+        if response is None:
+            self.file_cache.touch(key)
+            cached_file = self.file_cache.open(key)
+            if cached_file:
+                return cached_file
+            # The entry has been evicted in the meantime.
+            response = self.storage.get_object(key)
+
+        if response['ContentLength'] > self.file_cache.max_size:
+            return response['Body']
+
+        self.file_cache.put(key, response['ETag'], response['Body'])
+        return self.file_cache.open(key) or self.storage.get_object(key)['Body']
+
     def get_file(self, path):
         """Get a file from S3 as a "StreamingBody" object.
         See https://botocore.amazonaws.com/v1/documentation/api/latest/reference/response.html#botocore.response.StreamingBody
+        The metainformation files are returned as opened local files if the
+        local disk cache is enabled.
         """
 
+        key = self._get_abs_path(path)
+        if self.popularity:
+            self.popularity.record('file', key)
         try:
+            if self.file_cache and S3AsyncModel._is_metadata_file(key):
+                return self._get_cached_file(key)
+
             # We suppose that files which we deal with are not
             # large enough and the fit in RAM.
-            response = self.s3_client.get_object(Bucket=self.bucket.name,
-                                                 Key=self._get_abs_path(path))
-        except self.s3_client.exceptions.NoSuchKey:
+            response = self.storage.get_object(key)
+        except StorageNoSuchKeyError:
             raise RuntimeError("No such key.")
-        except self.s3_client.exceptions.InvalidObjectState:
-            raise RuntimeError("Invalid object state.")
 
         # "Body" is a data or a requested file itself.
         #
@@ -654,6 +1680,35 @@ class S3AsyncModel:
         # for more detaied description.
         return response.get('Body')
 
+    def get_file_url(self, path):
+        """Get a URL to download the file directly from S3 according to
+        the download mode. Returns None in the "proxy" mode, that means the
+        file should be sent to the client by RWS.
+        """
+        download_mode = self.s3_settings['download_mode']
+        if download_mode == 'proxy':
+            return None
+
+        key = self._get_abs_path(path)
+        if self.popularity:
+            self.popularity.record('file', key)
+        return self.storage.get_url(
+            key, download_mode,
+            int(self.s3_settings.get('presigned_url_expiration') or 300))
+
     def delete_file(self, path):
-        """Delete a file from S3."""
-        NotImplementedError("delete_file hasn't been implemented yet.")
+        """Delete a package file from S3 and add its repository to the
+        unsync list.
+        """
+        key = self._get_abs_path(path)
+        repo = self._get_repo_info_by_key(key)
+
+        objects = self.storage.list_objects(key, max_keys=1)
+        contents = objects.get('Contents') or []
+        if not contents or contents[0].get('Key') != key:
+            raise S3ModelRequestError('No such file.')
+
+        self.storage.delete_objects([key])
+        self._update_search_index(removed_keys=[key])
+        self._replicate_deletions({repo.path: [key]})
+        self._enqueue_repos([repo], 'delete')
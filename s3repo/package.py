@@ -1,5 +1,44 @@
 """Description of the uploaded package."""
 
+import re
+
+
+# Suffixes of the files of the deb-based repositories
+# (see https://wiki.debian.org/DebianRepository/Format).
+DEB_SUFFIXES = ('.orig.tar.xz', '.orig.tar.gz', '.debian.tar.xz',
+                '.debian.tar.gz', '.tar.xz', '.tar.gz', '.deb', '.dsc')
+
+
+def parse_package_filename(filename):
+    """Parse the name of the package file. Returns a tuple (name, build) or
+    None if the file name can't be parsed. "build" identifies all the files
+    built from the same version of the package.
+
+    Examples:
+        tarantool-2.10.0-1.el7.x86_64.rpm -> (tarantool, 2.10.0-1.el7)
+        tarantool_2.10.0-1_amd64.deb -> (tarantool, 2.10.0)
+        tarantool_2.10.0.orig.tar.xz -> (tarantool, 2.10.0)
+    """
+    # name-version-release.arch.rpm
+    match = re.fullmatch(
+        r'(?P<name>.+)-(?P<version>[^-]+-[^-]+)\.[^.]+\.rpm', filename)
+    if match:
+        return match.group('name'), match.group('version')
+
+    for suffix in DEB_SUFFIXES:
+        if filename.endswith(suffix):
+            # name_version[_arch].suffix
+            match = re.fullmatch(r'(?P<name>[^_]+)_(?P<version>[^_]+)(_[^_]+)?',
+                                 filename[:-len(suffix)])
+            if not match:
+                return None
+            # The source and binary files of the package have the same
+            # upstream version, but the "orig" tarball has no debian revision.
+            return match.group('name'), match.group('version').rsplit('-', 1)[0]
+
+    return None
+
+
 class Package:
     """Description of the uploaded package."""
 
@@ -11,6 +50,12 @@ class Package:
         self.product = ''
         # Files to upload.
         self.files = {}
+        # Digests of the files sent by the client: dictionary (filename to
+        # dictionary (digest type ("md5" or "sha256") to hex digest)).
+        self.checksums = {}
+        # Digests of the uploaded files (filled in by the model): dictionary
+        # (filename to dictionary with "md5" and "sha256" hex digests).
+        self.digests = {}
 
     def add_file(self, file_type, file):
         """Add a file to Package."""
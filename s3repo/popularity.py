@@ -0,0 +1,250 @@
+"""Tracking of the popularity of the requested files and directories."""
+
+from collections import Counter
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from threading import local
+from threading import current_thread
+from threading import Lock
+from threading import Thread
+
+
+# Kinds of the tracked paths:
+# * "file" - the downloaded file.
+# * "directory" - the listed directory.
+# * "prefix" - the directory containing the requested file or directory
+#   (at any level), used to find the hot repositories.
+POPULARITY_KINDS = ('file', 'directory', 'prefix')
+
+
+class CountMinSketch:
+    """CountMinSketch - approximate counters of the keys in the fixed
+    memory. The estimate is never less than the real count and exceeds it
+    only on the hash collisions.
+    """
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _get_indexes(self, key):
+        """Returns the index of the counter of the key in each row."""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * row:4 * row + 4], 'little') % self.width
+                for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """Increase the counter of the key. Returns the new estimate."""
+        estimate = None
+        for row, index in zip(self.rows, self._get_indexes(key)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+
+        return estimate
+
+    def decay(self):
+        """Halve all the counters, so the old requests weigh less."""
+        for row in self.rows:
+            for index, value in enumerate(row):
+                row[index] = value >> 1
+
+
+class PopularityTracker:
+    """PopularityTracker - approximate top of the most requested files,
+    directories and prefixes.
+
+    The requests are counted by the count-min sketch, the candidates of
+    the top (the heavy hitters) are kept in the bounded table: a path gets
+    there only if its estimate is greater than the minimum of the table, so
+    the one-off requests (for example, of the crawlers) don't push out the
+    hot paths. The requests are collected in the buffer of each thread
+    and counted by batches of "batch_size" records (the same paths are
+    counted at once), so the lock is taken rarely on the hot path. The
+    buffers of all threads are also counted before the top is read and
+    before each snapshot, so the requests of the idle threads aren't lost.
+    Only the "sample_rate" part of the requests is recorded. The counters
+    are halved after each snapshot, so the top follows the recent traffic.
+    All actions with "sketch", "candidates" and "thread_buffers" and the
+    removal of the records from the buffers must be done under the "lock".
+    """
+
+    def __init__(self, settings):
+        """settings - dictionary:
+            - top_k - size of the top of each kind (default: 100)
+            - sample_rate - part of the counted requests (default: 1.0)
+            - batch_size - number of the requests collected by a thread
+                before they are counted (default: 256)
+            - snapshot_path - file to persist the top (not persisted if
+                not set)
+            - snapshot_interval - interval in seconds between the snapshots
+                and the decays of the counters (default: 300)
+        """
+        self.top_k = int(settings.get('top_k') or 100)
+        sample_rate = settings.get('sample_rate')
+        self.sample_rate = 1.0 if sample_rate is None else float(sample_rate)
+        if not 0 <= self.sample_rate <= 1:
+            raise RuntimeError('The popularity sample rate must be in [0, 1].')
+        self.batch_size = int(settings.get('batch_size') or 256)
+        self.snapshot_path = settings.get('snapshot_path')
+        self.snapshot_interval = int(settings.get('snapshot_interval') or 300)
+        # Several times more candidates than the top are kept, so the paths
+        # near the boundary of the top aren't lost.
+        self.capacity = self.top_k * 4
+
+        self.lock = Lock()
+        self.sketch = CountMinSketch()
+        # candidates - dictionary (kind to dictionary (path to estimate)).
+        self.candidates = {kind: {} for kind in POPULARITY_KINDS}
+        # min_estimates - dictionary (kind to the minimum estimate of the
+        # full table of the candidates).
+        self.min_estimates = {kind: 0 for kind in POPULARITY_KINDS}
+        # buffers - the buffer of the requests of each thread (list of the
+        # (kind, path) pairs), the records are appended by its thread only.
+        self.buffers = local()
+        # thread_buffers - list of (thread, buffer) pairs of all threads.
+        self.thread_buffers = []
+        self._load_snapshot()
+
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _load_snapshot(self):
+        """Load the top from the snapshot file."""
+        if not self.snapshot_path or not os.path.isfile(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError) as err:
+            logging.warning("Can't load the popularity snapshot: " + str(err))
+            return
+
+        with self.lock:
+            for kind in POPULARITY_KINDS:
+                for path, count in snapshot.get(kind) or []:
+                    self._add(kind, path, count)
+
+    def _save_snapshot(self):
+        """Write the candidates of the top to the snapshot file."""
+        # The counts are saved unscaled, they are loaded to the sketch as is.
+        with self.lock:
+            snapshot = {kind: sorted(candidates.items(), key=lambda item: -item[1])
+                        for kind, candidates in self.candidates.items()}
+        snapshot['created'] = time.time()
+
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as err:
+            logging.warning("Can't persist the popularity snapshot: " + str(err))
+
+    def _add(self, kind, path, count=1):
+        """Count the path. Must be called under the "lock"."""
+        estimate = self.sketch.add(kind + ':' + path, count)
+        candidates = self.candidates[kind]
+        if path in candidates or len(candidates) < self.capacity:
+            candidates[path] = estimate
+        elif estimate > self.min_estimates[kind]:
+            del candidates[min(candidates, key=candidates.get)]
+            candidates[path] = estimate
+        else:
+            return
+
+        if len(candidates) >= self.capacity:
+            self.min_estimates[kind] = min(candidates.values())
+
+    def record(self, kind, path):
+        """Record the request of the file or directory ("kind"). The request
+        is counted with the next batch of the thread.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        buffer = getattr(self.buffers, 'records', None)
+        if buffer is None:
+            buffer = self.buffers.records = []
+            with self.lock:
+                self.thread_buffers.append((current_thread(), buffer))
+        buffer.append((kind, path))
+        if len(buffer) >= self.batch_size:
+            with self.lock:
+                self._count(buffer)
+
+    def flush(self):
+        """Count the buffered requests of all threads. The buffers of
+        the finished threads are forgotten.
+        """
+        with self.lock:
+            alive_buffers = []
+            for thread, buffer in self.thread_buffers:
+                self._count(buffer)
+                if thread.is_alive():
+                    alive_buffers.append((thread, buffer))
+            self.thread_buffers = alive_buffers
+
+    def _count(self, buffer):
+        """Count the buffered requests (list of the (kind, path) pairs) of
+        the files or directories and of all the directories containing them
+        and empty the buffer. Must be called under the "lock".
+        """
+        # The thread can append new records at the same time, they are
+        # left in the buffer.
+        records = buffer[:]
+        del buffer[:len(records)]
+
+        counts = Counter(records)
+        prefix_counts = Counter()
+        for (kind, path), count in counts.items():
+            path_list = path.strip('/').split('/')
+            for level in range(1, len(path_list)):
+                prefix_counts['/'.join(path_list[:level]) + '/'] += count
+
+        for (kind, path), count in counts.items():
+            self._add(kind, path, count)
+        for prefix, count in prefix_counts.items():
+            self._add('prefix', prefix, count)
+
+    def get_top(self, kind, limit=None):
+        """Returns the list of the most requested paths of the kind with
+        the estimates of the number of the requests (list of the [path,
+        count] pairs), the estimates are scaled by the sample rate.
+        """
+        self.flush()
+        with self.lock:
+            top = sorted(self.candidates[kind].items(), key=lambda item: -item[1])
+        top = top[:limit or self.top_k]
+
+        # The sample rate can be 0 if the top is loaded from the snapshot.
+        scale = 1 / self.sample_rate if self.sample_rate else 1
+        return [[path, round(count * scale)] for path, count in top]
+
+    def decay(self):
+        """Halve the counters and the estimates of the candidates."""
+        with self.lock:
+            self.sketch.decay()
+            for kind, candidates in self.candidates.items():
+                for path in list(candidates):
+                    candidates[path] >>= 1
+                    if not candidates[path]:
+                        del candidates[path]
+                self.min_estimates[kind] = 0
+                if len(candidates) >= self.capacity:
+                    self.min_estimates[kind] = min(candidates.values())
+
+    def _run(self):
+        """Persist the top and decay the counters periodically."""
+        while True:
+            time.sleep(self.snapshot_interval)
+            self.flush()
+            if self.snapshot_path:
+                self._save_snapshot()
+            self.decay()
@@ -0,0 +1,319 @@
+"""Replication of the repositories to the mirror storages."""
+
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import shutil
+import tempfile
+import time
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+from s3repo.storage import StorageNoSuchKeyError
+
+
+# Index files of the repository metainformation. They refer to the other
+# metainformation files, so they are replicated last.
+METADATA_INDEX_FILES = {'repomd.xml', 'Release', 'InRelease', 'Release.gpg'}
+
+
+def _is_metadata_key(key):
+    """Checks if the object is a part of the repository metainformation."""
+    key_list = key.split('/')
+    return 'repodata' in key_list[:-1] or 'dists' in key_list[:-1]
+
+
+class Replicator:
+    """Replicator - replicates the changed objects of the primary storage to
+    the mirror storages in the background.
+
+    The objects are replicated in batches. In each batch the package files
+    are replicated first, then the metainformation of the synchronized
+    repositories (the index files - "repomd.xml", "Release", ... - last)
+    and then the deleted package files of these repositories are deleted.
+    So the metainformation of a mirror never refers to absent files (the
+    synchronization removes the deleted files from the metainformation of
+    the source, for the deb-based repositories see "s3repo.debscope").
+
+    The source ETags of the replicated objects are kept in the checkpoint,
+    so the periodic reconciliation (the ETag diff of the storages) copies
+    only the objects that have been missed or changed since.
+    All actions with "pending_objects", "pending_repos" and "pending_deletes"
+    must be done under the "lock", with "replicated" - under the
+    "replicated_lock".
+    """
+
+    def __init__(self, source, mirrors, settings, prefix=''):
+        """source(Storage) - primary storage.
+        mirrors(list) - list of the mirror storages (Storage).
+        settings - dictionary:
+            - workers - number of the parallel copies (default: 8)
+            - checkpoint_path - file to persist the checkpoint (not
+                persisted if not set)
+            - reconcile_interval - interval in seconds of the reconciliation
+                (0 or absence disables it)
+        prefix(string) - prefix of the replicated keys (path to the
+        repositories).
+        """
+        self.source = source
+        self.mirrors = mirrors
+        self.prefix = prefix
+        self.workers = int(settings.get('workers') or 8)
+        self.checkpoint_path = settings.get('checkpoint_path')
+        self.reconcile_interval = int(settings.get('reconcile_interval') or 0)
+
+        self.lock = Lock()
+        # pending_objects - set of the keys of the changed package files.
+        self.pending_objects = set()
+        # pending_repos - set of the paths of the repositories whose
+        # metainformation has been synchronized.
+        self.pending_repos = set()
+        # pending_deletes - dictionary (repository path to set of keys of
+        # the deleted package files). The files are deleted from the mirrors
+        # after the metainformation of the repository.
+        self.pending_deletes = {}
+        self.wakeup = Event()
+
+        self.replicated_lock = Lock()
+        # replicated - dictionary (mirror URI to dictionary (key to ETag of
+        # the source object)).
+        self.replicated = {mirror.uri: {} for mirror in self.mirrors}
+        self.checkpoint_changed = False
+        self.last_checkpoint = 0
+        self._load_checkpoint()
+
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _load_checkpoint(self):
+        """Load the checkpoint from the file."""
+        if not self.checkpoint_path or not os.path.isfile(self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except (OSError, ValueError) as err:
+            logging.warning("Can't load the replication checkpoint: " + str(err))
+            return
+
+        for mirror in self.mirrors:
+            self.replicated[mirror.uri].update(checkpoint.get(mirror.uri) or {})
+
+    def _save_checkpoint(self):
+        """Write the checkpoint to the file if it has been changed."""
+        with self.replicated_lock:
+            if not self.checkpoint_changed:
+                return
+            self.checkpoint_changed = False
+            checkpoint = {uri: dict(replicated) for uri, replicated in self.replicated.items()}
+
+        tmp_path = self.checkpoint_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as checkpoint_file:
+                json.dump(checkpoint, checkpoint_file)
+            os.replace(tmp_path, self.checkpoint_path)
+        except OSError as err:
+            logging.warning("Can't persist the replication checkpoint: " + str(err))
+
+    def _set_replicated(self, mirror, key, etag):
+        """Record the ETag of the source object replicated to the mirror
+        (None if the object has been deleted).
+        """
+        with self.replicated_lock:
+            if etag is None:
+                self.replicated[mirror.uri].pop(key, None)
+            else:
+                self.replicated[mirror.uri][key] = etag
+            self.checkpoint_changed = True
+
+    def add_objects(self, keys):
+        """Replicate the changed package files."""
+        with self.lock:
+            self.pending_objects.update(keys)
+        self.wakeup.set()
+
+    def add_repo_metadata(self, repo_path):
+        """Replicate the metainformation of the synchronized repository and
+        the deletions of its package files.
+        """
+        with self.lock:
+            self.pending_repos.add(repo_path)
+        self.wakeup.set()
+
+    def delete_objects(self, repo_path, keys):
+        """Delete the package files of the repository from the mirrors after
+        the next synchronization of the repository.
+        """
+        with self.lock:
+            self.pending_deletes.setdefault(repo_path, set()).update(keys)
+
+    def _replicate_key(self, mirror, key):
+        """Copy the object from the source storage to the mirror. The object
+        is copied on the server side if possible, otherwise it is streamed
+        through a temporary file.
+        """
+        try:
+            if mirror.is_same_service(self.source):
+                head = self.source.head_object(key)
+                mirror.copy_object_from(self.source, key, head['Metadata'])
+                etag = head['ETag']
+            else:
+                response = self.source.get_object(key)
+                with tempfile.SpooledTemporaryFile(max_size=16 * 1024**2) as spool:
+                    shutil.copyfileobj(response['Body'], spool)
+                    response['Body'].close()
+                    mirror.put_object(key, spool, mirror.compute_digests(spool))
+                etag = response['ETag']
+        except StorageNoSuchKeyError:
+            # The object has been deleted in the meantime.
+            mirror.delete_objects([key])
+            etag = None
+
+        self._set_replicated(mirror, key, etag)
+
+    def _delete_keys(self, mirror, keys):
+        """Delete the objects from the mirror."""
+        mirror.delete_objects(keys)
+        for key in keys:
+            self._set_replicated(mirror, key, None)
+
+    def _replicate(self, pool, mirror, keys, deleted_keys):
+        """Replicate the objects to the mirror: the package files, then the
+        metainformation, then the index files of the metainformation and then
+        the deletions. Returns False if any step has failed, in this case
+        the next steps are not performed.
+        """
+        keys = sorted(keys)
+        steps = [
+            [key for key in keys if not _is_metadata_key(key)],
+            [key for key in keys if _is_metadata_key(key) and
+             key.split('/')[-1] not in METADATA_INDEX_FILES],
+            [key for key in keys if _is_metadata_key(key) and
+             key.split('/')[-1] in METADATA_INDEX_FILES],
+        ]
+        try:
+            for step_keys in steps:
+                pool.starmap(self._replicate_key, [(mirror, key) for key in step_keys])
+            if deleted_keys:
+                self._delete_keys(mirror, sorted(deleted_keys))
+        except Exception as err:
+            logging.warning('Replication to {0} failed: {1}'.format(mirror.uri, err))
+            return False
+
+        return True
+
+    @staticmethod
+    def _list_metadata(storage, repo_path):
+        """Returns the keys of the metainformation files of the repository."""
+        keys = []
+        for metadata_dir in ['repodata/', 'dists/']:
+            for objects in storage.iter_objects(repo_path + metadata_dir):
+                keys.extend(file_meta['Key'] for file_meta in objects.get('Contents') or [])
+
+        return keys
+
+    def _process_pending(self, pool):
+        """Replicate the pending changes to all mirrors. The failed batch is
+        returned to the pending changes.
+        """
+        with self.lock:
+            objects = self.pending_objects
+            repos = self.pending_repos
+            deletes = {repo: self.pending_deletes.pop(repo)
+                       for repo in repos if repo in self.pending_deletes}
+            self.pending_objects = set()
+            self.pending_repos = set()
+        if not objects and not repos:
+            return
+
+        try:
+            keys = set(objects)
+            for repo_path in repos:
+                keys.update(Replicator._list_metadata(self.source, repo_path))
+            deleted_keys = set().union(*deletes.values()) - keys
+            results = []
+            for mirror in self.mirrors:
+                # The metainformation files removed by "mkrepo" are deleted
+                # from the mirror too.
+                stale_keys = {key for repo_path in repos
+                              for key in Replicator._list_metadata(mirror, repo_path)}
+                results.append(self._replicate(pool, mirror, keys,
+                                               deleted_keys | (stale_keys - keys)))
+        except Exception as err:
+            logging.warning('Replication failed: ' + str(err))
+            results = [False]
+
+        if all(results):
+            logging.info('Replicated: %d objects, %d repositories.', len(objects), len(repos))
+            return
+
+        with self.lock:
+            self.pending_objects.update(objects)
+            self.pending_repos.update(repos)
+            for repo_path, keys in deletes.items():
+                self.pending_deletes.setdefault(repo_path, set()).update(keys)
+
+    @staticmethod
+    def _list_etags(storage, prefix):
+        """Returns the dictionary (key to ETag) of the objects of the storage."""
+        etags = {}
+        for objects in storage.iter_objects(prefix):
+            for file_meta in objects.get('Contents') or []:
+                etags[file_meta['Key']] = file_meta['ETag'].strip('"')
+
+        return etags
+
+    def reconcile(self, pool):
+        """Compare the source storage with the mirrors and replicate the
+        missed changes. The object is copied if it is absent in the mirror
+        or its ETag differs from the one recorded in the checkpoint (and from
+        the ETag of the mirror object).
+        """
+        source_etags = Replicator._list_etags(self.source, self.prefix)
+        for mirror in self.mirrors:
+            mirror_etags = Replicator._list_etags(mirror, self.prefix)
+            with self.replicated_lock:
+                replicated = dict(self.replicated[mirror.uri])
+
+            changed_keys = []
+            for key, etag in source_etags.items():
+                if key not in mirror_etags:
+                    changed_keys.append(key)
+                elif replicated.get(key) != etag:
+                    if mirror_etags[key] == etag:
+                        self._set_replicated(mirror, key, etag)
+                    else:
+                        changed_keys.append(key)
+            deleted_keys = [key for key in mirror_etags if key not in source_etags]
+
+            if self._replicate(pool, mirror, changed_keys, deleted_keys):
+                logging.info('Mirror %s has been reconciled: %d copied, %d deleted.',
+                             mirror.uri, len(changed_keys), len(deleted_keys))
+
+    def _run(self):
+        """Replicate the changes and reconcile the mirrors periodically."""
+        last_reconcile = None
+        with ThreadPool(processes=self.workers) as pool:
+            while True:
+                self.wakeup.wait(5)
+                self.wakeup.clear()
+                # The batches are collected for a while to copy them in parallel.
+                time.sleep(1)
+
+                self._process_pending(pool)
+
+                if self.reconcile_interval and (last_reconcile is None or
+                        time.monotonic() - last_reconcile >= self.reconcile_interval):
+                    last_reconcile = time.monotonic()
+                    try:
+                        self.reconcile(pool)
+                    except Exception as err:
+                        logging.warning('Reconciliation of the mirrors failed: ' + str(err))
+
+                # The checkpoint is written at most once a minute.
+                if self.checkpoint_path and time.monotonic() - self.last_checkpoint >= 60:
+                    self.last_checkpoint = time.monotonic()
+                    self._save_checkpoint()
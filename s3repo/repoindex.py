@@ -0,0 +1,107 @@
+"""Precompiled index of the supported repositories."""
+
+import fnmatch
+import itertools
+import os
+
+
+class RepoIndex:
+    """RepoIndex - description of the supported repositories and anchors
+    compiled into structures for fast lookups.
+
+    The index is never changed after creation. To apply a new configuration
+    a new index is created and replaces the old one (the reference is
+    replaced atomically), so the requests that are being processed at the
+    moment keep working with a consistent description of the repositories.
+    """
+
+    def __init__(self, supported_repos, anchors):
+        """supported_repos - dictionary describing the supported repositories
+        (see the "supported_repos" section of the configuration file).
+        anchors - dictionary (anchor to list of paths).
+        """
+        # The original description is used to iterate over
+        # the repositories in the order from the configuration file.
+        self.supported_repos = supported_repos
+
+        self.repo_kinds = frozenset(supported_repos['repo_kind'])
+        self.tarantool_series = frozenset(supported_repos['tarantool_series'])
+
+        # distrs - dictionary (distribution to tuple (base, set of versions)).
+        self.distrs = {}
+        for dist, dist_description in supported_repos['distrs'].items():
+            if dist_description['base'] not in ('deb', 'rpm'):
+                raise RuntimeError('Unknown repository base: ' +
+                                   dist_description['base'])
+            self.distrs[dist] = (dist_description['base'],
+                                 frozenset(dist_description['versions']))
+
+        # The anchor targets are normalized in advance, so to expand
+        # the path it is enough to substitute them.
+        self.anchors = {}
+        for anchor, targets in anchors.items():
+            self.anchors[anchor] = tuple(
+                os.path.normpath(target).strip('/') for target in targets)
+
+    def check_path(self, path):
+        """Checks if the given distribution is supported for
+        uploading packages.
+        """
+        # Correct path = repo_kind/tarantool_series/dist/dist_ver
+        # Example: live/1.10/el/7
+        if len(path) != 4:
+            raise RuntimeError('Invalid URL.')
+
+        if path[0] not in self.repo_kinds:
+            raise RuntimeError('Repo kind "' + path[0] + '" is not supported.')
+        if path[1] not in self.tarantool_series:
+            raise RuntimeError('Tarantool series "' + path[1] + '"" is not supported.')
+        if path[2] not in self.distrs:
+            raise RuntimeError('Distribution "' + path[2] + '" is not supported.')
+        if path[3] not in self.distrs[path[2]][1]:
+            raise RuntimeError('Distribution version "' + path[3] + '" is not supported.')
+
+    def get_dist_base(self, dist):
+        """Returns the base ("deb" or "rpm") of the distribution."""
+        if dist not in self.distrs:
+            raise RuntimeError('Distribution "' + dist + '" is not supported.')
+
+        return self.distrs[dist][0]
+
+    def expand_anchors(self, path):
+        """Returns the list of paths generated by substituting the anchor
+        targets instead of the anchors in the path.
+        """
+        path_list = path.split('/')
+        if not any(component in self.anchors for component in path_list):
+            return [path]
+
+        choices = [self.anchors.get(component, (component,)) for component in path_list]
+
+        return [os.path.normpath('/'.join(generated_path_list))
+                for generated_path_list in itertools.product(*choices)]
+
+    def match_pattern(self, pattern):
+        """Returns the list of the supported distributions (tuples
+        (repo_kind, tarantool_series, dist, dist_version)) matching the
+        pattern. The pattern consists of the same components as the path,
+        each of them can be a glob pattern (for example, "release/*/el/9").
+        """
+        pattern_list = os.path.normpath(pattern.strip('/')).split('/')
+        if len(pattern_list) != 4:
+            raise RuntimeError('Invalid pattern: ' + pattern)
+
+        # The repositories are iterated in the order from
+        # the configuration file.
+        matches = []
+        for kind, series, (dist, dist_description) in itertools.product(
+                self.supported_repos['repo_kind'],
+                self.supported_repos['tarantool_series'],
+                self.supported_repos['distrs'].items()):
+            for dist_version in dist_description['versions']:
+                path_list = [kind, series, dist, dist_version]
+                if all(fnmatch.fnmatchcase(component, component_pattern)
+                       for component, component_pattern in zip(path_list, pattern_list)):
+                    matches.append(tuple(path_list))
+
+        return matches
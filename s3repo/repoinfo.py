@@ -3,18 +3,39 @@
 class RepoInfo:
     """Information about repository."""
 
-    def __init__(self, path='', sign_key=''):
-        # Path to the repository.
-        self.path = path
+    def __init__(self, path='', sign_key='', codenames=None):
+        # Path to the repository. It always ends with "/" to be the same
+        # regardless of the way the repository was found.
+        self.path = path.rstrip('/') + '/' if path else path
         # THe the GPG sign key ID that should be used to sign
         # of the repository.
         self.sign_key = sign_key
+        # Codenames (distribution versions) of the deb-based repository
+        # whose metainformation should be updated. None means all of them.
+        self.codenames = frozenset(codenames) if codenames is not None else None
 
     def __hash__(self):
         return hash(self.path)
 
     def __eq__(self, other):
-        return self.path == self.path
+        return self.path == other.path
+
+    def merge(self, other):
+        """Returns the RepoInfo of the same repository including the
+        codenames of both.
+        """
+        codenames = None
+        if self.codenames is not None and other.codenames is not None:
+            codenames = self.codenames | other.codenames
+
+        return RepoInfo(self.path, other.sign_key or self.sign_key, codenames)
+
+    def covers(self, other):
+        """Checks if the update of this repository includes the update
+        described by "other".
+        """
+        return self.codenames is None or \
+            (other.codenames is not None and other.codenames <= self.codenames)
 
 
 class RepoAnnotation:
@@ -32,10 +53,10 @@ class RepoAnnotation:
     view. And in fact, it can include more than one repository.
     """
 
-    def __init__(self, path, supported_repos):
+    def __init__(self, path, repo_index):
         # Parse path.
         path_list = path.split('/')
-        RepoAnnotation.check_path(path_list, supported_repos)
+        repo_index.check_path(path_list)
 
         # Repo kind (live, release...).
         self.repo_kind = path_list[0]
@@ -52,22 +73,3 @@ class RepoAnnotation:
                         self.tarantool_series,
                         self.dist,
                         self.dist_version))
-
-    @staticmethod
-    def check_path(path, supported_repos):
-        """Checks if the given distribution is supported for
-        uploading packages.
-        """
-        # Correct path = repo_kind/tarantool_series/dist/dist_ver
-        # Example: live/1.10/el/7
-        if len(path) != 4:
-            raise RuntimeError('Invalid URL.')
-
-        if path[0] not in supported_repos['repo_kind']:
-            raise RuntimeError('Repo kind "' + path[0] + '" is not supported.')
-        if path[1] not in supported_repos['tarantool_series']:
-            raise RuntimeError('Tarantool series "' + path[1] + '"" is not supported.')
-        if path[2] not in supported_repos['distrs']:
-            raise RuntimeError('Distribution "' + path[2] + '" is not supported.')
-        if path[3] not in supported_repos['distrs'][path[2]]['versions']:
-            raise RuntimeError('Distribution version "' + path[3] + '" is not supported.')
@@ -0,0 +1,182 @@
+"""In-memory search index of the packages of all repositories."""
+
+import bisect
+from collections import namedtuple
+import re
+from threading import Lock
+
+from s3repo.package import parse_package_filename
+
+
+# Description of the package file in the index.
+PackageEntry = namedtuple('PackageEntry', [
+    'name', 'version', 'arch', 'repo_kind', 'tarantool_series', 'dist',
+    'dist_version', 'repo', 'key'])
+
+
+def version_key(version):
+    """Returns the key to compare the versions: the numeric components are
+    compared as numbers, the other ones as strings (and are less than
+    the numeric ones).
+
+    Example: 2.10.0-1.el7 -> ((1, 2), (1, 10), (1, 0), (1, 1), (0, 'el'), (1, 7))
+    """
+    return tuple((1, int(part)) if part.isdigit() else (0, part)
+                 for part in re.findall(r'\d+|[A-Za-z]+', version))
+
+
+class PackageSearchIndex:
+    """PackageSearchIndex - index of the package files of all repositories
+    for the search by the package name prefix and the version range without
+    requests to S3.
+
+    The index is filled in by the listings of the "Packages/" directories
+    of the rpm-based and the "pool/" directories of the deb-based
+    repositories and is updated by the model when the package files are
+    uploaded, copied or deleted and when the repository is synchronized.
+    All actions with "entries", "repo_keys", "name_keys" and "names" must be
+    done under the "lock".
+    """
+
+    def __init__(self, base_path=''):
+        """base_path(string) - path inside the bucket to repositories."""
+        base_path = (base_path or '').strip('/')
+        self.base_path_list = base_path.split('/') if base_path else []
+        # State of the index: "building" until all the repositories are
+        # listed for the first time, then "ready".
+        self.state = 'building'
+
+        self.lock = Lock()
+        # entries - dictionary (key to PackageEntry).
+        self.entries = {}
+        # repo_keys - dictionary (repository path to set of keys).
+        self.repo_keys = {}
+        # name_keys - dictionary (package name to set of keys).
+        self.name_keys = {}
+        # names - sorted list of the package names for the prefix search.
+        self.names = []
+
+    def parse_key(self, key):
+        """Returns the PackageEntry of the package file or None if the key
+        isn't a key of the package file.
+        """
+        path_list = key.split('/')
+        base_len = len(self.base_path_list)
+        if path_list[:base_len] != self.base_path_list:
+            return None
+        path_list = path_list[base_len:]
+
+        filename = path_list[-1]
+        parsed_filename = parse_package_filename(filename)
+        if parsed_filename is None:
+            return None
+        name, version = parsed_filename
+
+        # Example of the package file in the rpm-based repository:
+        # .../live/1.10/fedora/31/x86_64/Packages/filename
+        # Example of the package file in the deb-based repository:
+        # .../live/1.10/ubuntu/pool/disco/main/s/small/filename
+        if len(path_list) == 7 and path_list[5] == 'Packages':
+            repo_path_list = path_list[:5]
+            dist_version = path_list[3]
+            arch = filename.rsplit('.', 2)[-2]
+        elif len(path_list) == 9 and path_list[3] == 'pool':
+            repo_path_list = path_list[:3]
+            dist_version = path_list[4]
+            match = re.fullmatch(r'[^_]+_[^_]+_(?P<arch>[^_]+)\.deb', filename)
+            arch = match.group('arch') if match else 'source'
+        else:
+            return None
+
+        repo = '/'.join(self.base_path_list + repo_path_list) + '/'
+        return PackageEntry(name, version, arch, path_list[0], path_list[1],
+                            path_list[2], dist_version, repo, key)
+
+    def _add_entry(self, entry):
+        """Add the entry to the index. Must be called under the "lock"."""
+        if entry.key in self.entries:
+            self._remove_key(entry.key)
+        self.entries[entry.key] = entry
+        self.repo_keys.setdefault(entry.repo, set()).add(entry.key)
+        if entry.name not in self.name_keys:
+            self.name_keys[entry.name] = set()
+            bisect.insort(self.names, entry.name)
+        self.name_keys[entry.name].add(entry.key)
+
+    def _remove_key(self, key):
+        """Remove the entry from the index. Must be called under the "lock"."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        repo_keys = self.repo_keys[entry.repo]
+        repo_keys.discard(key)
+        if not repo_keys:
+            del self.repo_keys[entry.repo]
+        name_keys = self.name_keys[entry.name]
+        name_keys.discard(key)
+        if not name_keys:
+            del self.name_keys[entry.name]
+            del self.names[bisect.bisect_left(self.names, entry.name)]
+
+    def add(self, keys):
+        """Add the package files to the index. Keys of other files are
+        ignored.
+        """
+        entries = [entry for entry in map(self.parse_key, keys) if entry]
+        with self.lock:
+            for entry in entries:
+                self._add_entry(entry)
+
+    def remove(self, keys):
+        """Remove the package files from the index."""
+        with self.lock:
+            for key in keys:
+                self._remove_key(key)
+
+    def replace_repo(self, repo_path, keys):
+        """Replace all the package files of the repository."""
+        entries = [entry for entry in map(self.parse_key, keys)
+                   if entry and entry.repo == repo_path]
+        with self.lock:
+            for key in list(self.repo_keys.get(repo_path, [])):
+                self._remove_key(key)
+            for entry in entries:
+                self._add_entry(entry)
+
+    def search(self, name_prefix='', min_version=None, max_version=None,
+               filters=None, limit=None):
+        """Returns the list of the PackageEntry of the package files with
+        the name starting with "name_prefix" and the version in the range
+        [min_version, max_version). "filters" - dictionary (PackageEntry field
+        to required value). The result is ordered by the name and version.
+        """
+        min_key = version_key(min_version) if min_version else None
+        max_key = version_key(max_version) if max_version else None
+        filters = filters or {}
+
+        result = []
+        with self.lock:
+            position = bisect.bisect_left(self.names, name_prefix)
+            while position < len(self.names) and \
+                    self.names[position].startswith(name_prefix):
+                name = self.names[position]
+                position += 1
+                for key in self.name_keys[name]:
+                    entry = self.entries[key]
+                    if min_key is not None and version_key(entry.version) < min_key:
+                        continue
+                    if max_key is not None and version_key(entry.version) >= max_key:
+                        continue
+                    if any(getattr(entry, field) != value for field, value in filters.items()):
+                        continue
+                    result.append(entry)
+
+        result.sort(key=lambda entry: (entry.name, version_key(entry.version), entry.key))
+        return result[:limit] if limit else result
+
+    def get_stats(self):
+        """Returns the state and size of the index."""
+        with self.lock:
+            return {'state': self.state, 'packages': len(self.name_keys),
+                    'files': len(self.entries), 'repos': len(self.repo_keys)}
@@ -0,0 +1,106 @@
+"""Controllers for monitoring of the service."""
+
+from flask import jsonify
+from flask import request
+from flask.views import MethodView
+
+from helpers.auth_provider import multi_auth_provider
+from s3repo.model import S3ModelRequestError
+
+
+class HealthController(MethodView):
+    """Controller for the liveness and readiness probes."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def get(self, probe):
+        """Returns the state of the service. "probe" can be:
+        * "live" - the service is able to process requests.
+        * "ready" - the synchronization of all repositories at the start
+          (if any) has been completed.
+        """
+        sync_all_status = self.model.get_sync_all_status()
+        if probe == 'live':
+            return jsonify({'status': 'ok'})
+
+        ready = sync_all_status['state'] != 'running'
+        response = jsonify({'status': 'ok' if ready else 'syncing',
+                            'sync_all': sync_all_status})
+        response.status_code = 200 if ready else 503
+        return response
+
+
+class SyncStatusController(MethodView):
+    """Controller to get the state of the metainformation synchronization."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def get(self):
+        """Returns the queued and running synchronization jobs and the recent
+        history. The "repo" argument limits the repositories by the path
+        prefix, the "limit" argument limits the number of the history records
+        of each repository.
+        """
+        repo_prefix = request.args.get('repo', '')
+        limit = request.args.get('limit', type=int)
+        return jsonify(self.model.get_sync_status(repo_prefix, limit))
+
+
+class SyncBatchController(MethodView):
+    """Controller to get the state of the batch of the repositories enqueued
+    by the patterns.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def get(self, batch_id):
+        """Returns the batch with the state of each repository."""
+        batch = self.model.get_sync_batch(batch_id)
+        if batch is None:
+            response = jsonify({'message': 'Unknown batch: ' + batch_id})
+            response.status_code = 404
+            return response
+
+        return jsonify(batch)
+
+
+class StaleReposController(MethodView):
+    """Controller to get the repositories with out-of-date metainformation."""
+
+    def __init__(self, model):
+        self.model = model
+
+    @multi_auth_provider.login_required
+    def get(self):
+        """Returns the list of repositories that would be synchronized
+        (dry-run of the consistency sweep).
+        """
+        stale_repos = self.model.get_stale_repos()
+        return jsonify({'repos': sorted(repo.path for repo in stale_repos)})
+
+
+class PopularityController(MethodView):
+    """Controller to get the most requested files and directories."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def get(self):
+        """Returns the most requested paths with the estimated number of
+        the requests. The "kind" argument is "file" (default), "directory"
+        or "prefix", the "limit" argument limits the number of the paths.
+        """
+        kind = request.args.get('kind', 'file')
+        limit = request.args.get('limit', type=int)
+        try:
+            top = self.model.get_popular(kind, limit)
+        except S3ModelRequestError as err:
+            response = jsonify({'message': str(err)})
+            response.status_code = 400
+            return response
+
+        return jsonify({'kind': kind, 'top': [{'path': path, 'count': count}
+                                              for path, count in top]})
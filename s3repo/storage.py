@@ -0,0 +1,641 @@
+"""Storage backends of the repositories."""
+
+import base64
+from datetime import datetime
+from datetime import timezone
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from threading import Lock
+from urllib.parse import quote
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+
+class StorageNoSuchKeyError(Exception):
+    """StorageNoSuchKeyError - exception that is raised when the requested
+    object doesn't exist in the storage.
+    """
+
+
+class StorageIntegrityError(Exception):
+    """StorageIntegrityError - exception that is raised when the stored
+    object doesn't match the uploaded data.
+    """
+
+
+class Storage:
+    """Storage - interface of the storage of the repositories.
+
+    The objects are addressed by keys like "path/to/object". The listings
+    are returned in the format of the S3 "list_objects_v2" response:
+    dictionary with the "CommonPrefixes" (list of dictionaries with the
+    "Prefix"), "Contents" (list of dictionaries with the "Key",
+    "LastModified", "Size" and "ETag") and "KeyCount" fields.
+
+    See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.list_objects_v2
+    for more detaied description.
+    """
+
+    # Name of the storage (name of the bucket or path to the directory).
+    name = ''
+    # URI that identifies the storage among the others.
+    uri = ''
+    # Size of the parts and the minimum size of the multipart upload
+    # (None if the storage doesn't use it). They are required to calculate
+    # the ETag of the uploaded object in advance.
+    part_size = None
+    multipart_threshold = None
+
+    def compute_digests(self, file):
+        """Compute the MD5 and SHA-256 digests of the file and the ETag
+        that S3 assigns to the object after the upload in one read of the
+        file. The digests must be known before the upload ("Content-MD5"),
+        so "put_object" reads the file once more. Returns a dictionary with
+        the "md5", "sha256" (hex), "etag" and "size" values (see
+        "put_object").
+        """
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        # MD5 digests of the parts of the multipart upload.
+        part_digests = []
+        part_size = self.part_size or 8 * 1024**2
+        multipart_threshold = self.multipart_threshold
+        size = 0
+
+        file.seek(0)
+        while True:
+            chunk = file.read(part_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+            sha256.update(chunk)
+            part_digests.append(hashlib.md5(chunk).digest())
+            size += len(chunk)
+        file.seek(0)
+
+        # The ETag of the multipart upload is the MD5 digest of the
+        # concatenated digests of the parts with the number of parts.
+        if multipart_threshold is not None and size >= multipart_threshold:
+            etag = '{0}-{1}'.format(hashlib.md5(b''.join(part_digests)).hexdigest(),
+                                    len(part_digests))
+        else:
+            etag = md5.hexdigest()
+
+        return {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest(),
+                'etag': etag, 'size': size}
+
+    def list_objects(self, prefix, delimiter=None, max_keys=1000):
+        """Returns the first page of the objects with the "prefix"."""
+        raise NotImplementedError()
+
+    def iter_objects(self, prefix, delimiter=None):
+        """Returns an iterator over the pages of the objects with the "prefix"."""
+        raise NotImplementedError()
+
+    def head_object(self, key):
+        """Returns the dictionary with the "ETag", "LastModified",
+        "ContentLength" and "Metadata" of the object.
+        """
+        raise NotImplementedError()
+
+    def get_object(self, key, if_none_match=None):
+        """Returns the dictionary with the "Body" (file-like object), "ETag"
+        and "ContentLength" of the object or None if "if_none_match" is set
+        and the ETag of the object is the same.
+        """
+        raise NotImplementedError()
+
+    def put_object(self, key, fileobj, digests):
+        """Save the file-like object to the storage and check its integrity.
+        digests - dictionary with the "md5" and "sha256" hex digests, the
+        expected "etag" and "size" of the data. The "md5" and "sha256" digests
+        are stored in the object metadata.
+        """
+        raise NotImplementedError()
+
+    def copy_object(self, source_key, key, metadata=None):
+        """Copy the object. The metadata is copied from the source object
+        if "metadata" is None.
+        """
+        raise NotImplementedError()
+
+    def copy_object_from(self, source, key, metadata):
+        """Copy the object from the "source" storage on the server side
+        (see "is_same_service").
+        """
+        raise NotImplementedError()
+
+    def is_same_service(self, other):
+        """Checks if the objects of the "other" storage can be copied to
+        this one on the server side.
+        """
+        return False
+
+    def delete_objects(self, keys):
+        """Delete the objects."""
+        raise NotImplementedError()
+
+    def get_url(self, key, download_mode, expiration):
+        """Returns the URL to download the object directly from the storage
+        or None if it isn't possible.
+        """
+        return None
+
+    def get_mkrepo_args(self, path):
+        """Returns the arguments of "mkrepo" to update the repository."""
+        raise NotImplementedError()
+
+
+# S3 clients shared by all the storages of the process (see "get_s3_client").
+# s3_clients - dictionary ((endpoint, region, access key ID, secret key) to
+# S3 client). All actions with "s3_clients" must be done under the
+# "s3_clients_lock".
+s3_clients = {}
+s3_clients_lock = Lock()
+
+
+def get_s3_client(settings):
+    """Returns the S3 client for the settings (see "S3Storage"). The storages
+    of the same S3 account (for example, the buckets of several tenants or
+    the mirrors) share one client, so they share its connection pool. The
+    client is configured by the settings of the first storage.
+    """
+    client_key = (settings['endpoint_url'], settings['region'],
+                  settings['access_key_id'], settings['secret_access_key'])
+    with s3_clients_lock:
+        if client_key in s3_clients:
+            return s3_clients[client_key]
+
+        # The client is shared by all the threads of the service, so the
+        # connection pool must be large enough for the thread pools used to
+        # list the repositories (20 threads), the sync workers and the
+        # server threads of all the storages using it. The adaptive retries
+        # slow the requests down when S3 responds with the throttling errors.
+        client_settings = settings.get('storage') or {}
+        client_config = Config(
+            max_pool_connections=int(client_settings.get('max_pool_connections') or 50),
+            connect_timeout=int(client_settings.get('connect_timeout') or 10),
+            read_timeout=int(client_settings.get('read_timeout') or 60),
+            retries={
+                'mode': 'adaptive',
+                'max_attempts': int(client_settings.get('max_attempts') or 5)
+            })
+        s3_clients[client_key] = boto3.client(
+            service_name='s3',
+            region_name=settings['region'],
+            endpoint_url=settings['endpoint_url'],
+            aws_access_key_id=settings['access_key_id'],
+            aws_secret_access_key=settings['secret_access_key'],
+            config=client_config
+        )
+
+        return s3_clients[client_key]
+
+
+class S3Storage(Storage):
+    """S3Storage - storage of the repositories in the S3 bucket."""
+
+    def __init__(self, settings):
+        """settings - dictionary:
+            - region - S3 region
+            - endpoint_url - S3 server URL
+            - bucket_name - name of a bucket with repositories
+            - access_key_id - S3 access key ID
+            - secret_access_key - S3 secret key
+            - public_read - set public access to files uploaded to S3
+            - public_url - base URL of the bucket for anonymous users
+            - storage - settings of the S3 client:
+                - max_pool_connections - size of the connection pool
+                    (default: 50)
+                - connect_timeout - connection timeout in seconds (default: 10)
+                - read_timeout - read timeout in seconds (default: 60)
+                - max_attempts - maximum number of attempts of a request
+                    with the adaptive retries (default: 5)
+                - verify_etag - check the ETag of the object uploaded by
+                    parts (default: True)
+        """
+        self.settings = settings
+        self.name = settings['bucket_name']
+        self.uri = '/'.join([str(settings['endpoint_url']).rstrip('/'), self.name])
+        self.public_read = bool(settings.get('public_read'))
+        self.verify_etag = (settings.get('storage') or {}).get('verify_etag', True)
+
+        self.s3_client = get_s3_client(settings)
+        # The part size must be known to calculate the ETag of the
+        # multipart upload (see "put_object").
+        self.transfer_config = TransferConfig()
+        self.part_size = self.transfer_config.multipart_chunksize
+        self.multipart_threshold = self.transfer_config.multipart_threshold
+
+    def _get_extra_args(self, metadata=None):
+        """Returns the arguments of the uploaded objects."""
+        extra_args = {}
+        if self.public_read:
+            extra_args['ACL'] = 'public-read'
+        if metadata is not None:
+            extra_args['Metadata'] = metadata
+
+        return extra_args
+
+    def list_objects(self, prefix, delimiter=None, max_keys=1000):
+        list_parameters = {'Bucket': self.name, 'Prefix': prefix, 'MaxKeys': max_keys}
+        if delimiter:
+            list_parameters['Delimiter'] = delimiter
+
+        return self.s3_client.list_objects_v2(**list_parameters)
+
+    def iter_objects(self, prefix, delimiter=None):
+        list_parameters = {'Bucket': self.name, 'Prefix': prefix}
+        if delimiter:
+            list_parameters['Delimiter'] = delimiter
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        return paginator.paginate(**list_parameters)
+
+    def head_object(self, key):
+        try:
+            response = self.s3_client.head_object(Bucket=self.name, Key=key)
+        except ClientError as err:
+            if err.response.get('Error', {}).get('Code') in ['404', 'NoSuchKey']:
+                raise StorageNoSuchKeyError(key)
+            raise
+
+        return {
+            'ETag': response.get('ETag', '').strip('"'),
+            'LastModified': response.get('LastModified'),
+            'ContentLength': response.get('ContentLength'),
+            'Metadata': response.get('Metadata') or {},
+            # The ETag isn't based on the MD5 digest of the data if
+            # the object is encrypted with SSE-KMS or SSE-C.
+            'Encrypted': response.get('ServerSideEncryption', '').startswith('aws:kms') or
+                         bool(response.get('SSECustomerAlgorithm'))
+        }
+
+    def get_object(self, key, if_none_match=None):
+        get_parameters = {'Bucket': self.name, 'Key': key}
+        if if_none_match:
+            # If the object hasn't been changed, S3 responds
+            # "304 Not Modified" without the body.
+            get_parameters['IfNoneMatch'] = '"{0}"'.format(if_none_match)
+        try:
+            response = self.s3_client.get_object(**get_parameters)
+        except self.s3_client.exceptions.NoSuchKey:
+            raise StorageNoSuchKeyError(key)
+        except self.s3_client.exceptions.InvalidObjectState:
+            raise RuntimeError('Invalid object state.')
+        except ClientError as err:
+            if err.response.get('Error', {}).get('Code') == '304':
+                return None
+            raise
+
+        return {
+            'Body': response.get('Body'),
+            'ETag': response.get('ETag', '').strip('"'),
+            'ContentLength': response.get('ContentLength', 0)
+        }
+
+    def put_object(self, key, fileobj, digests):
+        extra_args = self._get_extra_args({'md5': digests['md5'],
+                                           'sha256': digests['sha256']})
+        if digests['size'] < self.transfer_config.multipart_threshold:
+            # S3 rejects the object if its MD5 digest doesn't match
+            # the "Content-MD5" header.
+            content_md5 = base64.b64encode(bytes.fromhex(digests['md5'])).decode('ascii')
+            try:
+                self.s3_client.put_object(Bucket=self.name, Key=key, Body=fileobj,
+                                          ContentMD5=content_md5, **extra_args)
+            except ClientError as err:
+                if err.response.get('Error', {}).get('Code') == 'BadDigest':
+                    raise StorageIntegrityError(
+                        'The uploaded object "{0}" is corrupted.'.format(key))
+                raise
+            return
+
+        # "Content-MD5" isn't supported for the multipart upload, so the
+        # ETag of the uploaded object is checked. If the ETag isn't based on
+        # the MD5 digests of the parts (the encrypted object, some
+        # S3-compatible storages), only the size is checked.
+        self.s3_client.upload_fileobj(fileobj, self.name, key, ExtraArgs=extra_args,
+                                      Config=self.transfer_config)
+        head = self.head_object(key)
+        if self.verify_etag and not head['Encrypted'] and \
+                re.fullmatch(r'[0-9a-f]{32}-[0-9]+', head['ETag']):
+            corrupted = head['ETag'] != digests['etag']
+        else:
+            corrupted = head['ContentLength'] != digests['size']
+        if corrupted:
+            self.s3_client.delete_object(Bucket=self.name, Key=key)
+            raise StorageIntegrityError('The uploaded object "{0}" is corrupted.'.format(key))
+
+    def copy_object(self, source_key, key, metadata=None):
+        extra_args = self._get_extra_args(metadata)
+        if metadata is None:
+            # The single request copy keeps the metadata of the source object.
+            self.s3_client.copy_object(Bucket=self.name, Key=key,
+                                       CopySource={'Bucket': self.name, 'Key': source_key},
+                                       **extra_args)
+            return
+
+        extra_args['MetadataDirective'] = 'REPLACE'
+        # In the documentation
+        # (https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.copy)
+        # `copy` uses `ExtraArgs` which only allow `ALLOWED_DOWNLOAD_ARGS`
+        # (don't include `ACL`). But in fact `ALLOWED_COPY_ARGS` is used for copying
+        # (https://github.com/boto/s3transfer/blob/279f82c6f9d01b19abf69d8fa08441c2064fba7f/s3transfer/manager.py#L381).
+        # So, we can use `ACL` in `ExtraArgs`.
+        self.s3_client.copy({'Bucket': self.name, 'Key': source_key}, self.name, key,
+                            ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def copy_object_from(self, source, key, metadata):
+        extra_args = self._get_extra_args(metadata)
+        extra_args['MetadataDirective'] = 'REPLACE'
+        self.s3_client.copy({'Bucket': source.name, 'Key': key}, self.name, key,
+                            ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def is_same_service(self, other):
+        return isinstance(other, S3Storage) and \
+            other.settings['endpoint_url'] == self.settings['endpoint_url'] and \
+            other.settings['access_key_id'] == self.settings['access_key_id']
+
+    def delete_objects(self, keys):
+        keys = list(keys)
+        # "delete_objects" accepts up to 1000 keys per request.
+        #
+        # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.delete_objects
+        # for more detaied description.
+        batch_size = 1000
+        for i in range(0, len(keys), batch_size):
+            response = self.s3_client.delete_objects(
+                Bucket=self.name,
+                Delete={
+                    'Objects': [{'Key': key} for key in keys[i:i + batch_size]],
+                    'Quiet': True
+                })
+            errors = response.get('Errors')
+            if errors:
+                raise RuntimeError("Can't delete {0}: {1}".format(
+                    errors[0].get('Key'), errors[0].get('Message')))
+
+    def get_url(self, key, download_mode, expiration):
+        if download_mode == 'public':
+            public_url = self.settings.get('public_url') or '/'.join([
+                str(self.settings['endpoint_url']).rstrip('/'), self.name])
+            return '/'.join([public_url.rstrip('/'), quote(key)])
+        if download_mode == 'presigned':
+            # Generation of the presigned URL doesn't require a request to S3.
+            #
+            # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.generate_presigned_url
+            # for more detaied description.
+            return self.s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.name, 'Key': key},
+                ExpiresIn=expiration)
+
+        return None
+
+    def get_mkrepo_args(self, path):
+        mkrepo_args = [
+            '--s3-access-key-id',
+            str(self.settings['access_key_id']),
+            '--s3-secret-access-key',
+            str(self.settings['secret_access_key']),
+            '--s3-endpoint',
+            str(self.settings['endpoint_url']),
+            '--s3-region',
+            str(self.settings['region']),
+        ]
+        if self.public_read:
+            mkrepo_args.append('--s3-public-read')
+        mkrepo_args.append('s3://{0}/{1}'.format(self.name, path))
+
+        return mkrepo_args
+
+
+class LocalStorage(Storage):
+    """LocalStorage - storage of the repositories in the local directory.
+
+    The key of the object is a path to the file relative to the root
+    directory. The ETag of the file is derived from its size and
+    modification time, the metadata is stored in the extended attributes
+    (if the file system supports them).
+    """
+
+    # Prefix of the extended attributes with the metadata.
+    XATTR_PREFIX = 'user.rws.'
+
+    def __init__(self, settings):
+        """settings - dictionary:
+            - storage - settings of the storage:
+                - path - root directory of the storage
+        """
+        path = (settings.get('storage') or {}).get('path')
+        if not path:
+            raise RuntimeError('The storage path is required for the "local" backend.')
+        self.root = os.path.abspath(path)
+        self.name = self.root
+        self.uri = 'file://' + self.root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _get_path(self, key):
+        """Returns the path to the file of the object."""
+        path = os.path.normpath(os.path.join(self.root, key))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise StorageNoSuchKeyError(key)
+
+        return path
+
+    @staticmethod
+    def _get_etag(stat):
+        """Returns the ETag of the file according to its "stat"."""
+        return '{0:x}-{1:x}'.format(stat.st_mtime_ns, stat.st_size)
+
+    def _get_file_meta(self, key, stat):
+        """Returns the description of the file in the listing format."""
+        return {
+            'Key': key,
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            'Size': stat.st_size,
+            'ETag': LocalStorage._get_etag(stat)
+        }
+
+    def _has_files(self, path):
+        """Checks if the directory contains at least one file (empty
+        directories don't exist in S3).
+        """
+        for _, _, filenames in os.walk(path):
+            if any(not filename.startswith('.rws_') for filename in filenames):
+                return True
+
+        return False
+
+    def _iter_keys(self, directory, prefix, delimiter):
+        """Returns an iterator over the keys and common prefixes (ending with
+        the delimiter) of the "directory" matching the "prefix" in the
+        lexicographical order.
+        """
+        path = self._get_path(directory) if directory else self.root
+        try:
+            names = sorted(os.listdir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+
+        for name in names:
+            # Temporary files of the storage.
+            if name.startswith('.rws_'):
+                continue
+            key = directory + name
+            entry_path = os.path.join(path, name)
+            if os.path.isdir(entry_path):
+                dir_key = key + '/'
+                if not (dir_key.startswith(prefix) or prefix.startswith(dir_key)):
+                    continue
+                if delimiter == '/' and dir_key.startswith(prefix) and \
+                        '/' in dir_key[len(prefix):]:
+                    # Don't descend into the directory, it is represented
+                    # by the common prefix.
+                    if self._has_files(entry_path):
+                        yield 'prefix', prefix + dir_key[len(prefix):].split('/')[0] + '/', None
+                    continue
+                yield from self._iter_keys(dir_key, prefix, delimiter)
+            elif key.startswith(prefix):
+                yield 'key', key, os.stat(entry_path)
+
+    def list_objects(self, prefix, delimiter=None, max_keys=1000):
+        # Only the "/" delimiter is supported.
+        directory = prefix[:prefix.rfind('/') + 1]
+        common_prefixes = []
+        contents = []
+        for entry_type, key, stat in self._iter_keys(directory, prefix, delimiter):
+            if len(common_prefixes) + len(contents) >= max_keys:
+                break
+            if entry_type == 'prefix':
+                common_prefixes.append({'Prefix': key})
+            else:
+                contents.append(self._get_file_meta(key, stat))
+
+        objects = {'KeyCount': len(common_prefixes) + len(contents)}
+        if common_prefixes:
+            objects['CommonPrefixes'] = common_prefixes
+        if contents:
+            objects['Contents'] = contents
+
+        return objects
+
+    def iter_objects(self, prefix, delimiter=None):
+        # The whole listing is returned as a single page.
+        yield self.list_objects(prefix, delimiter, max_keys=float('inf'))
+
+    def head_object(self, key):
+        path = self._get_path(key)
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise StorageNoSuchKeyError(key)
+        if not os.path.isfile(path):
+            raise StorageNoSuchKeyError(key)
+
+        metadata = {}
+        try:
+            for attr in os.listxattr(path):
+                if attr.startswith(LocalStorage.XATTR_PREFIX):
+                    metadata[attr[len(LocalStorage.XATTR_PREFIX):]] = \
+                        os.getxattr(path, attr).decode('utf-8')
+        except OSError:
+            pass
+
+        return {
+            'ETag': LocalStorage._get_etag(stat),
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            'ContentLength': stat.st_size,
+            'Metadata': metadata
+        }
+
+    def get_object(self, key, if_none_match=None):
+        path = self._get_path(key)
+        try:
+            body = open(path, 'rb')
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise StorageNoSuchKeyError(key)
+
+        stat = os.fstat(body.fileno())
+        etag = LocalStorage._get_etag(stat)
+        if if_none_match and if_none_match == etag:
+            body.close()
+            return None
+
+        return {'Body': body, 'ETag': etag, 'ContentLength': stat.st_size}
+
+    def _set_metadata(self, path, metadata):
+        """Save the metadata to the extended attributes of the file."""
+        try:
+            for name, value in metadata.items():
+                os.setxattr(path, LocalStorage.XATTR_PREFIX + name, value.encode('utf-8'))
+        except OSError as err:
+            logging.debug("Can't save the metadata of {0}: {1}".format(path, err))
+
+    def _write_file(self, key, fileobj, metadata):
+        """Atomically write the file-like object to the storage."""
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(prefix='.rws_', dir=os.path.dirname(path),
+                                         delete=False) as tmp_file:
+            md5 = hashlib.md5()
+            while True:
+                chunk = fileobj.read(1024 * 1024)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                tmp_file.write(chunk)
+        if metadata:
+            self._set_metadata(tmp_file.name, metadata)
+        os.replace(tmp_file.name, path)
+
+        return md5.hexdigest()
+
+    def put_object(self, key, fileobj, digests):
+        md5 = self._write_file(key, fileobj, {'md5': digests['md5'],
+                                              'sha256': digests['sha256']})
+        if md5 != digests['md5']:
+            os.unlink(self._get_path(key))
+            raise StorageIntegrityError('The uploaded object "{0}" is corrupted.'.format(key))
+
+    def copy_object(self, source_key, key, metadata=None):
+        source_path = self._get_path(source_key)
+        if not os.path.isfile(source_path):
+            raise StorageNoSuchKeyError(source_key)
+        if metadata is None:
+            metadata = self.head_object(source_key)['Metadata']
+        with open(source_path, 'rb') as source_file:
+            self._write_file(key, source_file, metadata)
+
+    def delete_objects(self, keys):
+        for key in keys:
+            try:
+                os.unlink(self._get_path(key))
+            except FileNotFoundError:
+                pass
+
+    def get_mkrepo_args(self, path):
+        return [self._get_path(path)]
+
+
+# Storage backends by name.
+STORAGE_BACKENDS = {'s3': S3Storage, 'local': LocalStorage}
+
+
+def create_storage(settings):
+    """Create the storage according to the settings (see the "model" section
+    of the configuration file). The "storage.backend" setting chooses the
+    backend (see STORAGE_BACKENDS), "s3" is used by default.
+    """
+    backend = (settings.get('storage') or {}).get('backend') or 's3'
+    if backend not in STORAGE_BACKENDS:
+        raise RuntimeError('Unknown storage backend: {0}.'.format(backend))
+
+    return STORAGE_BACKENDS[backend](settings)
@@ -0,0 +1,149 @@
+"""History of the repository synchronization jobs."""
+
+from collections import deque
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+
+class SyncHistory:
+    """SyncHistory - bounded history of the synchronization jobs of each
+    repository and the jobs that are queued or running at the moment.
+
+    A job record is a dictionary:
+        - repo - path to the repository
+        - trigger - reason of the synchronization ("upload", "post",
+            "startup", ...)
+        - enqueued - time when the repository was added to the queue
+        - started - time when the synchronization was started
+        - finished - time when the synchronization was finished
+        - duration - duration of the synchronization in seconds
+        - exit_code - exit code of "mkrepo"
+    All the times are Unix timestamps. All actions with "queued", "in_flight"
+    and "history" must be done under the "lock".
+    """
+
+    def __init__(self, size=20, path=None, persist_interval=60):
+        """size(int) - number of the records kept for each repository.
+        path(string) - file to persist the history (not persisted if None).
+        persist_interval(int) - minimum interval in seconds between writes
+        of the history to the file.
+        """
+        self.size = size
+        self.path = path
+        self.persist_interval = persist_interval
+        self.last_persist = 0
+        # Only one thread writes the file at the same time.
+        self.persist_lock = Lock()
+
+        self.lock = Lock()
+        # queued - dictionary (repo path to job record).
+        self.queued = {}
+        # in_flight - dictionary (repo path to job record).
+        self.in_flight = {}
+        # history - dictionary (repo path to deque of job records).
+        self.history = {}
+
+        if self.path and os.path.isfile(self.path):
+            try:
+                with open(self.path) as history_file:
+                    for repo, records in json.load(history_file).items():
+                        self.history[repo] = deque(records, maxlen=self.size)
+            except (OSError, ValueError) as err:
+                logging.warning("Can't load the sync history: " + str(err))
+
+    def enqueued(self, repo, trigger):
+        """Register the repository added to the queue. If the repository
+        is already queued, the first trigger is kept.
+        """
+        with self.lock:
+            if repo not in self.queued:
+                self.queued[repo] = {'repo': repo, 'trigger': trigger,
+                                     'enqueued': time.time()}
+
+    def started(self, repo):
+        """Register the start of the synchronization of the repository."""
+        with self.lock:
+            job = self.queued.pop(repo, None) or \
+                {'repo': repo, 'trigger': 'unknown', 'enqueued': None}
+            job['started'] = time.time()
+            self.in_flight[repo] = job
+
+    def finished(self, repo, exit_code):
+        """Register the end of the synchronization of the repository."""
+        with self.lock:
+            job = self.in_flight.pop(repo, None) or \
+                {'repo': repo, 'trigger': 'unknown', 'enqueued': None,
+                 'started': None}
+            job['finished'] = time.time()
+            if job['started'] is not None:
+                job['duration'] = round(job['finished'] - job['started'], 3)
+            job['exit_code'] = exit_code
+            self.history.setdefault(repo, deque(maxlen=self.size)).append(job)
+
+            persist = self.path and \
+                job['finished'] - self.last_persist >= self.persist_interval
+            if persist:
+                self.last_persist = job['finished']
+                history = {repo: list(records) for repo, records in self.history.items()}
+
+        if persist:
+            self._persist(history)
+
+    def _persist(self, history):
+        """Write the history to the file."""
+        tmp_path = self.path + '.tmp'
+        with self.persist_lock:
+            try:
+                with open(tmp_path, 'w') as history_file:
+                    json.dump(history, history_file)
+                os.replace(tmp_path, self.path)
+            except OSError as err:
+                logging.warning("Can't persist the sync history: " + str(err))
+
+    def get_job_states(self, repos, since):
+        """Returns the dictionary (repo path to state of the job enqueued at
+        "since" or later). The state can be:
+            - "done" - the synchronization was started after "since" and
+                has been completed successfully
+            - "running" - the synchronization is running
+            - "queued" - the repository is waiting for the synchronization
+                (including the retry of the failed synchronization)
+        """
+        states = {}
+        with self.lock:
+            for repo in repos:
+                if any(record.get('started') and record['started'] >= since and
+                       record.get('exit_code') == 0
+                       for record in self.history.get(repo, [])):
+                    states[repo] = 'done'
+                elif repo in self.in_flight:
+                    states[repo] = 'running'
+                else:
+                    states[repo] = 'queued'
+
+        return states
+
+    def get_status(self, repo_prefix='', limit=None):
+        """Returns the queued and running jobs and the recent history of the
+        repositories with paths starting with "repo_prefix". "limit" is the
+        number of the last records of each repository.
+        """
+        with self.lock:
+            queued = [dict(job) for repo, job in self.queued.items()
+                      if repo.startswith(repo_prefix)]
+            in_flight = [dict(job) for repo, job in self.in_flight.items()
+                         if repo.startswith(repo_prefix)]
+            history = {}
+            for repo, records in self.history.items():
+                if repo.startswith(repo_prefix):
+                    records = list(records)
+                    history[repo] = records[-limit:] if limit else records
+
+        return {
+            'queued': sorted(queued, key=lambda job: job['enqueued'] or 0),
+            'in_flight': sorted(in_flight, key=lambda job: job['started']),
+            'history': history
+        }
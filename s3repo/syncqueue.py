@@ -0,0 +1,151 @@
+"""Queue of the repositories waiting for the metainformation
+synchronization."""
+
+from collections import OrderedDict
+import time
+from threading import Condition
+
+
+# Priority classes of the synchronization jobs from the highest to the
+# lowest one.
+SYNC_CLASSES = ('upload', 'post', 'bulk')
+
+# Priority class of the job by its trigger (see "SyncHistory").
+TRIGGER_CLASSES = {
+    'upload': 'upload',
+    'promote': 'upload',
+    'post': 'post',
+    'delete': 'post',
+    'prune': 'post',
+    'startup': 'bulk',
+    'sweep': 'bulk',
+}
+
+
+class SyncJob:
+    """SyncJob - repository waiting for the synchronization."""
+
+    def __init__(self, repo, sync_class, enqueued):
+        # Repository to synchronize (RepoInfo).
+        self.repo = repo
+        # Priority class (see SYNC_CLASSES).
+        self.sync_class = sync_class
+        # Time (monotonic) when the repository was added to the queue.
+        self.enqueued = enqueued
+
+
+class SyncQueue:
+    """SyncQueue - queue of the repositories waiting for the synchronization
+    with the priority classes.
+
+    The job of the higher class is taken first, but the priority of the
+    job grows by one class every "aging_interval" seconds of waiting, so the
+    jobs of the lower classes still make progress. The number of jobs of
+    each class running at the same time is limited, so the jobs of one class
+    (for example, a bulk resynchronization) can't occupy all the workers.
+    A repository is never synchronized by several workers at the same time.
+    All actions with "jobs", "in_flight" and "class_in_flight" must be done
+    under the "condition".
+    """
+
+    def __init__(self, class_limits=None, aging_interval=60):
+        """class_limits - dictionary (class to maximum number of the running
+        jobs of the class), the absent classes aren't limited.
+        aging_interval(int) - time in seconds after which a waiting job gets
+        the priority of the next higher class.
+        """
+        self.class_limits = class_limits or {}
+        self.aging_interval = aging_interval
+
+        self.condition = Condition()
+        # jobs - dictionary (class to ordered dictionary (repository path to
+        # SyncJob)). The jobs of each class are ordered by the enqueue time.
+        self.jobs = {sync_class: OrderedDict() for sync_class in SYNC_CLASSES}
+        # in_flight - set of paths of the repositories being synchronized.
+        self.in_flight = set()
+        # class_in_flight - dictionary (class to number of the running jobs).
+        self.class_in_flight = {sync_class: 0 for sync_class in SYNC_CLASSES}
+
+    def put(self, repo, trigger, sync_class=None):
+        """Add the repository to the queue. "sync_class" is determined by
+        the trigger if not set. If the repository is already queued, the job
+        is merged (see "RepoInfo.merge") and gets the higher of the classes.
+        """
+        sync_class = sync_class or TRIGGER_CLASSES.get(trigger, 'bulk')
+        with self.condition:
+            enqueued = time.monotonic()
+            for queued_class, class_jobs in self.jobs.items():
+                job = class_jobs.get(repo.path)
+                if job is None:
+                    continue
+                del class_jobs[repo.path]
+                repo = job.repo.merge(repo)
+                enqueued = job.enqueued
+                if SYNC_CLASSES.index(queued_class) < SYNC_CLASSES.index(sync_class):
+                    sync_class = queued_class
+                break
+
+            self.jobs[sync_class][repo.path] = SyncJob(repo, sync_class, enqueued)
+            self.condition.notify_all()
+
+    def _get_first_job(self, sync_class):
+        """Returns the oldest job of the class whose repository isn't being
+        synchronized. Must be called under the "condition".
+        """
+        for path, job in self.jobs[sync_class].items():
+            if path not in self.in_flight:
+                return job
+
+        return None
+
+    def take(self):
+        """Returns the job with the highest priority which can be started
+        or None. The job must be finished by "done".
+        """
+        with self.condition:
+            now = time.monotonic()
+            best_job = None
+            best_priority = None
+            for rank, sync_class in enumerate(SYNC_CLASSES):
+                limit = self.class_limits.get(sync_class)
+                if limit and self.class_in_flight[sync_class] >= limit:
+                    continue
+                job = self._get_first_job(sync_class)
+                if job is None:
+                    continue
+                priority = rank - (now - job.enqueued) / self.aging_interval
+                if best_priority is None or priority < best_priority:
+                    best_job, best_priority = job, priority
+
+            if best_job is not None:
+                del self.jobs[best_job.sync_class][best_job.repo.path]
+                self.in_flight.add(best_job.repo.path)
+                self.class_in_flight[best_job.sync_class] += 1
+
+            return best_job
+
+    def done(self, job):
+        """Mark the job taken by "take" as finished."""
+        with self.condition:
+            self.in_flight.discard(job.repo.path)
+            self.class_in_flight[job.sync_class] -= 1
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        """Wait until a job is added or finished (at most "timeout" seconds)."""
+        with self.condition:
+            self.condition.wait(timeout)
+
+    def __len__(self):
+        with self.condition:
+            return sum(len(class_jobs) for class_jobs in self.jobs.values())
+
+    def get_stats(self):
+        """Returns the dictionary (class to dictionary with the number of the
+        "queued" and "in_flight" jobs and the "limit").
+        """
+        with self.condition:
+            return {sync_class: {'queued': len(self.jobs[sync_class]),
+                                 'in_flight': self.class_in_flight[sync_class],
+                                 'limit': self.class_limits.get(sync_class)}
+                    for sync_class in SYNC_CLASSES}
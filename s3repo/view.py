@@ -3,11 +3,15 @@
 import logging
 import os
 
+from flask import redirect
 from flask import render_template
 from flask import Response
+from flask import send_file
 from flask import request
 from flask.views import View
 
+from s3repo.filecache import CachedFile
+
 
 class S3View(View):
     """View for working with S3 according to the REST model."""
@@ -55,8 +59,21 @@ class S3View(View):
         """Download a file to user's machine."""
         filename = path.split('/')[-1]
 
+        # The file from the local disk cache is sent with "sendfile" if
+        # the WSGI server supports it. It must not be cached by the client,
+        # because the metainformation can be updated at any moment.
+        if isinstance(response, CachedFile):
+            return send_file(response, mimetype='application/octet-stream',
+                             as_attachment=True, download_name=filename,
+                             max_age=0)
+
+        try:
+            data = response.read()
+        finally:
+            response.close()
+
         return Response(
-            response.read(),
+            data,
             mimetype='application/octet-stream',
             headers={"Content-Disposition": "attachment; filename=" + filename}
             )
@@ -81,6 +98,11 @@ class S3View(View):
                 return S3View._get_directory(path, items)
             elif obj_type == 'file':
                 err_msg = "Can't download file from S3."
+                # Redirect the client to S3 if the download mode allows it,
+                # so the file is not transferred through RWS.
+                url = self.model.get_file_url(path)
+                if url:
+                    return redirect(url, code=302)
                 response = self.model.get_file(path)
                 return S3View._get_file(path, response)
             else:
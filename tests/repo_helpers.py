@@ -0,0 +1,83 @@
+"""Helpers of the tests: the model on the "local" storage and the packages."""
+
+import io
+import os
+import subprocess
+import time
+
+from s3repo.model import S3AsyncModel
+
+
+# The supported repositories of the tested models.
+SUPPORTED_REPOS = {
+    'repo_kind': ['live', 'release'],
+    'tarantool_series': ['3'],
+    'distrs': {
+        'ubuntu': {'base': 'deb', 'versions': ['focal', 'jammy']},
+        'el': {'base': 'rpm', 'versions': ['9']},
+    },
+}
+
+
+def create_model(root, **settings):
+    """Create the model on the "local" storage in the "root" directory.
+    The settings are added to the default ones.
+    """
+    model_settings = {
+        'supported_repos': SUPPORTED_REPOS,
+        'storage': {'backend': 'local', 'path': os.path.join(root, 'storage')},
+        'sync': {'max_workers': 2, 'scratch_dir': root},
+    }
+    model_settings.update(settings)
+
+    return S3AsyncModel(model_settings)
+
+
+def wait_sync(model, timeout=60):
+    """Wait until the queued and running synchronization jobs are
+    completed.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = model.get_sync_status()
+        if not status['queued'] and not status['in_flight'] and not len(model.sync_queue):
+            return
+        time.sleep(0.1)
+
+    raise AssertionError('The synchronization has not been completed.')
+
+
+def make_deb(directory, name, version, arch='amd64'):
+    """Build a minimal deb package in the directory. Returns the path."""
+    package_dir = os.path.join(directory, '{0}_{1}_{2}'.format(name, version, arch))
+    os.makedirs(os.path.join(package_dir, 'DEBIAN'))
+    with open(os.path.join(package_dir, 'DEBIAN', 'control'), 'w') as control_file:
+        control_file.write('Package: {0}\nVersion: {1}\nArchitecture: {2}\n'
+                           'Maintainer: rws <rws@tarantool.org>\n'
+                           'Description: test package\n'.format(name, version, arch))
+    path = package_dir + '.deb'
+    subprocess.run(['dpkg-deb', '--build', '-Zgzip', package_dir, path],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    return path
+
+
+def read_object(storage, key):
+    """Returns the data of the object."""
+    body = storage.get_object(key)['Body']
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+
+def put_object(storage, key, data):
+    """Put the object with the data to the storage."""
+    fileobj = io.BytesIO(data)
+    storage.put_object(key, fileobj, storage.compute_digests(fileobj))
+
+
+def list_keys(storage, prefix=''):
+    """Returns the sorted keys of all objects of the storage."""
+    return sorted(file_meta['Key'] for objects in storage.iter_objects(prefix)
+                  for file_meta in objects.get('Contents') or [])
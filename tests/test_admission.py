@@ -0,0 +1,130 @@
+"""Tests of the admission control of the uploads."""
+
+import base64
+import io
+import tempfile
+import unittest
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+from helpers.auth_provider import auth_provider
+from repo_helpers import create_model
+from repo_helpers import list_keys
+from s3repo.admission import UploadAdmission
+from s3repo.admission import UploadRejectedError
+from s3repo.controller import S3Controller
+
+
+class UploadAdmissionTest(unittest.TestCase):
+    """The limits of the concurrent uploads."""
+
+    def _get_status(self, admission, size, sync_queue_size=0):
+        """Returns the status of the rejected upload or None."""
+        try:
+            with admission.admit(size, sync_queue_size):
+                return None
+        except UploadRejectedError as err:
+            return err.status
+
+    def test_size_limits(self):
+        """The upload without the size or larger than the limit is
+        rejected.
+        """
+        admission = UploadAdmission({'max_upload_bytes': 100})
+        self.assertIsNone(self._get_status(admission, 100))
+        self.assertEqual(self._get_status(admission, None), 411)
+        self.assertEqual(self._get_status(admission, 101), 413)
+        # The size is optional without the limit.
+        self.assertIsNone(self._get_status(UploadAdmission({}), None))
+
+    def test_sync_queue_limit(self):
+        """The upload is rejected while the sync queue is full."""
+        admission = UploadAdmission({'max_sync_queue': 2})
+        self.assertIsNone(self._get_status(admission, 10, 1))
+        self.assertEqual(self._get_status(admission, 10, 2), 429)
+
+    def test_concurrent_uploads(self):
+        """The capacity is held while the upload is in progress."""
+        admission = UploadAdmission({'max_uploads': 2, 'max_upload_bytes': 100})
+        with admission.admit(60, 0):
+            self.assertEqual(self._get_status(admission, 50), 503)
+            with admission.admit(40, 0):
+                self.assertEqual(self._get_status(admission, 1), 503)
+                self.assertEqual((admission.uploads, admission.upload_bytes), (2, 100))
+        self.assertEqual((admission.uploads, admission.upload_bytes), (0, 0))
+        self.assertIsNone(self._get_status(admission, 100))
+
+    def test_release_on_error(self):
+        """The capacity of the failed upload is released."""
+        admission = UploadAdmission({'max_uploads': 1})
+        with self.assertRaises(ValueError):
+            with admission.admit(10, 0):
+                raise ValueError('The upload is broken.')
+        self.assertEqual((admission.uploads, admission.upload_bytes), (0, 0))
+
+
+class UploadControllerTest(unittest.TestCase):
+    """The rejected uploads are reported with the "Retry-After" header if
+    they can be retried.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name)
+        # The uploaded packages aren't really synchronized.
+        self.model._sync_repo = lambda sync_repo: 0
+        self.admission = UploadAdmission({'max_uploads': 1, 'max_upload_bytes': 1024,
+                                          'max_sync_queue': 10, 'retry_after': 7})
+
+        auth_provider.set_credentials({'user': generate_password_hash('secret')})
+        self.addCleanup(auth_provider.set_credentials, {})
+
+        app = Flask(__name__)
+        s3_controller = S3Controller.as_view('s3_controller', self.model, self.admission)
+        app.add_url_rule('/<path:subpath>', view_func=s3_controller,
+                         methods=['PUT', 'POST', 'DELETE'])
+        self.client = app.test_client()
+
+    def _put(self, data):
+        """Upload the rpm package with the data."""
+        credentials = base64.b64encode(b'user:secret').decode('ascii')
+        return self.client.put(
+            '/live/3/el/9', headers={'Authorization': 'Basic ' + credentials},
+            data={'file': (io.BytesIO(data), 'tarantool-3.0.0-1.el9.x86_64.rpm')})
+
+    def test_admitted(self):
+        """The admitted upload is stored."""
+        response = self._put(b'rpm')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Retry-After', response.headers)
+        self.assertEqual(list_keys(self.model.storage),
+                         ['live/3/el/9/x86_64/Packages/tarantool-3.0.0-1.el9.x86_64.rpm'])
+
+    def test_too_large(self):
+        """The too large upload can't be retried."""
+        response = self._put(b'x' * 2048)
+        self.assertEqual(response.status_code, 413)
+        self.assertNotIn('Retry-After', response.headers)
+        self.assertEqual(list_keys(self.model.storage), [])
+
+    def test_busy(self):
+        """The upload rejected by the concurrency limit can be retried."""
+        with self.admission.admit(10, 0):
+            response = self._put(b'rpm')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '7')
+
+    def test_sync_queue_full(self):
+        """The upload rejected by the depth of the sync queue can be
+        retried.
+        """
+        self.model.get_sync_queue_size = lambda: 10
+        response = self._put(b'rpm')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Tests of the authentication with the "Basic" credentials and the
+"Bearer" tokens.
+"""
+
+import base64
+import json
+import time
+import unittest
+
+from flask import Flask
+from flask_httpauth import MultiAuth
+from werkzeug.security import generate_password_hash
+
+from helpers.auth_provider import HTTPAuthProvider
+from helpers.auth_provider import TokenAuthProvider
+
+
+class TokenAuthTest(unittest.TestCase):
+    """Only the valid signed tokens of the known users are accepted."""
+
+    def setUp(self):
+        self.auth_provider = HTTPAuthProvider()
+        self.auth_provider.set_credentials({'user': generate_password_hash('secret')})
+        self.token_auth_provider = TokenAuthProvider(self.auth_provider)
+        self.token_auth_provider.set_settings('token-secret', 600)
+        multi_auth_provider = MultiAuth(self.auth_provider, self.token_auth_provider)
+
+        app = Flask(__name__)
+
+        @app.route('/protected')
+        @multi_auth_provider.login_required
+        def protected():
+            return 'ok'
+
+        self.client = app.test_client()
+
+    def _sign(self, claims):
+        """Returns the token with the claims signed by the provider."""
+        payload = TokenAuthProvider._encode(json.dumps(claims).encode('utf-8'))
+        return '.'.join([payload, TokenAuthProvider._encode(
+            self.token_auth_provider._sign(payload))])
+
+    def _get_status(self, token):
+        """Returns the status of the request with the bearer token."""
+        response = self.client.get('/protected',
+                                   headers={'Authorization': 'Bearer ' + token})
+        return response.status_code
+
+    def test_valid_token(self):
+        """The issued token and the credentials are accepted."""
+        self.assertEqual(self._get_status(self.token_auth_provider.generate_token('user')), 200)
+        credentials = base64.b64encode(b'user:secret').decode('ascii')
+        response = self.client.get('/protected',
+                                   headers={'Authorization': 'Basic ' + credentials})
+        self.assertEqual(response.status_code, 200)
+
+    def test_expired_token(self):
+        """The expired token is rejected."""
+        token = self._sign({'user': 'user', 'exp': int(time.time()) - 1})
+        self.assertEqual(self._get_status(token), 401)
+
+    def test_malformed_expiration(self):
+        """The token with a non-numeric expiration time is rejected."""
+        for expiration in ['9999999999', None, True, [], float('nan')]:
+            with self.subTest(expiration=expiration):
+                token = self._sign({'user': 'user', 'exp': expiration})
+                self.assertEqual(self._get_status(token), 401)
+        token = self._sign({'user': 'user'})
+        self.assertEqual(self._get_status(token), 401)
+
+    def test_bad_signature(self):
+        """The token with a foreign signature or a malformed token is
+        rejected.
+        """
+        payload = self.token_auth_provider.generate_token('user').split('.')[0]
+        self.assertEqual(self._get_status(payload + '.' + TokenAuthProvider._encode(b'x' * 32)), 401)
+        self.assertEqual(self._get_status(payload), 401)
+        self.assertEqual(self._get_status('!!!.???'), 401)
+        self.assertEqual(self.client.get('/protected').status_code, 401)
+
+    def test_unknown_user(self):
+        """The token of the removed user is rejected."""
+        token = self.token_auth_provider.generate_token('user')
+        self.auth_provider.set_credentials({})
+        self.assertEqual(self._get_status(token), 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests of the incremental backup and restore of the "local" storage."""
+
+import os
+import tempfile
+import unittest
+
+from repo_helpers import list_keys
+from repo_helpers import put_object
+from repo_helpers import read_object
+from s3repo.backup import Backup
+from s3repo.storage import create_storage
+
+
+class BackupTest(unittest.TestCase):
+    """Backup and restore of the snapshots."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.storage = create_storage({'storage': {
+            'backend': 'local', 'path': os.path.join(self.tmp_dir.name, 'storage')}})
+        self.backup = Backup(self.storage, os.path.join(self.tmp_dir.name, 'backup'),
+                             workers=2)
+        put_object(self.storage, 'live/a.rpm', b'a')
+        put_object(self.storage, 'live/b.rpm', b'b')
+
+        # The requests to the storage are counted.
+        self.downloaded = []
+        self.uploaded = []
+        get_object = self.storage.get_object
+        put = self.storage.put_object
+
+        def count_get_object(key, *args, **kwargs):
+            self.downloaded.append(key)
+            return get_object(key, *args, **kwargs)
+
+        def count_put_object(key, *args, **kwargs):
+            self.uploaded.append(key)
+            return put(key, *args, **kwargs)
+
+        self.storage.get_object = count_get_object
+        self.storage.put_object = count_put_object
+
+    def test_incremental_backup(self):
+        """Only the changed objects are downloaded by the next run."""
+        first_name, failed = self.backup.backup('live/')
+        self.assertEqual(failed, 0)
+        self.assertEqual(sorted(self.downloaded), ['live/a.rpm', 'live/b.rpm'])
+
+        self.downloaded.clear()
+        os.unlink(os.path.join(self.tmp_dir.name, 'storage', 'live', 'a.rpm'))
+        put_object(self.storage, 'live/c.rpm', b'b')
+        # Let the second snapshot have another name.
+        os.rename(os.path.join(self.backup.snapshots_path, first_name + '.json'),
+                  os.path.join(self.backup.snapshots_path, 'first.json'))
+        _, failed = self.backup.backup('live/')
+        self.assertEqual(failed, 0)
+        self.assertEqual(self.downloaded, ['live/c.rpm'])
+
+        snapshot = self.backup.load_snapshot()
+        self.assertEqual(sorted(snapshot['objects']), ['live/b.rpm', 'live/c.rpm'])
+        self.assertEqual(snapshot['deleted'], ['live/a.rpm'])
+        # The same content is stored once.
+        self.assertEqual(snapshot['objects']['live/b.rpm']['sha256'],
+                         snapshot['objects']['live/c.rpm']['sha256'])
+        self.assertEqual(sorted(self.backup.load_snapshot('first')['objects']),
+                         ['live/a.rpm', 'live/b.rpm'])
+
+    def test_restore(self):
+        """The changed and deleted objects are restored, the unchanged ones
+        are not uploaded again.
+        """
+        self.backup.backup('live/')
+        put_object(self.storage, 'live/a.rpm', b'changed')
+        self.storage.delete_objects(['live/b.rpm'])
+        put_object(self.storage, 'live/new.rpm', b'new')
+        self.uploaded.clear()
+
+        self.assertEqual(self.backup.restore(delete=True), 0)
+        self.assertEqual(sorted(self.uploaded), ['live/a.rpm', 'live/b.rpm'])
+        self.assertEqual(list_keys(self.storage), ['live/a.rpm', 'live/b.rpm'])
+        self.assertEqual(read_object(self.storage, 'live/a.rpm'), b'a')
+        self.assertEqual(read_object(self.storage, 'live/b.rpm'), b'b')
+
+        # The restored objects have other ETags than in the snapshot, but
+        # the same content.
+        self.uploaded.clear()
+        self.assertEqual(self.backup.restore(delete=True), 0)
+        self.assertEqual(self.uploaded, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
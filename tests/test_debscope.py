@@ -0,0 +1,97 @@
+"""Tests of the update of the deb-based repository limited to the given
+codenames.
+"""
+
+import os
+import tempfile
+import unittest
+
+from repo_helpers import make_deb
+from s3repo import debscope
+import storage
+
+
+class CodenameScopedStorageTest(unittest.TestCase):
+    """Only the files of the codenames are shown to "mkrepo"."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = os.path.join(self.tmp_dir.name, 'repo')
+        self.repo_storage = storage.FilesystemStorage(self.root)
+        os.makedirs(self.root)
+
+    def _add_deb(self, codename, version):
+        """Put the deb package to the pool of the codename."""
+        deb_dir = os.path.join(self.tmp_dir.name, 'debs', codename)
+        os.makedirs(deb_dir, exist_ok=True)
+        deb = make_deb(deb_dir, 'tarantool', version)
+        self.repo_storage.upload_file(
+            'pool/{0}/main/t/tarantool/{1}'.format(codename, os.path.basename(deb)), deb)
+
+    def _update(self, codenames):
+        """Update the metainformation of the codenames."""
+        temp_dir = os.path.join(self.tmp_dir.name, 'mkrepo')
+        os.makedirs(temp_dir, exist_ok=True)
+        scoped_storage = debscope.CodenameScopedStorage(self.repo_storage, codenames)
+        debscope.update_repo(scoped_storage, False, temp_dir)
+
+    def _get_packages(self, codename):
+        """Returns the "Filename" fields of the "Packages" index."""
+        packages = self.repo_storage.read_file(
+            'dists/{0}/main/binary-amd64/Packages'.format(codename)).decode('utf-8')
+        return sorted(line.split(': ', 1)[1] for line in packages.splitlines()
+                      if line.startswith('Filename: '))
+
+    def test_files(self):
+        """The neighbouring codenames aren't listed."""
+        self.repo_storage.write_file('pool/jammy/main/a.deb', b'')
+        self.repo_storage.write_file('pool/jammy-backports/main/b.deb', b'')
+        self.repo_storage.write_file('pool/focal/main/c.deb', b'')
+        self.repo_storage.write_file('dists/focal/Release', b'')
+        self.repo_storage.write_file('other/d', b'')
+        scoped_storage = debscope.CodenameScopedStorage(self.repo_storage, ['jammy'])
+
+        self.assertEqual(list(scoped_storage.files('pool')), ['pool/jammy/main/a.deb'])
+        self.assertEqual(list(scoped_storage.files('dists/')), [])
+        self.assertEqual(sorted(scoped_storage.files()), [
+            'dists/focal/Release', 'other/d', 'pool/focal/main/c.deb',
+            'pool/jammy-backports/main/b.deb', 'pool/jammy/main/a.deb'])
+        # Other methods are passed to the wrapped storage.
+        self.assertEqual(scoped_storage.basedir, self.root)
+
+    def test_update_codename(self):
+        """The indexes of other codenames are left untouched."""
+        self._add_deb('focal', '3.0.0-1')
+        self._add_deb('jammy', '3.0.0-1')
+        self._update(['focal', 'jammy'])
+        focal_release = self.repo_storage.read_file('dists/focal/Release')
+
+        self._add_deb('jammy', '3.0.1-1')
+        self._add_deb('focal', '3.0.1-1')
+        self._update(['jammy'])
+
+        self.assertEqual(self._get_packages('jammy'), [
+            'pool/jammy/main/t/tarantool/tarantool_3.0.0-1_amd64.deb',
+            'pool/jammy/main/t/tarantool/tarantool_3.0.1-1_amd64.deb',
+        ])
+        self.assertEqual(self._get_packages('focal'), [
+            'pool/focal/main/t/tarantool/tarantool_3.0.0-1_amd64.deb',
+        ])
+        self.assertEqual(self.repo_storage.read_file('dists/focal/Release'), focal_release)
+
+    def test_drop_missing_units(self):
+        """The units of the deleted files are dropped from the indexes."""
+        self._add_deb('jammy', '3.0.0-1')
+        self._add_deb('jammy', '3.0.1-1')
+        self._update(['jammy'])
+        self.repo_storage.delete_file('pool/jammy/main/t/tarantool/tarantool_3.0.0-1_amd64.deb')
+
+        self._update(['jammy'])
+        self.assertEqual(self._get_packages('jammy'), [
+            'pool/jammy/main/t/tarantool/tarantool_3.0.1-1_amd64.deb',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Tests of the deletion of the packages from the deb-based repositories.
+
+The repositories are kept in the "local" storage, the metainformation is
+updated by the real "mkrepo" code (see "s3repo.debscope").
+"""
+
+import tempfile
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import list_keys
+from repo_helpers import make_deb
+from repo_helpers import read_object
+from repo_helpers import wait_sync
+from s3repo.package import Package
+from s3repo.repoinfo import RepoAnnotation
+from s3repo.repoinfo import RepoInfo
+
+
+PACKAGES_KEY = 'live/3/ubuntu/dists/jammy/main/binary-amd64/Packages'
+
+
+class DebDeleteTest(unittest.TestCase):
+    """The deleted packages disappear from the indexes."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name)
+
+    def _put_package(self, *debs):
+        """Upload the deb files to the "live/3/ubuntu/jammy" repository."""
+        package = Package()
+        package.product = 'tarantool'
+        package.repo_annotations = [RepoAnnotation('live/3/ubuntu/jammy',
+                                                   self.model.repo_index)]
+        files = []
+        for deb in debs:
+            deb_file = open(deb, 'rb')
+            files.append(deb_file)
+            package.add_file(deb.split('/')[-1], deb_file)
+        try:
+            self.model.put_package(package)
+        finally:
+            for deb_file in files:
+                deb_file.close()
+        wait_sync(self.model)
+
+    def _get_indexed_packages(self):
+        """Returns the sorted "Filename" fields of the "Packages" index."""
+        packages = read_object(self.model.storage, PACKAGES_KEY).decode('utf-8')
+        return sorted(line.split(': ', 1)[1] for line in packages.splitlines()
+                      if line.startswith('Filename: '))
+
+    def test_delete_package(self):
+        """The deleted package is removed from the "Packages" index."""
+        self._put_package(make_deb(self.tmp_dir.name, 'tarantool', '3.0.0-1'),
+                          make_deb(self.tmp_dir.name, 'tarantool', '3.0.1-1'))
+        self.assertEqual(self._get_indexed_packages(), [
+            'pool/jammy/main/t/tarantool/tarantool_3.0.0-1_amd64.deb',
+            'pool/jammy/main/t/tarantool/tarantool_3.0.1-1_amd64.deb',
+        ])
+
+        package = Package()
+        package.product = 'tarantool'
+        package.repo_annotations = [RepoAnnotation('live/3/ubuntu/jammy',
+                                                   self.model.repo_index)]
+        package.add_file('tarantool_3.0.0-1_amd64.deb', None)
+        self.model.delete_package(package)
+        wait_sync(self.model)
+
+        self.assertEqual(self._get_indexed_packages(), [
+            'pool/jammy/main/t/tarantool/tarantool_3.0.1-1_amd64.deb',
+        ])
+        self.assertNotIn('live/3/ubuntu/pool/jammy/main/t/tarantool/tarantool_3.0.0-1_amd64.deb',
+                         list_keys(self.model.storage))
+
+    def test_full_sync_after_delete(self):
+        """The synchronization of the whole repository (not limited to
+        the codenames) drops the deleted files too.
+        """
+        self._put_package(make_deb(self.tmp_dir.name, 'tarantool', '3.0.0-1'),
+                          make_deb(self.tmp_dir.name, 'tarantool', '3.0.1-1'))
+        self.model.storage.delete_objects(
+            ['live/3/ubuntu/pool/jammy/main/t/tarantool/tarantool_3.0.1-1_amd64.deb'])
+
+        self.assertEqual(self.model._sync_repo(RepoInfo('live/3/ubuntu')), 0)
+
+        self.assertEqual(self._get_indexed_packages(), [
+            'pool/jammy/main/t/tarantool/tarantool_3.0.0-1_amd64.deb',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""Tests of the local disk cache of the metainformation files."""
+
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import put_object
+from s3repo.filecache import CachedFile
+from s3repo.filecache import FileCache
+
+
+REPOMD_KEY = 'live/3/el/9/x86_64/repodata/repomd.xml'
+
+
+class FileCacheTest(unittest.TestCase):
+    """LRU eviction and invalidation of the entries."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = FileCache(os.path.join(self.tmp_dir.name, 'cache'), 10, 60)
+
+    def _read(self, key):
+        """Returns the cached data or None."""
+        cached_file = self.cache.open(key)
+        if cached_file is None:
+            return None
+        with cached_file:
+            self.assertIsInstance(cached_file, CachedFile)
+            return cached_file.read()
+
+    def test_lru(self):
+        """The least recently used entries are evicted."""
+        self.cache.put('a', 'etag-a', io.BytesIO(b'aaaa'))
+        self.cache.put('b', 'etag-b', io.BytesIO(b'bbbb'))
+        self.assertEqual(self._read('a'), b'aaaa')
+        self.cache.put('c', 'etag-c', io.BytesIO(b'cccc'))
+
+        self.assertIsNone(self._read('b'))
+        self.assertEqual(self._read('a'), b'aaaa')
+        self.assertEqual(self._read('c'), b'cccc')
+        self.assertEqual(self.cache.size, 8)
+        self.assertEqual(len(os.listdir(self.cache.path)), 2)
+
+    def test_too_large(self):
+        """The file larger than the cache isn't cached."""
+        self.cache.put('a', 'etag-a', io.BytesIO(b'a' * 11))
+        self.assertIsNone(self._read('a'))
+        self.assertEqual(os.listdir(self.cache.path), [])
+
+    def test_new_version(self):
+        """The new version replaces the old one, the opened old file can
+        still be read.
+        """
+        self.cache.put('a', 'etag-1', io.BytesIO(b'old'))
+        old_file = self.cache.open('a')
+        self.addCleanup(old_file.close)
+        self.cache.put('a', 'etag-2', io.BytesIO(b'new'))
+
+        self.assertEqual(self.cache.get_etag('a'), 'etag-2')
+        self.assertEqual(self._read('a'), b'new')
+        self.assertEqual(old_file.read(), b'old')
+        self.assertEqual(self.cache.size, 3)
+
+    def test_invalidate(self):
+        """The entries with the prefix are removed."""
+        self.cache.put('live/a', 'etag', io.BytesIO(b'a'))
+        self.cache.put('live/b', 'etag', io.BytesIO(b'b'))
+        self.cache.put('release/a', 'etag', io.BytesIO(b'c'))
+        self.cache.invalidate('live/')
+
+        self.assertEqual([self._read(key) for key in ['live/a', 'live/b', 'release/a']],
+                         [None, None, b'c'])
+        self.assertEqual(self.cache.size, 1)
+
+    def test_fresh(self):
+        """The entry is fresh during the TTL after the check."""
+        self.cache.put('a', 'etag', io.BytesIO(b'a'))
+        self.assertTrue(self.cache.is_fresh('a'))
+        self.assertFalse(self.cache.is_fresh('b'))
+
+        self.cache.ttl = 0
+        self.assertFalse(self.cache.is_fresh('a'))
+        self.cache.ttl = 60
+        entry = self.cache.entries['a']
+        self.cache.entries['a'] = entry._replace(Checked=time.time() - 120)
+        self.assertFalse(self.cache.is_fresh('a'))
+        self.cache.touch('a')
+        self.assertTrue(self.cache.is_fresh('a'))
+
+
+class ModelFileCacheTest(unittest.TestCase):
+    """The metainformation files are revalidated by the ETag."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name, metadata_cache={
+            'path': os.path.join(self.tmp_dir.name, 'cache')})
+        # Each request revalidates the cached file.
+        self.model.file_cache.ttl = 0
+
+    def _get_file(self, path):
+        """Returns the data of the file got through the model."""
+        with self.model.get_file(path) as file:
+            return file.read()
+
+    def test_revalidation(self):
+        """The changed object is fetched again, the unchanged one is
+        served from the cache.
+        """
+        put_object(self.model.storage, REPOMD_KEY, b'<repomd>1</repomd>')
+        self.assertEqual(self._get_file(REPOMD_KEY), b'<repomd>1</repomd>')
+        etag = self.model.file_cache.get_etag(REPOMD_KEY)
+        self.assertEqual(etag, self.model.storage.head_object(REPOMD_KEY)['ETag'])
+
+        self.assertEqual(self._get_file(REPOMD_KEY), b'<repomd>1</repomd>')
+        self.assertEqual(self.model.file_cache.get_etag(REPOMD_KEY), etag)
+
+        put_object(self.model.storage, REPOMD_KEY, b'<repomd>22</repomd>')
+        self.assertEqual(self._get_file(REPOMD_KEY), b'<repomd>22</repomd>')
+        self.assertNotEqual(self.model.file_cache.get_etag(REPOMD_KEY), etag)
+
+    def test_packages_not_cached(self):
+        """Only the metainformation files are cached."""
+        key = 'live/3/el/9/x86_64/Packages/tarantool-3.0.0-1.el9.x86_64.rpm'
+        put_object(self.model.storage, key, b'rpm')
+        with self.model.get_file(key) as file:
+            self.assertNotIsInstance(file, CachedFile)
+        self.assertIsNone(self.model.file_cache.get_etag(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests of the tracking of the most requested files and directories."""
+
+import os
+import tempfile
+from threading import Thread
+import unittest
+
+from s3repo.popularity import PopularityTracker
+
+
+class PopularityTrackerTest(unittest.TestCase):
+    """Top of the requested paths."""
+
+    def test_buffered_requests_are_counted(self):
+        """The requests are in the top before the batch is full."""
+        tracker = PopularityTracker({'batch_size': 256})
+        for _ in range(3):
+            tracker.record('file', 'live/3/el/9/x86_64/repodata/repomd.xml')
+        tracker.record('file', 'live/3/el/9/x86_64/Packages/a.rpm')
+
+        self.assertEqual(tracker.get_top('file'), [
+            ['live/3/el/9/x86_64/repodata/repomd.xml', 3],
+            ['live/3/el/9/x86_64/Packages/a.rpm', 1],
+        ])
+        self.assertEqual(tracker.get_top('prefix', 1), [['live/', 4]])
+
+    def test_finished_threads(self):
+        """The requests of the finished threads aren't lost."""
+        tracker = PopularityTracker({'batch_size': 256})
+        threads = [Thread(target=tracker.record, args=('directory', 'live/3/ubuntu'))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(tracker.get_top('directory'), [['live/3/ubuntu', 5]])
+        self.assertEqual(tracker.thread_buffers, [])
+
+    def test_heavy_hitters(self):
+        """The one-off requests don't push the hot paths out of the top."""
+        tracker = PopularityTracker({'top_k': 1, 'batch_size': 1})
+        for _ in range(10):
+            tracker.record('file', 'hot')
+        for index in range(100):
+            tracker.record('file', 'cold-{0}'.format(index))
+
+        self.assertEqual(tracker.get_top('file', 1), [['hot', 10]])
+
+    def test_snapshot(self):
+        """The top is restored from the snapshot and decays."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_path = os.path.join(tmp_dir, 'popularity.json')
+            tracker = PopularityTracker({'snapshot_path': snapshot_path})
+            for _ in range(4):
+                tracker.record('file', 'live/a.deb')
+            tracker.flush()
+            tracker._save_snapshot()
+
+            restored_tracker = PopularityTracker({'snapshot_path': snapshot_path})
+            self.assertEqual(restored_tracker.get_top('file'), [['live/a.deb', 4]])
+            restored_tracker.decay()
+            self.assertEqual(restored_tracker.get_top('file'), [['live/a.deb', 2]])
+
+    def test_sample_rate(self):
+        """The explicit zero sample rate disables the counting, the rate
+        out of [0, 1] is rejected.
+        """
+        tracker = PopularityTracker({'sample_rate': 0})
+        tracker.record('file', 'live/a.deb')
+        self.assertEqual(tracker.get_top('file'), [])
+
+        with self.assertRaises(RuntimeError):
+            PopularityTracker({'sample_rate': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests of the promotion of the packages to the repository of another
+kind.
+"""
+
+import tempfile
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import list_keys
+from repo_helpers import put_object
+from repo_helpers import read_object
+from repo_helpers import wait_sync
+from s3repo.model import S3ModelRequestError
+from s3repo.repoinfo import RepoAnnotation
+
+
+RPM_DIR = 'live/3/el/9/x86_64/Packages/'
+DEB_DIR = 'live/3/ubuntu/pool/jammy/main/t/tarantool/'
+
+
+class PromoteTest(unittest.TestCase):
+    """The matching packages are copied and their repositories are
+    synchronized.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name)
+        # The synchronized repositories are only recorded.
+        self.synced = []
+        self.model._sync_repo = self._sync_repo
+
+        for key in [RPM_DIR + 'tarantool-3.0.0-1.el9.x86_64.rpm',
+                    RPM_DIR + 'tarantool-devel-3.0.0-1.el9.x86_64.rpm',
+                    DEB_DIR + 'tarantool_3.0.0-1_amd64.deb',
+                    'live/3/ubuntu/pool/focal/main/t/tarantool/tarantool_3.0.0-1_amd64.deb']:
+            put_object(self.model.storage, key, key.encode('utf-8'))
+
+    def _sync_repo(self, sync_repo):
+        self.synced.append((sync_repo.path, sync_repo.codenames))
+        return 0
+
+    def _promote(self, path, patterns, dry_run=False):
+        """Promote the packages of the "live" repository to the "release"
+        one.
+        """
+        return self.model.promote_packages(RepoAnnotation(path, self.model.repo_index),
+                                           'release', patterns, dry_run)
+
+    def test_dry_run(self):
+        """The dry run only returns the copies."""
+        self.assertEqual(self._promote('live/3/el/9', ['tarantool-3*'], dry_run=True), [
+            (RPM_DIR + 'tarantool-3.0.0-1.el9.x86_64.rpm',
+             'release/3/el/9/x86_64/Packages/tarantool-3.0.0-1.el9.x86_64.rpm'),
+        ])
+        self.assertEqual(list_keys(self.model.storage, 'release/'), [])
+
+    def test_promote_rpm(self):
+        """The matching rpm packages are copied with the metadata."""
+        self._promote('live/3/el/9', ['tarantool-3*'])
+        wait_sync(self.model)
+
+        target_key = 'release/3/el/9/x86_64/Packages/tarantool-3.0.0-1.el9.x86_64.rpm'
+        self.assertEqual(list_keys(self.model.storage, 'release/'), [target_key])
+        self.assertEqual(read_object(self.model.storage, target_key),
+                         (RPM_DIR + 'tarantool-3.0.0-1.el9.x86_64.rpm').encode('utf-8'))
+        self.assertEqual(self.model.storage.head_object(target_key)['Metadata'],
+                         self.model.storage.head_object(
+                             RPM_DIR + 'tarantool-3.0.0-1.el9.x86_64.rpm')['Metadata'])
+        self.assertEqual(self.synced, [('release/3/el/9/x86_64/', None)])
+        history = self.model.get_sync_status('release/')['history']
+        self.assertEqual(history['release/3/el/9/x86_64/'][0]['trigger'], 'promote')
+
+    def test_promote_deb(self):
+        """Only the packages of the codename are copied and only its
+        metainformation is synchronized.
+        """
+        self._promote('live/3/ubuntu/jammy', ['*.deb'])
+        wait_sync(self.model)
+
+        self.assertEqual(list_keys(self.model.storage, 'release/'), [
+            'release/3/ubuntu/pool/jammy/main/t/tarantool/tarantool_3.0.0-1_amd64.deb'])
+        self.assertEqual(self.synced, [('release/3/ubuntu/', frozenset(['jammy']))])
+
+    def test_errors(self):
+        """The promotion without the matching packages or to the same
+        repository is rejected.
+        """
+        with self.assertRaises(S3ModelRequestError):
+            self._promote('live/3/el/9', ['small-*'])
+        with self.assertRaises(S3ModelRequestError):
+            self.model.promote_packages(RepoAnnotation('live/3/el/9', self.model.repo_index),
+                                        'live', ['*'])
+        with self.assertRaises(S3ModelRequestError):
+            self.model.promote_packages(RepoAnnotation('live/3/el/9', self.model.repo_index),
+                                        'nightly', ['*'])
+        self.assertEqual(list_keys(self.model.storage, 'release/'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
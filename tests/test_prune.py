@@ -0,0 +1,91 @@
+"""Tests of the retention policy of the old builds of the packages."""
+
+import os
+import tempfile
+import time
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import list_keys
+from repo_helpers import put_object
+from repo_helpers import wait_sync
+
+
+RPM_DIR = 'live/3/el/9/x86_64/Packages/'
+DEB_DIR = 'live/3/ubuntu/pool/jammy/main/t/tarantool/'
+
+
+class PruneTest(unittest.TestCase):
+    """Only the last builds of each package are kept."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name,
+                                  retention={'live': {'keep_last': 1}})
+        # The synchronized repositories are only recorded.
+        self.synced = []
+        self.model._sync_repo = self._sync_repo
+
+        # The builds are ordered by the modification time of their files.
+        now = time.time()
+        self._put(RPM_DIR + 'tarantool-3.0.0-1.el9.x86_64.rpm', now - 300)
+        self._put(RPM_DIR + 'tarantool-3.0.1-1.el9.x86_64.rpm', now - 200)
+        self._put(RPM_DIR + 'tarantool-devel-3.0.0-1.el9.x86_64.rpm', now - 300)
+        self._put(DEB_DIR + 'tarantool_3.0.0-1_amd64.deb', now - 300)
+        # The newer "orig" tarball makes the whole 3.0.0 build the last one.
+        self._put(DEB_DIR + 'tarantool_3.0.0.orig.tar.xz', now - 100)
+        self._put(DEB_DIR + 'tarantool_3.0.1-1_amd64.deb', now - 200)
+        self._put('release/3/el/9/x86_64/Packages/tarantool-3.0.0-1.el9.x86_64.rpm',
+                  now - 300)
+        self._put('release/3/el/9/x86_64/Packages/tarantool-3.0.1-1.el9.x86_64.rpm',
+                  now - 200)
+
+    def _sync_repo(self, sync_repo):
+        self.synced.append(sync_repo.path)
+        return 0
+
+    def _put(self, key, mtime):
+        """Put the package file modified at the "mtime"."""
+        put_object(self.model.storage, key, b'package')
+        os.utime(self.model.storage._get_path(key), (mtime, mtime))
+
+    def test_dry_run(self):
+        """The dry run only returns the files to delete."""
+        keys = list_keys(self.model.storage)
+        self.assertEqual(self.model.prune_repos(dry_run=True), {
+            'live/3/el/9/x86_64/': [RPM_DIR + 'tarantool-3.0.0-1.el9.x86_64.rpm'],
+            'live/3/ubuntu/': [DEB_DIR + 'tarantool_3.0.1-1_amd64.deb'],
+        })
+        self.assertEqual(list_keys(self.model.storage), keys)
+
+    def test_prune(self):
+        """The old builds are deleted and their repositories are
+        synchronized once.
+        """
+        result = self.model.prune_repos('live')
+        self.assertEqual(sorted(result), ['live/3/el/9/x86_64/', 'live/3/ubuntu/'])
+        wait_sync(self.model)
+
+        self.assertEqual(list_keys(self.model.storage, 'live/'), [
+            RPM_DIR + 'tarantool-3.0.1-1.el9.x86_64.rpm',
+            RPM_DIR + 'tarantool-devel-3.0.0-1.el9.x86_64.rpm',
+            DEB_DIR + 'tarantool_3.0.0-1_amd64.deb',
+            DEB_DIR + 'tarantool_3.0.0.orig.tar.xz',
+        ])
+        # The repositories without the retention policy are untouched.
+        self.assertEqual(len(list_keys(self.model.storage, 'release/')), 2)
+        self.assertEqual(sorted(self.synced), ['live/3/el/9/x86_64/', 'live/3/ubuntu/'])
+        history = self.model.get_sync_status('live/')['history']
+        self.assertEqual({repo: [job['trigger'] for job in jobs]
+                          for repo, jobs in history.items()},
+                         {'live/3/el/9/x86_64/': ['prune'], 'live/3/ubuntu/': ['prune']})
+
+    def test_nothing_to_prune(self):
+        """Nothing is deleted for the repo kind without the policy."""
+        self.assertEqual(self.model.prune_repos('release'), {})
+        self.assertEqual(self.synced, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
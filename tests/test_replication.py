@@ -0,0 +1,219 @@
+"""Tests of the replication of the repositories to the mirror storages.
+
+The source and the mirror are "local" storages in temporary directories.
+"""
+
+import io
+from multiprocessing.pool import ThreadPool
+import os
+import tempfile
+import time
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import list_keys
+from repo_helpers import make_deb
+from repo_helpers import read_object
+from repo_helpers import wait_sync
+from s3repo.package import Package
+from s3repo.replication import Replicator
+from s3repo.repoinfo import RepoAnnotation
+from s3repo.storage import LocalStorage
+
+
+class ReplicationTest(unittest.TestCase):
+    """Replication and reconciliation of the mirror."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.source = LocalStorage({'storage': {'path': os.path.join(self.tmp_dir.name, 'src')}})
+        self.mirror = LocalStorage({'storage': {'path': os.path.join(self.tmp_dir.name, 'dst')}})
+        self.checkpoint_path = os.path.join(self.tmp_dir.name, 'checkpoint.json')
+        self.pool = ThreadPool(processes=2)
+        self.addCleanup(self.pool.terminate)
+
+        # The uploads to the mirror are recorded to check what is copied.
+        self.copied = []
+        put_object = self.mirror.put_object
+
+        def recording_put_object(key, fileobj, digests):
+            self.copied.append(key)
+            put_object(key, fileobj, digests)
+
+        self.mirror.put_object = recording_put_object
+
+    def _put(self, storage, key, data):
+        """Put the object with the data to the storage."""
+        fileobj = io.BytesIO(data)
+        storage.put_object(key, fileobj, storage.compute_digests(fileobj))
+
+    def _read(self, storage, key):
+        """Returns the data of the object."""
+        body = storage.get_object(key)['Body']
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def _keys(self, storage):
+        """Returns the sorted keys of all objects of the storage."""
+        return sorted(file_meta['Key'] for objects in storage.iter_objects('')
+                      for file_meta in objects.get('Contents') or [])
+
+    def _create_replicator(self):
+        """Create the replicator with the checkpoint file. The background
+        thread isn't used by the tests, the batches and the reconciliation
+        are processed explicitly.
+        """
+        # Only the copies made by the replicator are checked.
+        self.copied.clear()
+        return Replicator(self.source, [self.mirror],
+                          {'workers': 2, 'checkpoint_path': self.checkpoint_path})
+
+    def test_replicate_batch(self):
+        """The uploaded files and the metainformation of the synchronized
+        repository are copied, the deleted files and the metainformation
+        removed from the source are deleted from the mirror.
+        """
+        self._put(self.source, 'live/3/el/9/x86_64/Packages/a.rpm', b'a')
+        self._put(self.source, 'live/3/el/9/x86_64/repodata/repomd.xml', b'repomd')
+        self._put(self.source, 'live/3/el/9/x86_64/repodata/primary.xml.gz', b'primary')
+        self._put(self.mirror, 'live/3/el/9/x86_64/Packages/old.rpm', b'old')
+        self._put(self.mirror, 'live/3/el/9/x86_64/repodata/stale.xml.gz', b'stale')
+        replicator = self._create_replicator()
+
+        replicator.add_objects(['live/3/el/9/x86_64/Packages/a.rpm'])
+        replicator.delete_objects('live/3/el/9/x86_64/',
+                                  ['live/3/el/9/x86_64/Packages/old.rpm'])
+        replicator.add_repo_metadata('live/3/el/9/x86_64/')
+        replicator._process_pending(self.pool)
+
+        self.assertEqual(self._keys(self.mirror), self._keys(self.source))
+        # The index file of the metainformation is copied last.
+        self.assertEqual(self.copied[0], 'live/3/el/9/x86_64/Packages/a.rpm')
+        self.assertEqual(self.copied[-1], 'live/3/el/9/x86_64/repodata/repomd.xml')
+
+    def test_reconcile(self):
+        """The reconciliation copies the missed and changed objects and
+        deletes the objects absent in the source.
+        """
+        self._put(self.source, 'release/3/el/9/x86_64/Packages/a.rpm', b'a')
+        self._put(self.source, 'release/3/el/9/x86_64/Packages/b.rpm', b'b')
+        self._put(self.mirror, 'release/3/el/9/x86_64/Packages/b.rpm', b'old b')
+        self._put(self.mirror, 'release/3/el/9/x86_64/Packages/c.rpm', b'c')
+        replicator = self._create_replicator()
+
+        replicator.reconcile(self.pool)
+
+        self.assertEqual(self._keys(self.mirror), self._keys(self.source))
+        self.assertEqual(self._read(self.mirror, 'release/3/el/9/x86_64/Packages/b.rpm'), b'b')
+        self.assertEqual(sorted(self.copied), ['release/3/el/9/x86_64/Packages/a.rpm',
+                                               'release/3/el/9/x86_64/Packages/b.rpm'])
+
+    def test_reconcile_from_checkpoint(self):
+        """The replicator restarted from the checkpoint copies only the
+        objects changed since the previous reconciliation.
+        """
+        self._put(self.source, 'release/3/el/9/x86_64/Packages/a.rpm', b'a')
+        self._put(self.source, 'release/3/el/9/x86_64/Packages/b.rpm', b'b')
+        self._put(self.source, 'release/3/el/9/x86_64/Packages/c.rpm', b'c')
+        replicator = self._create_replicator()
+        replicator.reconcile(self.pool)
+        replicator._save_checkpoint()
+        self.assertEqual(len(self.copied), 3)
+
+        self.copied.clear()
+        self._put(self.source, 'release/3/el/9/x86_64/Packages/b.rpm', b'new b')
+        self.source.delete_objects(['release/3/el/9/x86_64/Packages/a.rpm'])
+        restarted_replicator = self._create_replicator()
+        restarted_replicator.reconcile(self.pool)
+
+        self.assertEqual(self.copied, ['release/3/el/9/x86_64/Packages/b.rpm'])
+        # The ETags of the mirror objects differ from the source ones, the
+        # unchanged "c.rpm" is known to be replicated from the checkpoint.
+        self.assertEqual(self._keys(self.mirror), ['release/3/el/9/x86_64/Packages/b.rpm',
+                                                   'release/3/el/9/x86_64/Packages/c.rpm'])
+        self.assertEqual(self._read(self.mirror, 'release/3/el/9/x86_64/Packages/b.rpm'),
+                         b'new b')
+
+        # Nothing is copied if nothing has been changed.
+        self.copied.clear()
+        restarted_replicator.reconcile(self.pool)
+        self.assertEqual(self.copied, [])
+
+
+class DebDeleteReplicationTest(unittest.TestCase):
+    """The metainformation of the mirror doesn't refer to the deleted deb
+    files (the source indexes are rebuilt without them, see "debscope").
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        mirror_path = os.path.join(self.tmp_dir.name, 'mirror')
+        self.model = create_model(self.tmp_dir.name, replication={
+            'mirrors': [{'storage': {'backend': 'local', 'path': mirror_path}}],
+            'workers': 2,
+        })
+        self.mirror = self.model.replicator.mirrors[0]
+
+    def _create_package(self, filenames):
+        """Returns the package of the "live/3/ubuntu/jammy" repository."""
+        package = Package()
+        package.product = 'tarantool'
+        package.repo_annotations = [RepoAnnotation('live/3/ubuntu/jammy',
+                                                   self.model.repo_index)]
+        for filename in filenames:
+            package.add_file(filename, None)
+
+        return package
+
+    def _wait_mirror(self, expected_keys, timeout=30):
+        """Wait until the mirror has the same pool files as the source."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if list_keys(self.mirror, 'live/3/ubuntu/pool/') == expected_keys:
+                return
+            time.sleep(0.2)
+
+        self.fail('The mirror has not been updated: {0}'.format(
+            list_keys(self.mirror, 'live/3/ubuntu/pool/')))
+
+    def _get_mirror_index(self):
+        """Returns the "Filename" fields of the "Packages" index of
+        the mirror.
+        """
+        packages = read_object(
+            self.mirror, 'live/3/ubuntu/dists/jammy/main/binary-amd64/Packages')
+        return sorted('live/3/ubuntu/' + line.split(': ', 1)[1]
+                      for line in packages.decode('utf-8').splitlines()
+                      if line.startswith('Filename: '))
+
+    def test_delete_deb(self):
+        """The deleted deb file is removed from the mirror together with
+        its index entry.
+        """
+        debs = [make_deb(self.tmp_dir.name, 'tarantool', '3.0.0-1'),
+                make_deb(self.tmp_dir.name, 'tarantool', '3.0.1-1')]
+        package = self._create_package([])
+        deb_files = [open(deb, 'rb') for deb in debs]
+        for deb, deb_file in zip(debs, deb_files):
+            self.addCleanup(deb_file.close)
+            package.add_file(os.path.basename(deb), deb_file)
+        self.model.put_package(package)
+        wait_sync(self.model)
+        keys = list_keys(self.model.storage, 'live/3/ubuntu/pool/')
+        self._wait_mirror(keys)
+
+        self.model.delete_package(self._create_package(['tarantool_3.0.0-1_amd64.deb']))
+        wait_sync(self.model)
+        self._wait_mirror(keys[1:])
+
+        # The index is replicated before the deletion, so the mirror
+        # index is already up-to-date.
+        self.assertEqual(self._get_mirror_index(), keys[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Tests of the index of the supported repositories and of the description
+of the synchronized repositories.
+"""
+
+import unittest
+
+from repo_helpers import SUPPORTED_REPOS
+from s3repo.repoindex import RepoIndex
+from s3repo.repoinfo import RepoAnnotation
+from s3repo.repoinfo import RepoInfo
+
+
+class RepoIndexTest(unittest.TestCase):
+    """Validation of the paths, anchors and patterns."""
+
+    def setUp(self):
+        self.repo_index = RepoIndex(SUPPORTED_REPOS, {
+            'ubuntu-all': ['ubuntu/focal', 'ubuntu/jammy'],
+            'kinds': ['/live/', 'release'],
+        })
+
+    def test_check_path(self):
+        """Only the supported distributions are accepted."""
+        self.repo_index.check_path(['live', '3', 'el', '9'])
+        for path in ['live/3/el', 'nightly/3/el/9', 'live/2/el/9',
+                     'live/3/fedora/9', 'live/3/el/8', 'live/3/el/9/x86_64']:
+            with self.subTest(path=path):
+                with self.assertRaises(RuntimeError):
+                    self.repo_index.check_path(path.split('/'))
+
+    def test_dist_base(self):
+        """The base of the distribution is known, the unknown base is
+        rejected.
+        """
+        self.assertEqual(self.repo_index.get_dist_base('ubuntu'), 'deb')
+        self.assertEqual(self.repo_index.get_dist_base('el'), 'rpm')
+        with self.assertRaises(RuntimeError):
+            self.repo_index.get_dist_base('fedora')
+        with self.assertRaises(RuntimeError):
+            RepoIndex({'repo_kind': ['live'], 'tarantool_series': ['3'],
+                       'distrs': {'arch': {'base': 'pkg', 'versions': ['1']}}}, {})
+
+    def test_expand_anchors(self):
+        """The anchors are substituted by all their targets."""
+        self.assertEqual(self.repo_index.expand_anchors('live/3/el/9'), ['live/3/el/9'])
+        self.assertEqual(self.repo_index.expand_anchors('kinds/3/ubuntu-all'), [
+            'live/3/ubuntu/focal', 'live/3/ubuntu/jammy',
+            'release/3/ubuntu/focal', 'release/3/ubuntu/jammy',
+        ])
+        annotations = [RepoAnnotation(path, self.repo_index)
+                       for path in self.repo_index.expand_anchors('live/3/ubuntu-all')]
+        self.assertEqual([str(annotation) for annotation in annotations],
+                         ['live/3/ubuntu/focal', 'live/3/ubuntu/jammy'])
+
+    def test_match_pattern(self):
+        """The patterns are matched in the order of the configuration."""
+        self.assertEqual(self.repo_index.match_pattern('*/3/ubuntu/j*'), [
+            ('live', '3', 'ubuntu', 'jammy'), ('release', '3', 'ubuntu', 'jammy'),
+        ])
+        self.assertEqual(self.repo_index.match_pattern('/release/*/el/?/'),
+                         [('release', '3', 'el', '9')])
+        self.assertEqual(self.repo_index.match_pattern('live/3/debian/*'), [])
+        with self.assertRaises(RuntimeError):
+            self.repo_index.match_pattern('live/3/*')
+
+
+class RepoInfoTest(unittest.TestCase):
+    """Merging of the synchronization jobs of the same repository."""
+
+    def test_path(self):
+        """The path always ends with "/"."""
+        self.assertEqual(RepoInfo('live/3/ubuntu').path, 'live/3/ubuntu/')
+        self.assertEqual(RepoInfo('live/3/ubuntu/'), RepoInfo('live/3/ubuntu'))
+        self.assertEqual(len({RepoInfo('live/3/ubuntu/'), RepoInfo('live/3/ubuntu')}), 1)
+
+    def test_merge(self):
+        """The codenames are joined, any job of all the codenames makes
+        the merged job update all of them.
+        """
+        focal = RepoInfo('live/3/ubuntu', 'old-key', ['focal'])
+        jammy = RepoInfo('live/3/ubuntu', '', ['jammy'])
+        merged = focal.merge(jammy)
+        self.assertEqual(merged.codenames, frozenset(['focal', 'jammy']))
+        self.assertEqual(merged.sign_key, 'old-key')
+        self.assertIsNone(focal.merge(RepoInfo('live/3/ubuntu', 'new-key')).codenames)
+        self.assertEqual(focal.merge(RepoInfo('live/3/ubuntu', 'new-key')).sign_key,
+                         'new-key')
+
+    def test_covers(self):
+        """The update of more codenames covers the update of less ones."""
+        focal = RepoInfo('live/3/ubuntu', codenames=['focal'])
+        both = RepoInfo('live/3/ubuntu', codenames=['focal', 'jammy'])
+        all_codenames = RepoInfo('live/3/ubuntu')
+
+        self.assertTrue(both.covers(focal))
+        self.assertFalse(focal.covers(both))
+        self.assertTrue(all_codenames.covers(both))
+        self.assertFalse(both.covers(all_codenames))
+        self.assertTrue(all_codenames.covers(all_codenames))
+
+
+if __name__ == '__main__':
+    unittest.main()
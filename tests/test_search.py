@@ -0,0 +1,112 @@
+"""Tests of the search index of the packages."""
+
+import tempfile
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import put_object
+from s3repo.searchindex import PackageSearchIndex
+from s3repo.searchindex import version_key
+
+
+RPM_KEYS = [
+    'repos/live/3/el/9/x86_64/Packages/tarantool-3.0.10-1.el9.x86_64.rpm',
+    'repos/live/3/el/9/x86_64/Packages/tarantool-3.0.9-1.el9.x86_64.rpm',
+    'repos/live/3/el/9/x86_64/Packages/tarantool-devel-3.0.9-1.el9.x86_64.rpm',
+    'repos/live/3/el/9/SRPMS/Packages/tarantool-3.0.9-1.el9.src.rpm',
+]
+DEB_KEYS = [
+    'repos/live/3/ubuntu/pool/jammy/main/t/tarantool/tarantool_3.1.0-1_amd64.deb',
+    'repos/live/3/ubuntu/pool/jammy/main/t/tarantool/tarantool_3.1.0-1.dsc',
+]
+
+
+class PackageSearchIndexTest(unittest.TestCase):
+    """Search by the name prefix and the version range."""
+
+    def setUp(self):
+        self.index = PackageSearchIndex('/repos/')
+        self.index.add(RPM_KEYS + DEB_KEYS + [
+            # Not package files.
+            'repos/live/3/el/9/x86_64/repodata/repomd.xml',
+            'other/live/3/el/9/x86_64/Packages/tarantool-3.0.0-1.el9.x86_64.rpm',
+        ])
+
+    def _search(self, *args, **kwargs):
+        """Returns the keys of the found package files."""
+        return [entry.key for entry in self.index.search(*args, **kwargs)]
+
+    def test_version_key(self):
+        """The numeric components are compared as numbers."""
+        self.assertLess(version_key('3.0.9-1.el9'), version_key('3.0.10-1.el9'))
+        self.assertLess(version_key('3.0.0-rc1'), version_key('3.0.0-1'))
+        self.assertEqual(version_key('2.10.0-1.el7'),
+                         ((1, 2), (1, 10), (1, 0), (1, 1), (0, 'el'), (1, 7)))
+
+    def test_parse_key(self):
+        """The key is parsed into the description of the package file."""
+        entry = self.index.parse_key(DEB_KEYS[0])
+        self.assertEqual((entry.name, entry.version, entry.arch, entry.dist,
+                          entry.dist_version, entry.repo),
+                         ('tarantool', '3.1.0', 'amd64', 'ubuntu', 'jammy',
+                          'repos/live/3/ubuntu/'))
+        self.assertEqual(self.index.parse_key(DEB_KEYS[1]).arch, 'source')
+        self.assertEqual(self.index.parse_key(RPM_KEYS[3]).repo, 'repos/live/3/el/9/SRPMS/')
+        self.assertIsNone(self.index.parse_key('repos/live/3/el/9/x86_64/repodata/repomd.xml'))
+        self.assertEqual(self.index.get_stats()['files'], 6)
+
+    def test_version_range(self):
+        """The versions are in the range [min_version, max_version)."""
+        self.assertEqual(self._search('tarantool', '3.0.9', '3.0.10',
+                                      filters={'arch': 'x86_64'}),
+                         [RPM_KEYS[1], RPM_KEYS[2]])
+        self.assertEqual(self._search('tarantool', min_version='3.0.10'),
+                         [RPM_KEYS[0], DEB_KEYS[1], DEB_KEYS[0]])
+        self.assertEqual(self._search('tarantool-', max_version='4'), [RPM_KEYS[2]])
+        self.assertEqual(self._search('tarantool', '3.0.10', '3.0.10'), [])
+
+    def test_order_and_limit(self):
+        """The result is ordered by the name and the version."""
+        self.assertEqual(self._search('taran', filters={'dist': 'el'}, limit=3),
+                         [RPM_KEYS[3], RPM_KEYS[1], RPM_KEYS[0]])
+        self.assertEqual(self._search('small'), [])
+
+    def test_update(self):
+        """The removed and replaced package files aren't found."""
+        self.index.remove([RPM_KEYS[2]])
+        self.assertEqual(self._search('tarantool-'), [])
+        self.assertEqual(self.index.names, ['tarantool'])
+
+        self.index.replace_repo('repos/live/3/el/9/x86_64/', [
+            'repos/live/3/el/9/x86_64/Packages/tarantool-3.0.11-1.el9.x86_64.rpm',
+            # The file of another repository is ignored.
+            'repos/live/3/el/9/aarch64/Packages/tarantool-3.0.11-1.el9.aarch64.rpm',
+        ])
+        self.assertEqual(self._search('tarantool', filters={'arch': 'x86_64'}), [
+            'repos/live/3/el/9/x86_64/Packages/tarantool-3.0.11-1.el9.x86_64.rpm'])
+        self.assertEqual(self.index.get_stats(),
+                         {'state': 'building', 'packages': 1, 'files': 4, 'repos': 3})
+
+
+class ModelSearchTest(unittest.TestCase):
+    """The search index is built by the listing of the storage."""
+
+    def test_build(self):
+        """The package files of all repositories are indexed."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model = create_model(tmp_dir)
+            for key in [key[len('repos/'):] for key in RPM_KEYS + DEB_KEYS]:
+                put_object(model.storage, key, b'package')
+            model.search_index = PackageSearchIndex()
+            model.build_search_index(threads_num=2)
+
+            entries = model.search_packages('tarantool', '3.0.10',
+                                            filters={'dist_version': 'jammy'})
+            self.assertEqual([(entry.name, entry.version, entry.arch) for entry in entries],
+                             [('tarantool', '3.1.0', 'source'), ('tarantool', '3.1.0', 'amd64')])
+            self.assertEqual(model.search_index.get_stats(),
+                             {'state': 'ready', 'packages': 2, 'files': 6, 'repos': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Tests of the "local" storage backend."""
+
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+from repo_helpers import list_keys
+from repo_helpers import put_object
+from repo_helpers import read_object
+from s3repo.storage import create_storage
+from s3repo.storage import LocalStorage
+from s3repo.storage import StorageIntegrityError
+from s3repo.storage import StorageNoSuchKeyError
+
+
+class LocalStorageTest(unittest.TestCase):
+    """The objects are kept as the files of the directory."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = os.path.join(self.tmp_dir.name, 'storage')
+        self.storage = create_storage({'storage': {'backend': 'local', 'path': self.root}})
+
+    def test_create(self):
+        """The backend is chosen by the settings."""
+        self.assertIsInstance(self.storage, LocalStorage)
+        self.assertEqual(self.storage.uri, 'file://' + self.root)
+        with self.assertRaises(RuntimeError):
+            create_storage({'storage': {'backend': 'local'}})
+        with self.assertRaises(RuntimeError):
+            create_storage({'storage': {'backend': 'ftp'}})
+
+    def test_put_get(self):
+        """The object is stored with its digests in the metadata."""
+        put_object(self.storage, 'live/a.rpm', b'data')
+        self.assertEqual(read_object(self.storage, 'live/a.rpm'), b'data')
+
+        head = self.storage.head_object('live/a.rpm')
+        self.assertEqual(head['ContentLength'], 4)
+        self.assertEqual(head['Metadata'], {'md5': hashlib.md5(b'data').hexdigest(),
+                                            'sha256': hashlib.sha256(b'data').hexdigest()})
+        response = self.storage.get_object('live/a.rpm')
+        response['Body'].close()
+        self.assertEqual(response['ETag'], head['ETag'])
+        self.assertIsNone(self.storage.get_object('live/a.rpm', if_none_match=head['ETag']))
+
+        with self.assertRaises(StorageNoSuchKeyError):
+            self.storage.get_object('live/b.rpm')
+        with self.assertRaises(StorageNoSuchKeyError):
+            self.storage.head_object('live')
+        # The keys can't point outside the storage.
+        with self.assertRaises(StorageNoSuchKeyError):
+            self.storage.get_object('../outside')
+
+    def test_integrity(self):
+        """The object that doesn't match the digests isn't stored."""
+        digests = self.storage.compute_digests(io.BytesIO(b'data'))
+        with self.assertRaises(StorageIntegrityError):
+            self.storage.put_object('live/a.rpm', io.BytesIO(b'atad'), digests)
+        self.assertEqual(list_keys(self.storage), [])
+
+    def test_compute_digests(self):
+        """The ETag of the multipart upload is computed by the parts."""
+        self.storage.part_size = 4
+        self.storage.multipart_threshold = 8
+        digests = self.storage.compute_digests(io.BytesIO(b'12345678'))
+        parts = hashlib.md5(b'1234').digest() + hashlib.md5(b'5678').digest()
+        self.assertEqual(digests['etag'], hashlib.md5(parts).hexdigest() + '-2')
+        self.assertEqual(digests['size'], 8)
+        self.assertEqual(self.storage.compute_digests(io.BytesIO(b'1234'))['etag'],
+                         hashlib.md5(b'1234').hexdigest())
+
+    def test_list(self):
+        """The keys are listed in the lexicographical order, the "/"
+        delimiter groups them.
+        """
+        for key in ['live/3/el/9/a.rpm', 'live/3/el/b.rpm', 'live/3/ubuntu/c.deb',
+                    'live/4/d.rpm', 'release/e.rpm']:
+            put_object(self.storage, key, b'data')
+        # The empty directories and the temporary files aren't objects.
+        os.makedirs(os.path.join(self.root, 'live', '3', 'empty'))
+        open(os.path.join(self.root, 'live', '3', '.rws_tmp'), 'w').close()
+
+        objects = self.storage.list_objects('live/3/', delimiter='/')
+        self.assertEqual(objects['CommonPrefixes'],
+                         [{'Prefix': 'live/3/el/'}, {'Prefix': 'live/3/ubuntu/'}])
+        self.assertNotIn('Contents', objects)
+        self.assertEqual(list_keys(self.storage, 'live/3'), [
+            'live/3/el/9/a.rpm', 'live/3/el/b.rpm', 'live/3/ubuntu/c.deb'])
+        self.assertEqual([file_meta['Key'] for file_meta in
+                          self.storage.list_objects('live/', max_keys=2)['Contents']],
+                         ['live/3/el/9/a.rpm', 'live/3/el/b.rpm'])
+
+    def test_copy_delete(self):
+        """The copy keeps the metadata, the absent objects are deleted
+        silently.
+        """
+        put_object(self.storage, 'live/a.rpm', b'data')
+        self.storage.copy_object('live/a.rpm', 'release/a.rpm')
+        self.assertEqual(read_object(self.storage, 'release/a.rpm'), b'data')
+        self.assertEqual(self.storage.head_object('release/a.rpm')['Metadata'],
+                         self.storage.head_object('live/a.rpm')['Metadata'])
+        with self.assertRaises(StorageNoSuchKeyError):
+            self.storage.copy_object('live/b.rpm', 'release/b.rpm')
+
+        self.storage.delete_objects(['live/a.rpm', 'live/b.rpm'])
+        self.assertEqual(list_keys(self.storage), ['release/a.rpm'])
+        self.assertEqual(self.storage.get_mkrepo_args('release'),
+                         [os.path.join(self.root, 'release')])
+
+
+if __name__ == '__main__':
+    unittest.main()
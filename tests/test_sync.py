@@ -0,0 +1,87 @@
+"""Tests of the synchronization workers of the model."""
+
+import tempfile
+from threading import Event
+import time
+import unittest
+
+from repo_helpers import create_model
+from repo_helpers import wait_sync
+from s3repo.repoinfo import RepoInfo
+
+
+class SyncWorkerTest(unittest.TestCase):
+    """The synchronization workers survive the failed jobs."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name)
+
+    def test_sync_exception(self):
+        """The job raising an exception is recorded as failed and
+        retried by the same worker.
+        """
+        calls = []
+
+        def sync_repo(sync_repo):
+            calls.append(sync_repo.path)
+            if len(calls) == 1:
+                raise OSError("No such file or directory: 'mkrepo'")
+            return 0
+
+        self.model._sync_repo = sync_repo
+        self.model._enqueue_repos([RepoInfo('live/3/el/9/x86_64')], 'upload')
+        wait_sync(self.model)
+
+        self.assertTrue(self.model.sync_thread.is_alive())
+        self.assertEqual(calls, ['live/3/el/9/x86_64/'] * 2)
+        history = self.model.get_sync_status()['history']['live/3/el/9/x86_64/']
+        self.assertEqual([job['exit_code'] for job in history], [-1, 0])
+        self.assertEqual(history[1]['trigger'], 'retry')
+
+
+class PrewarmTest(unittest.TestCase):
+    """The caches are prewarmed in the background after the
+    synchronization.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(self.tmp_dir.name, popularity={'top_k': 10})
+
+    def test_prewarm_in_background(self):
+        """The hanging or failing prewarming doesn't hold the sync worker
+        and doesn't stop the prewarming thread.
+        """
+        prefixes = []
+        release = Event()
+
+        def prewarm(prefix):
+            prefixes.append(prefix)
+            release.wait(10)
+            raise RuntimeError('The storage is unavailable.')
+
+        # Let the prewarming at the start be completed.
+        time.sleep(0.1)
+        self.model.prewarm = prewarm
+        self.model._sync_repo = lambda sync_repo: 0
+        self.model._enqueue_repos([RepoInfo('live/3/el/9/x86_64')], 'upload')
+        wait_sync(self.model)
+        history = self.model.get_sync_status()['history']['live/3/el/9/x86_64/']
+        self.assertEqual([job['exit_code'] for job in history], [0])
+
+        release.set()
+        self.model._enqueue_repos([RepoInfo('live/3/el/9/aarch64')], 'upload')
+        wait_sync(self.model)
+        deadline = time.monotonic() + 10
+        while len(prefixes) < 2 and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        self.assertTrue(self.model.prewarm_thread.is_alive())
+        self.assertEqual(prefixes, ['live/3/el/9/x86_64/', 'live/3/el/9/aarch64/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Tests of the queue of the repositories waiting for the synchronization."""
+
+import unittest
+
+from s3repo.repoinfo import RepoInfo
+from s3repo.syncqueue import SyncQueue
+
+
+class SyncQueueTest(unittest.TestCase):
+    """Priority classes, aging, limits and merging of the jobs."""
+
+    def test_priority(self):
+        """The job of the higher class is taken first."""
+        queue = SyncQueue()
+        queue.put(RepoInfo('live/3/el/9/x86_64'), 'startup')
+        queue.put(RepoInfo('live/3/el/9/aarch64'), 'post')
+        queue.put(RepoInfo('live/3/ubuntu'), 'upload')
+
+        taken = [queue.take() for _ in range(3)]
+        self.assertEqual([job.repo.path for job in taken],
+                         ['live/3/ubuntu/', 'live/3/el/9/aarch64/', 'live/3/el/9/x86_64/'])
+        self.assertEqual([job.sync_class for job in taken], ['upload', 'post', 'bulk'])
+        self.assertIsNone(queue.take())
+
+    def test_aging(self):
+        """The long waiting job of the lower class is taken before the new
+        job of the higher class.
+        """
+        queue = SyncQueue(aging_interval=10)
+        queue.put(RepoInfo('live/3/el/9/x86_64'), 'sweep')
+        queue.put(RepoInfo('live/3/ubuntu'), 'upload')
+        # The bulk job has been waiting for more than two aging intervals.
+        queue.jobs['bulk']['live/3/el/9/x86_64/'].enqueued -= 25
+
+        self.assertEqual(queue.take().repo.path, 'live/3/el/9/x86_64/')
+        self.assertEqual(queue.take().repo.path, 'live/3/ubuntu/')
+
+    def test_class_limits(self):
+        """The number of the running jobs of the class is limited, other
+        classes aren't affected.
+        """
+        queue = SyncQueue({'bulk': 1})
+        queue.put(RepoInfo('live/3/el/9/x86_64'), 'startup')
+        queue.put(RepoInfo('live/3/el/9/aarch64'), 'startup')
+        queue.put(RepoInfo('live/3/ubuntu'), 'post')
+
+        first_job = queue.take()
+        self.assertEqual(first_job.repo.path, 'live/3/ubuntu/')
+        bulk_job = queue.take()
+        self.assertEqual(bulk_job.repo.path, 'live/3/el/9/x86_64/')
+        self.assertIsNone(queue.take())
+        self.assertEqual(queue.get_stats()['bulk'], {'queued': 1, 'in_flight': 1, 'limit': 1})
+
+        queue.done(bulk_job)
+        self.assertEqual(queue.take().repo.path, 'live/3/el/9/aarch64/')
+        self.assertEqual(len(queue), 0)
+
+    def test_merge(self):
+        """The queued repository is merged with the new job and gets the
+        higher class.
+        """
+        queue = SyncQueue()
+        queue.put(RepoInfo('live/3/ubuntu', codenames=['focal']), 'startup')
+        queue.put(RepoInfo('live/3/ubuntu', 'key', codenames=['jammy']), 'upload')
+        self.assertEqual(len(queue), 1)
+
+        job = queue.take()
+        self.assertEqual(job.sync_class, 'upload')
+        self.assertEqual(job.repo.codenames, frozenset(['focal', 'jammy']))
+        self.assertEqual(job.repo.sign_key, 'key')
+
+        # The update of all codenames covers the limited one.
+        queue.put(RepoInfo('live/3/debian', codenames=['bookworm']), 'post')
+        queue.put(RepoInfo('live/3/debian'), 'post')
+        self.assertIsNone(queue.take().repo.codenames)
+
+    def test_in_flight(self):
+        """The repository isn't synchronized by several workers at the same
+        time, the job added during the synchronization waits for it.
+        """
+        queue = SyncQueue()
+        queue.put(RepoInfo('live/3/ubuntu'), 'upload')
+        job = queue.take()
+        queue.put(RepoInfo('live/3/ubuntu'), 'upload')
+        self.assertIsNone(queue.take())
+
+        queue.done(job)
+        self.assertEqual(queue.take().repo.path, 'live/3/ubuntu/')
+
+
+if __name__ == '__main__':
+    unittest.main()
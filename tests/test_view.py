@@ -0,0 +1,54 @@
+"""Tests of the downloading of the files through the view."""
+
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from repo_helpers import create_model
+from repo_helpers import put_object
+from s3repo.view import S3View
+
+
+class DownloadTest(unittest.TestCase):
+    """Only the files of the local disk cache are sent as non-cacheable
+    by the client.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.model = create_model(
+            self.tmp_dir.name, download_mode='proxy',
+            metadata_cache={'path': os.path.join(self.tmp_dir.name, 'cache')})
+
+        app = Flask(__name__)
+        s3_view = S3View.as_view('s3_view', self.model)
+        app.add_url_rule('/<path:subpath>', view_func=s3_view, methods=['GET'])
+        self.client = app.test_client()
+
+    def _get(self, key, data):
+        """Download the object uploaded with the data."""
+        put_object(self.model.storage, key, data)
+        response = self.client.get('/' + key)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), data)
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+
+        return response
+
+    def test_cached_metadata(self):
+        """The cached metainformation file must be revalidated."""
+        response = self._get('live/3/el/9/x86_64/repodata/repomd.xml', b'<repomd/>')
+        self.assertIn('max-age=0', response.headers.get('Cache-Control', ''))
+
+    def test_local_package(self):
+        """The package from the "local" storage is not a cache hit."""
+        response = self._get('live/3/el/9/x86_64/Packages/a.rpm', b'rpm')
+        self.assertNotIn('max-age=0', response.headers.get('Cache-Control', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
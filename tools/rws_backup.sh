@@ -6,6 +6,9 @@ help() {
 	cat <<EOF
 rws_backup.sh - util for working with S3 backups.
 
+DEPRECATED: use the incremental backup command instead:
+	python -m s3repo.backup backup /path/to/backup
+
 Usage:
 	rws_backup.sh COMMAND
 
@@ -69,6 +72,8 @@ prepare_restic_repo() {
 backup() {
 	# Backs up the specified suite / repo / whatever from S3.
 
+	echo "rws_backup.sh is deprecated, use \"python -m s3repo.backup\"." 1>&2
+
 	# Create a mount point for the backed up bucket.
 	S3_MOUNT_POINT=$(mktemp --directory .s3fs_mountpoint_XXXXX)
 	# Set a handler on failure.